@@ -31,6 +31,8 @@ cdef extern from "renpy.h":
     void core_init()
     void subpixel_init()
 
+    void band_parallel_core(int, int)
+
     void save_png_core(object, SDL_RWops *, int)
 
     void pixellate32_core(object, object, int, int, int, int)
@@ -97,6 +99,16 @@ import pygame
 
 PygameSurface = pygame.Surface
 
+def band_parallel(threads, threshold):
+    """
+    Sets the number of threads the 32-bit pixel kernels may split their
+    rows between, and the number of destination pixels a kernel must
+    process before it is split. One thread disables band-parallel
+    execution.
+    """
+
+    band_parallel_core(threads, threshold)
+
 def save_png(surf, file, compress=-1):
 
     if not isinstance(surf, PygameSurface):
@@ -25,6 +25,110 @@ void core_init() {
     import_pygame_sdl2();
 }
 
+/****************************************************************************/
+/* Band-parallel execution.
+ *
+ * The 32-bit kernels below compute each destination row independently of
+ * the others, so they can be split into horizontal bands of rows, with
+ * each band processed by its own thread. Since every row is computed by
+ * the same code, the result is the same as if the kernel ran serially.
+ */
+
+#define MAX_BAND_THREADS 16
+
+// The number of threads (including the calling thread) a kernel may use.
+static int band_threads = 1;
+
+// The number of destination pixels a kernel must process before it is
+// split into bands.
+static int band_threshold = 256 * 256;
+
+// A function that processes rows y0 through y1 (exclusive) of a kernel.
+typedef int (*band_function)(void *args, int y0, int y1);
+
+struct band {
+    band_function function;
+    void *args;
+    int y0;
+    int y1;
+    int result;
+};
+
+static int band_thread(void *data) {
+    struct band *b = (struct band *) data;
+    b->result = b->function(b->args, b->y0, b->y1);
+    return 0;
+}
+
+/* Sets the number of threads and the pixel threshold used for band-parallel
+ * execution. A thread count of 1 or less runs every kernel serially.
+ */
+void band_parallel_core(int threads, int threshold) {
+    if (threads < 1) {
+        threads = 1;
+    }
+
+    if (threads > MAX_BAND_THREADS) {
+        threads = MAX_BAND_THREADS;
+    }
+
+    band_threads = threads;
+    band_threshold = threshold;
+}
+
+/* Runs function over rows 0 through rows (exclusive), splitting the rows
+ * into bands if the kernel is large enough. Must be called with the GIL
+ * released. Returns the sum of the results of the band functions.
+ */
+static int run_bands(band_function function, void *args, int rows, int width) {
+
+    struct band bands[MAX_BAND_THREADS];
+    SDL_Thread *threads[MAX_BAND_THREADS];
+
+    int count = band_threads;
+    int rv;
+    int i;
+
+    if (count > rows) {
+        count = rows;
+    }
+
+    if (count <= 1 || rows * width < band_threshold) {
+        return function(args, 0, rows);
+    }
+
+    for (i = 0; i < count; i++) {
+        bands[i].function = function;
+        bands[i].args = args;
+        bands[i].y0 = rows * i / count;
+        bands[i].y1 = rows * (i + 1) / count;
+        bands[i].result = 0;
+    }
+
+    // The calling thread takes the first band, so start with the second.
+    for (i = 1; i < count; i++) {
+        threads[i] = SDL_CreateThread(band_thread, "renpy band", &bands[i]);
+
+        // If we can't make a thread, process the band here.
+        if (threads[i] == NULL) {
+            band_thread(&bands[i]);
+        }
+    }
+
+    band_thread(&bands[0]);
+    rv = bands[0].result;
+
+    for (i = 1; i < count; i++) {
+        if (threads[i] != NULL) {
+            SDL_WaitThread(threads[i], NULL);
+        }
+
+        rv += bands[i].result;
+    }
+
+    return rv;
+}
+
 void save_png_core(PyObject *pysurf, SDL_RWops *rw, int compress) {
     SDL_Surface *surf;
 
@@ -321,47 +425,37 @@ void pixellate24_core(PyObject *pysrc,
  * byte corresponding to a possible value of a channel in pysrc,
  * giving what that value is mapped to in pydst.
  */
-void map32_core(PyObject *pysrc,
-                PyObject *pydst,
-                char *rmap,
-                char *gmap,
-                char *bmap,
-                char *amap) {
+struct map32_args {
+    char *srcpixels;
+    char *dstpixels;
+    Uint32 srcpitch, dstpitch;
+    Uint32 srcw;
+    char *rmap;
+    char *gmap;
+    char *bmap;
+    char *amap;
+};
 
-    SDL_Surface *src;
-    SDL_Surface *dst;
+static int map32_band(void *p, int y0, int y1) {
+    struct map32_args *args = (struct map32_args *) p;
 
     int x, y;
-    Uint32 srcpitch, dstpitch;
-    Uint32 srcw, srch;
-    Uint32 dstw, dsth;
 
-    char *srcpixels;
-    char *dstpixels;
+    Uint32 srcw = args->srcw;
+    char *rmap = args->rmap;
+    char *gmap = args->gmap;
+    char *bmap = args->bmap;
+    char *amap = args->amap;
 
     char *srcrow;
     char *dstrow;
     char *srcp;
     char *dstp;
 
-    src = PySurface_AsSurface(pysrc);
-    dst = PySurface_AsSurface(pydst);
-
-    Py_BEGIN_ALLOW_THREADS
-
-    srcpixels = (char *) src->pixels;
-    dstpixels = (char *) dst->pixels;
-    srcpitch = src->pitch;
-    dstpitch = dst->pitch;
-    srcw = src->w;
-    dstw = dst->w;
-    srch = src->h;
-    dsth = dst->h;
-
-    srcrow = srcpixels;
-    dstrow = dstpixels;
+    srcrow = args->srcpixels + y0 * args->srcpitch;
+    dstrow = args->dstpixels + y0 * args->dstpitch;
 
-    for (y = 0; y < srch; y++) {
+    for (y = y0; y < y1; y++) {
         srcp = srcrow;
         dstp = dstrow;
 
@@ -373,10 +467,42 @@ void map32_core(PyObject *pysrc,
             *dstp++ = amap[(unsigned char) *srcp++];
         }
 
-        srcrow += srcpitch;
-        dstrow += dstpitch;
+        srcrow += args->srcpitch;
+        dstrow += args->dstpitch;
     }
 
+    return 0;
+}
+
+void map32_core(PyObject *pysrc,
+                PyObject *pydst,
+                char *rmap,
+                char *gmap,
+                char *bmap,
+                char *amap) {
+
+    SDL_Surface *src;
+    SDL_Surface *dst;
+
+    struct map32_args args;
+
+    src = PySurface_AsSurface(pysrc);
+    dst = PySurface_AsSurface(pydst);
+
+    Py_BEGIN_ALLOW_THREADS
+
+    args.srcpixels = (char *) src->pixels;
+    args.dstpixels = (char *) dst->pixels;
+    args.srcpitch = src->pitch;
+    args.dstpitch = dst->pitch;
+    args.srcw = src->w;
+    args.rmap = rmap;
+    args.gmap = gmap;
+    args.bmap = bmap;
+    args.amap = amap;
+
+    run_bands(map32_band, &args, src->h, src->w);
+
     Py_END_ALLOW_THREADS
 }
 
@@ -773,62 +899,34 @@ void alphamunge_core(PyObject *pysrc,
     Py_END_ALLOW_THREADS
 }
 
-void scale32_core(PyObject *pysrc, PyObject *pydst,
-                  float source_xoff, float source_yoff,
-                  float source_width, float source_height,
-                  float dest_xoff, float dest_yoff,
-                  float dest_width, float dest_height,
-                  int precise
-    ) {
-
-
-    SDL_Surface *src;
-    SDL_Surface *dst;
-
-    int y;
-    Uint32 srcpitch, dstpitch;
-    Uint32 srcw, srch;
-    Uint32 dstw, dsth;
-    float xdelta, ydelta;
-
+struct scale32_args {
     unsigned char *srcpixels;
     unsigned char *dstpixels;
+    Uint32 srcpitch, dstpitch;
+    Uint32 dstw;
+    float source_xoff, source_yoff;
+    float dest_xoff, dest_yoff;
+    float xdelta, ydelta;
+};
 
+static int scale32_band(void *p, int y0, int y1) {
+    struct scale32_args *args = (struct scale32_args *) p;
 
-    src = PySurface_AsSurface(pysrc);
-    dst = PySurface_AsSurface(pydst);
-
-    Py_BEGIN_ALLOW_THREADS
-
-    srcpixels = (unsigned char *) src->pixels;
-    dstpixels = (unsigned char *) dst->pixels;
-    srcpitch = src->pitch;
-    dstpitch = dst->pitch;
-    srcw = src->w;
-    dstw = dst->w;
-    srch = src->h;
-    dsth = dst->h;
-
-    if (precise) {
-
-        if (dest_width > 1) {
-            xdelta = 256.0 * (source_width - 1) / (dest_width - 1);
-        } else {
-            xdelta = 0;
-        }
-
-        if (dest_height > 1) {
-            ydelta = 256.0 * (source_height - 1) / (dest_height - 1);
-        } else {
-            ydelta = 0;
-        }
+    int y;
 
-    } else {
-        xdelta = 255.0 * (source_width - 1) / dest_width;
-        ydelta = 255.0 * (source_height - 1) / dest_height;
-    }
+    unsigned char *srcpixels = args->srcpixels;
+    unsigned char *dstpixels = args->dstpixels;
+    Uint32 srcpitch = args->srcpitch;
+    Uint32 dstpitch = args->dstpitch;
+    Uint32 dstw = args->dstw;
+    float source_xoff = args->source_xoff;
+    float source_yoff = args->source_yoff;
+    float dest_xoff = args->dest_xoff;
+    float dest_yoff = args->dest_yoff;
+    float xdelta = args->xdelta;
+    float ydelta = args->ydelta;
 
-    for (y = 0; y < dsth; y++) {
+    for (y = y0; y < y1; y++) {
 
         unsigned char *s0;
         unsigned char *s1;
@@ -884,6 +982,63 @@ void scale32_core(PyObject *pysrc, PyObject *pydst,
         }
     }
 
+    return 0;
+}
+
+void scale32_core(PyObject *pysrc, PyObject *pydst,
+                  float source_xoff, float source_yoff,
+                  float source_width, float source_height,
+                  float dest_xoff, float dest_yoff,
+                  float dest_width, float dest_height,
+                  int precise
+    ) {
+
+
+    SDL_Surface *src;
+    SDL_Surface *dst;
+
+    float xdelta, ydelta;
+
+    struct scale32_args args;
+
+    src = PySurface_AsSurface(pysrc);
+    dst = PySurface_AsSurface(pydst);
+
+    Py_BEGIN_ALLOW_THREADS
+
+    if (precise) {
+
+        if (dest_width > 1) {
+            xdelta = 256.0 * (source_width - 1) / (dest_width - 1);
+        } else {
+            xdelta = 0;
+        }
+
+        if (dest_height > 1) {
+            ydelta = 256.0 * (source_height - 1) / (dest_height - 1);
+        } else {
+            ydelta = 0;
+        }
+
+    } else {
+        xdelta = 255.0 * (source_width - 1) / dest_width;
+        ydelta = 255.0 * (source_height - 1) / dest_height;
+    }
+
+    args.srcpixels = (unsigned char *) src->pixels;
+    args.dstpixels = (unsigned char *) dst->pixels;
+    args.srcpitch = src->pitch;
+    args.dstpitch = dst->pitch;
+    args.dstw = dst->w;
+    args.source_xoff = source_xoff;
+    args.source_yoff = source_yoff;
+    args.dest_xoff = dest_xoff;
+    args.dest_yoff = dest_yoff;
+    args.xdelta = xdelta;
+    args.ydelta = ydelta;
+
+    run_bands(scale32_band, &args, dst->h, dst->w);
+
     Py_END_ALLOW_THREADS
 }
 
@@ -990,75 +1145,46 @@ void scale24_core(PyObject *pysrc, PyObject *pydst,
 /****************************************************************************/
 /* A similar concept to rotozoom, but implemented differently, so we
    can limit the target area. */
-int transform32_std(PyObject *pysrc, PyObject *pydst,
-                    float corner_x, float corner_y,
-                    float xdx, float ydx,
-                    float xdy, float ydy,
-                    int ashift,
-                    float a,
-                    int precise
-    ) {
-
-    SDL_Surface *src;
-    SDL_Surface *dst;
+struct transform32_args {
+    unsigned char *srcpixels;
+    unsigned char *dstpixels;
+    int srcpitch, dstpitch;
+    int dstw;
+    float corner_x, corner_y;
+    float xdx, ydx;
+    float xdy, ydy;
+    int ashift;
+    unsigned int amul;
+    double maxsx, maxsy;
+};
+
+static int transform32_std_band(void *p, int y0, int y1) {
+    struct transform32_args *args = (struct transform32_args *) p;
 
     int y;
-    int srcpitch, dstpitch;
-    int srcw, srch;
-    int dstw, dsth;
+
+    unsigned char *srcpixels = args->srcpixels;
+    unsigned char *dstpixels = args->dstpixels;
+    int srcpitch = args->srcpitch;
+    int dstpitch = args->dstpitch;
+    int dstw = args->dstw;
+    float corner_x = args->corner_x;
+    float corner_y = args->corner_y;
+    float xdx = args->xdx;
+    float ydx = args->ydx;
+    float xdy = args->xdy;
+    float ydy = args->ydy;
+    int ashift = args->ashift;
+    unsigned int amul = args->amul;
+    double maxsx = args->maxsx;
+    double maxsy = args->maxsy;
 
     // The x and y source pixel coordinates, times 65536. And their
     // delta-per-dest-x-pixel.
     int sxi = 0, syi = 0, dsxi = 0, dsyi = 0;
 
-    unsigned char *srcpixels;
-    unsigned char *dstpixels;
-
-    src = PySurface_AsSurface(pysrc);
-    dst = PySurface_AsSurface(pydst);
-
-    Py_BEGIN_ALLOW_THREADS
-
-    srcpixels = (unsigned char *) src->pixels;
-    dstpixels = (unsigned char *) dst->pixels;
-    srcpitch = src->pitch;
-    dstpitch = dst->pitch;
-    srcw = src->w;
-    dstw = dst->w;
-    srch = src->h;
-    dsth = dst->h;
-
-    // Compute the coloring multiplier.
-    unsigned int amul = (unsigned int) (a * 256);
-
-    // Compute the maximum x and y coordinates.
-    double maxsx = srcw;
-    double maxsy = srch;
-
-    // Deal with pre-6.10.1 versions of Ren'Py, which didn't give us
-    // that 1px border that allows us to be precise.
-    if (! precise) {
-        maxsx -= EPSILON;
-        maxsy -= EPSILON;
-
-        // If a delta is too even, subtract epsilon (towards 0) from it.
-        if (xdx && fabs(fmodf(1.0 / xdx, 1)) < EPSILON) {
-            xdx -= (xdx / fabs(xdx)) * EPSILON;
-        }
-        if (xdy && fabs(fmodf(1.0 / xdy, 1)) < EPSILON) {
-            xdy -= (xdy / fabs(xdy)) * EPSILON;
-        }
-        if (ydx && fabs(fmodf(1.0 / ydx, 1)) < EPSILON) {
-            ydx -= (ydx / fabs(ydx)) * EPSILON;
-        }
-        if (ydy && fabs(fmodf(1.0 / ydy, 1)) < EPSILON) {
-            ydy -= (ydy / fabs(ydy)) * EPSILON;
-        }
-    }
-
-
     // Loop through every line.
-    for (y = 0; y < dsth; y++) {
+    for (y = y0; y < y1; y++) {
 
         // The source coordinates of the leftmost pixel in the line.
         double leftsx = corner_x + y * xdy;
@@ -1174,22 +1300,12 @@ int transform32_std(PyObject *pysrc, PyObject *pydst,
 
     }
 
-    Py_END_ALLOW_THREADS;
-
-
     // This is bogus, and only serves to ensure that the FPU
     // computes these variables at the right times.
     return sxi + syi + dsxi + dsyi;
 }
 
-
-
-#ifdef GCC_MMX
-
-/****************************************************************************/
-/* A similar concept to rotozoom, but implemented differently, so we
-   can limit the target area. */
-int transform32_mmx(PyObject *pysrc, PyObject *pydst,
+int transform32_std(PyObject *pysrc, PyObject *pydst,
                     float corner_x, float corner_y,
                     float xdx, float ydx,
                     float xdy, float ydy,
@@ -1201,14 +1317,12 @@ int transform32_mmx(PyObject *pysrc, PyObject *pydst,
     SDL_Surface *src;
     SDL_Surface *dst;
 
-    int y;
     int srcpitch, dstpitch;
     int srcw, srch;
     int dstw, dsth;
 
-    // The x and y source pixel coordinates, times 65536. And their
-    // delta-per-dest-x-pixel.
-    int sxi = 0, syi = 0, dsxi = 0, dsyi = 0;
+    struct transform32_args args;
+    int rv;
 
     unsigned char *srcpixels;
     unsigned char *dstpixels;
@@ -1227,9 +1341,6 @@ int transform32_mmx(PyObject *pysrc, PyObject *pydst,
     srch = src->h;
     dsth = dst->h;
 
-    // Due to mmx.
-    ashift *= 2;
-
     // Compute the coloring multiplier.
     unsigned int amul = (unsigned int) (a * 256);
 
@@ -1258,9 +1369,63 @@ int transform32_mmx(PyObject *pysrc, PyObject *pydst,
         }
     }
 
+    args.srcpixels = srcpixels;
+    args.dstpixels = dstpixels;
+    args.srcpitch = srcpitch;
+    args.dstpitch = dstpitch;
+    args.dstw = dstw;
+    args.corner_x = corner_x;
+    args.corner_y = corner_y;
+    args.xdx = xdx;
+    args.ydx = ydx;
+    args.xdy = xdy;
+    args.ydy = ydy;
+    args.ashift = ashift;
+    args.amul = amul;
+    args.maxsx = maxsx;
+    args.maxsy = maxsy;
+
+    rv = run_bands(transform32_std_band, &args, dsth, dstw);
+
+    Py_END_ALLOW_THREADS;
+
+    return rv;
+}
+
+
+
+#ifdef GCC_MMX
+
+/****************************************************************************/
+/* A similar concept to rotozoom, but implemented differently, so we
+   can limit the target area. */
+static int transform32_mmx_band(void *p, int y0, int y1) {
+    struct transform32_args *args = (struct transform32_args *) p;
+
+    int y;
+
+    unsigned char *srcpixels = args->srcpixels;
+    unsigned char *dstpixels = args->dstpixels;
+    int srcpitch = args->srcpitch;
+    int dstpitch = args->dstpitch;
+    int dstw = args->dstw;
+    float corner_x = args->corner_x;
+    float corner_y = args->corner_y;
+    float xdx = args->xdx;
+    float ydx = args->ydx;
+    float xdy = args->xdy;
+    float ydy = args->ydy;
+    int ashift = args->ashift;
+    unsigned int amul = args->amul;
+    double maxsx = args->maxsx;
+    double maxsy = args->maxsy;
+
+    // The x and y source pixel coordinates, times 65536. And their
+    // delta-per-dest-x-pixel.
+    int sxi = 0, syi = 0, dsxi = 0, dsyi = 0;
 
     // Loop through every line.
-    for (y = 0; y < dsth; y++) {
+    for (y = y0; y < y1; y++) {
 
         // The source coordinates of the leftmost pixel in the line.
         double leftsx = corner_x + y * xdy;
@@ -1424,14 +1589,101 @@ int transform32_mmx(PyObject *pysrc, PyObject *pydst,
         emms();
     }
 
-    Py_END_ALLOW_THREADS;
-
-
     // This is bogus, and only serves to ensure that the FPU
     // computes these variables at the right times.
     return sxi + syi + dsxi + dsyi;
 }
 
+int transform32_mmx(PyObject *pysrc, PyObject *pydst,
+                    float corner_x, float corner_y,
+                    float xdx, float ydx,
+                    float xdy, float ydy,
+                    int ashift,
+                    float a,
+                    int precise
+    ) {
+
+    SDL_Surface *src;
+    SDL_Surface *dst;
+
+    int srcpitch, dstpitch;
+    int srcw, srch;
+    int dstw, dsth;
+
+    struct transform32_args args;
+    int rv;
+
+    unsigned char *srcpixels;
+    unsigned char *dstpixels;
+
+    src = PySurface_AsSurface(pysrc);
+    dst = PySurface_AsSurface(pydst);
+
+    Py_BEGIN_ALLOW_THREADS
+
+    srcpixels = (unsigned char *) src->pixels;
+    dstpixels = (unsigned char *) dst->pixels;
+    srcpitch = src->pitch;
+    dstpitch = dst->pitch;
+    srcw = src->w;
+    dstw = dst->w;
+    srch = src->h;
+    dsth = dst->h;
+
+    // Due to mmx.
+    ashift *= 2;
+
+    // Compute the coloring multiplier.
+    unsigned int amul = (unsigned int) (a * 256);
+
+    // Compute the maximum x and y coordinates.
+    double maxsx = srcw;
+    double maxsy = srch;
+
+    // Deal with pre-6.10.1 versions of Ren'Py, which didn't give us
+    // that 1px border that allows us to be precise.
+    if (! precise) {
+        maxsx -= EPSILON;
+        maxsy -= EPSILON;
+
+        // If a delta is too even, subtract epsilon (towards 0) from it.
+        if (xdx && fabs(fmodf(1.0 / xdx, 1)) < EPSILON) {
+            xdx -= (xdx / fabs(xdx)) * EPSILON;
+        }
+        if (xdy && fabs(fmodf(1.0 / xdy, 1)) < EPSILON) {
+            xdy -= (xdy / fabs(xdy)) * EPSILON;
+        }
+        if (ydx && fabs(fmodf(1.0 / ydx, 1)) < EPSILON) {
+            ydx -= (ydx / fabs(ydx)) * EPSILON;
+        }
+        if (ydy && fabs(fmodf(1.0 / ydy, 1)) < EPSILON) {
+            ydy -= (ydy / fabs(ydy)) * EPSILON;
+        }
+    }
+
+    args.srcpixels = srcpixels;
+    args.dstpixels = dstpixels;
+    args.srcpitch = srcpitch;
+    args.dstpitch = dstpitch;
+    args.dstw = dstw;
+    args.corner_x = corner_x;
+    args.corner_y = corner_y;
+    args.xdx = xdx;
+    args.ydx = ydx;
+    args.xdy = xdy;
+    args.ydy = ydy;
+    args.ashift = ashift;
+    args.amul = amul;
+    args.maxsx = maxsx;
+    args.maxsy = maxsy;
+
+    rv = run_bands(transform32_mmx_band, &args, dsth, dstw);
+
+    Py_END_ALLOW_THREADS;
+
+    return rv;
+}
+
 #endif
 
 void transform32_core(PyObject *pysrc, PyObject *pydst,
@@ -1470,37 +1722,44 @@ void transform32_core(PyObject *pysrc, PyObject *pydst,
 
 
 
-void blend32_core_std(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
-                      int alpha) {
-
-    SDL_Surface *srca;
-    SDL_Surface *srcb;
-    SDL_Surface *dst;
-
-    int srcapitch, srcbpitch, dstpitch;
-    unsigned short dstw, dsth;
-    unsigned short y;
-
+struct blend32_args {
     unsigned char *srcapixels;
     unsigned char *srcbpixels;
     unsigned char *dstpixels;
+    int srcapitch, srcbpitch, dstpitch;
+    int dstw;
+    int alpha;
+};
+
+static void blend32_args_init(struct blend32_args *args,
+                              SDL_Surface *srca, SDL_Surface *srcb, SDL_Surface *dst,
+                              int alpha) {
+
+    args->srcapixels = (unsigned char *) srca->pixels;
+    args->srcbpixels = (unsigned char *) srcb->pixels;
+    args->dstpixels = (unsigned char *) dst->pixels;
+    args->srcapitch = srca->pitch;
+    args->srcbpitch = srcb->pitch;
+    args->dstpitch = dst->pitch;
+    args->dstw = dst->w;
+    args->alpha = alpha;
+}
 
-    srca = PySurface_AsSurface(pysrca);
-    srcb = PySurface_AsSurface(pysrcb);
-    dst = PySurface_AsSurface(pydst);
+static int blend32_std_band(void *p, int y0, int y1) {
+    struct blend32_args *args = (struct blend32_args *) p;
 
-    Py_BEGIN_ALLOW_THREADS
+    int y;
 
-    srcapixels = (unsigned char *) srca->pixels;
-    srcbpixels = (unsigned char *) srcb->pixels;
-    dstpixels = (unsigned char *) dst->pixels;
-    srcapitch = srca->pitch;
-    srcbpitch = srcb->pitch;
-    dstpitch = dst->pitch;
-    dstw = dst->w;
-    dsth = dst->h;
+    unsigned char *srcapixels = args->srcapixels;
+    unsigned char *srcbpixels = args->srcbpixels;
+    unsigned char *dstpixels = args->dstpixels;
+    int srcapitch = args->srcapitch;
+    int srcbpitch = args->srcbpitch;
+    int dstpitch = args->dstpitch;
+    int dstw = args->dstw;
+    int alpha = args->alpha;
 
-    for (y = 0; y < dsth; y++) {
+    for (y = y0; y < y1; y++) {
 
         unsigned int *dp = (unsigned int *)(dstpixels + dstpitch * y);
         unsigned int *dpe = dp + dstw;
@@ -1522,26 +1781,17 @@ void blend32_core_std(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
         }
     }
 
-    Py_END_ALLOW_THREADS
-
+    return 0;
 }
 
-#ifdef GCC_MMX
-
-void blend32_core_mmx(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
+void blend32_core_std(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
                       int alpha) {
 
     SDL_Surface *srca;
     SDL_Surface *srcb;
     SDL_Surface *dst;
 
-    int srcapitch, srcbpitch, dstpitch;
-    unsigned short dstw, dsth;
-    unsigned short y;
-
-    unsigned char *srcapixels;
-    unsigned char *srcbpixels;
-    unsigned char *dstpixels;
+    struct blend32_args args;
 
     srca = PySurface_AsSurface(pysrca);
     srcb = PySurface_AsSurface(pysrcb);
@@ -1549,14 +1799,28 @@ void blend32_core_mmx(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
 
     Py_BEGIN_ALLOW_THREADS
 
-    srcapixels = (unsigned char *) srca->pixels;
-    srcbpixels = (unsigned char *) srcb->pixels;
-    dstpixels = (unsigned char *) dst->pixels;
-    srcapitch = srca->pitch;
-    srcbpitch = srcb->pitch;
-    dstpitch = dst->pitch;
-    dstw = dst->w;
-    dsth = dst->h;
+    blend32_args_init(&args, srca, srcb, dst, alpha);
+    run_bands(blend32_std_band, &args, dst->h, dst->w);
+
+    Py_END_ALLOW_THREADS
+
+}
+
+#ifdef GCC_MMX
+
+static int blend32_mmx_band(void *p, int y0, int y1) {
+    struct blend32_args *args = (struct blend32_args *) p;
+
+    int y;
+
+    unsigned char *srcapixels = args->srcapixels;
+    unsigned char *srcbpixels = args->srcbpixels;
+    unsigned char *dstpixels = args->dstpixels;
+    int srcapitch = args->srcapitch;
+    int srcbpitch = args->srcbpitch;
+    int dstpitch = args->dstpitch;
+    int dstw = args->dstw;
+    int alpha = args->alpha;
 
     /* This code is a slightly modified version of that found in
      * SDL_blit_A.c */
@@ -1567,7 +1831,7 @@ void blend32_core_mmx(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
     punpcklwd_r2r(mm4, mm4); /* 00000A0A -> mm4 */
     punpckldq_r2r(mm4, mm4); /* 0A0A0A0A -> mm4 */
 
-    for (y = 0; y < dsth; y++) {
+    for (y = y0; y < y1; y++) {
 
         unsigned int *dp = (unsigned int *)(dstpixels + dstpitch * y);
         unsigned int *dpe = dp + dstw;
@@ -1593,6 +1857,28 @@ void blend32_core_mmx(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
     }
 
     emms();
+
+    return 0;
+}
+
+void blend32_core_mmx(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
+                      int alpha) {
+
+    SDL_Surface *srca;
+    SDL_Surface *srcb;
+    SDL_Surface *dst;
+
+    struct blend32_args args;
+
+    srca = PySurface_AsSurface(pysrca);
+    srcb = PySurface_AsSurface(pysrcb);
+    dst = PySurface_AsSurface(pydst);
+
+    Py_BEGIN_ALLOW_THREADS
+
+    blend32_args_init(&args, srca, srcb, dst, alpha);
+    run_bands(blend32_mmx_band, &args, dst->h, dst->w);
+
     Py_END_ALLOW_THREADS
 }
 
@@ -1621,44 +1907,53 @@ void blend32_core(PyObject *pysrca, PyObject *pysrcb, PyObject *pydst,
 }
 
 
-void imageblend32_core_std(PyObject *pysrca, PyObject *pysrcb,
-                           PyObject *pydst, PyObject *pyimg,
-                           int alpha_off, char *amap) {
-
-    SDL_Surface *srca;
-    SDL_Surface *srcb;
-    SDL_Surface *dst;
-    SDL_Surface *img;
-
-    int srcapitch, srcbpitch, dstpitch, imgpitch;
-    unsigned short dstw, dsth;
-    unsigned short y;
-
+struct imageblend32_args {
     unsigned char *srcapixels;
     unsigned char *srcbpixels;
     unsigned char *dstpixels;
     unsigned char *imgpixels;
+    int srcapitch, srcbpitch, dstpitch, imgpitch;
+    int dstw;
+    int alpha_off;
+    char *amap;
+};
+
+static void imageblend32_args_init(struct imageblend32_args *args,
+                                   SDL_Surface *srca, SDL_Surface *srcb,
+                                   SDL_Surface *dst, SDL_Surface *img,
+                                   int alpha_off, char *amap) {
+
+    args->srcapixels = (unsigned char *) srca->pixels;
+    args->srcbpixels = (unsigned char *) srcb->pixels;
+    args->dstpixels = (unsigned char *) dst->pixels;
+    args->imgpixels = (unsigned char *) img->pixels;
+    args->srcapitch = srca->pitch;
+    args->srcbpitch = srcb->pitch;
+    args->dstpitch = dst->pitch;
+    args->imgpitch = img->pitch;
+    args->dstw = dst->w;
+    args->alpha_off = alpha_off;
+    args->amap = amap;
+}
 
-    srca = PySurface_AsSurface(pysrca);
-    srcb = PySurface_AsSurface(pysrcb);
-    dst = PySurface_AsSurface(pydst);
-    img = PySurface_AsSurface(pyimg);
+static int imageblend32_std_band(void *p, int y0, int y1) {
+    struct imageblend32_args *args = (struct imageblend32_args *) p;
 
-    Py_BEGIN_ALLOW_THREADS
+    int y;
 
-    srcapixels = (unsigned char *) srca->pixels;
-    srcbpixels = (unsigned char *) srcb->pixels;
-    dstpixels = (unsigned char *) dst->pixels;
-    imgpixels = (unsigned char *) img->pixels;
-    srcapitch = srca->pitch;
-    srcbpitch = srcb->pitch;
-    dstpitch = dst->pitch;
-    imgpitch = img->pitch;
+    unsigned char *srcapixels = args->srcapixels;
+    unsigned char *srcbpixels = args->srcbpixels;
+    unsigned char *dstpixels = args->dstpixels;
+    unsigned char *imgpixels = args->imgpixels;
+    int srcapitch = args->srcapitch;
+    int srcbpitch = args->srcbpitch;
+    int dstpitch = args->dstpitch;
+    int imgpitch = args->imgpitch;
+    int dstw = args->dstw;
+    int alpha_off = args->alpha_off;
+    char *amap = args->amap;
 
-    dstw = dst->w;
-    dsth = dst->h;
-
-    for (y = 0; y < dsth; y++) {
+    for (y = y0; y < y1; y++) {
 
         unsigned int *dp = (unsigned int *)(dstpixels + dstpitch * y);
         unsigned int *dpe = dp + dstw;
@@ -1686,12 +1981,10 @@ void imageblend32_core_std(PyObject *pysrca, PyObject *pysrcb,
         }
     }
 
-    Py_END_ALLOW_THREADS
+    return 0;
 }
 
-#ifdef GCC_MMX
-
-void imageblend32_core_mmx(PyObject *pysrca, PyObject *pysrcb,
+void imageblend32_core_std(PyObject *pysrca, PyObject *pysrcb,
                            PyObject *pydst, PyObject *pyimg,
                            int alpha_off, char *amap) {
 
@@ -1700,14 +1993,7 @@ void imageblend32_core_mmx(PyObject *pysrca, PyObject *pysrcb,
     SDL_Surface *dst;
     SDL_Surface *img;
 
-    int srcapitch, srcbpitch, dstpitch, imgpitch;
-    unsigned short dstw, dsth;
-    unsigned short y;
-
-    unsigned char *srcapixels;
-    unsigned char *srcbpixels;
-    unsigned char *dstpixels;
-    unsigned char *imgpixels;
+    struct imageblend32_args args;
 
     srca = PySurface_AsSurface(pysrca);
     srcb = PySurface_AsSurface(pysrcb);
@@ -1716,21 +2002,34 @@ void imageblend32_core_mmx(PyObject *pysrca, PyObject *pysrcb,
 
     Py_BEGIN_ALLOW_THREADS
 
-    srcapixels = (unsigned char *) srca->pixels;
-    srcbpixels = (unsigned char *) srcb->pixels;
-    dstpixels = (unsigned char *) dst->pixels;
-    imgpixels = (unsigned char *) img->pixels;
-    srcapitch = srca->pitch;
-    srcbpitch = srcb->pitch;
-    dstpitch = dst->pitch;
-    imgpitch = img->pitch;
+    imageblend32_args_init(&args, srca, srcb, dst, img, alpha_off, amap);
+    run_bands(imageblend32_std_band, &args, dst->h, dst->w);
 
-    dstw = dst->w;
-    dsth = dst->h;
+    Py_END_ALLOW_THREADS
+}
+
+#ifdef GCC_MMX
+
+static int imageblend32_mmx_band(void *p, int y0, int y1) {
+    struct imageblend32_args *args = (struct imageblend32_args *) p;
+
+    int y;
+
+    unsigned char *srcapixels = args->srcapixels;
+    unsigned char *srcbpixels = args->srcbpixels;
+    unsigned char *dstpixels = args->dstpixels;
+    unsigned char *imgpixels = args->imgpixels;
+    int srcapitch = args->srcapitch;
+    int srcbpitch = args->srcbpitch;
+    int dstpitch = args->dstpitch;
+    int imgpitch = args->imgpitch;
+    int dstw = args->dstw;
+    int alpha_off = args->alpha_off;
+    char *amap = args->amap;
 
     pxor_r2r(mm5, mm5); /* 0 -> mm5 */
 
-    for (y = 0; y < dsth; y++) {
+    for (y = y0; y < y1; y++) {
 
         unsigned int *dp = (unsigned int *)(dstpixels + dstpitch * y);
         unsigned int *dpe = dp + dstw;
@@ -1764,6 +2063,31 @@ void imageblend32_core_mmx(PyObject *pysrca, PyObject *pysrcb,
     }
 
     emms();
+
+    return 0;
+}
+
+void imageblend32_core_mmx(PyObject *pysrca, PyObject *pysrcb,
+                           PyObject *pydst, PyObject *pyimg,
+                           int alpha_off, char *amap) {
+
+    SDL_Surface *srca;
+    SDL_Surface *srcb;
+    SDL_Surface *dst;
+    SDL_Surface *img;
+
+    struct imageblend32_args args;
+
+    srca = PySurface_AsSurface(pysrca);
+    srcb = PySurface_AsSurface(pysrcb);
+    dst = PySurface_AsSurface(pydst);
+    img = PySurface_AsSurface(pyimg);
+
+    Py_BEGIN_ALLOW_THREADS
+
+    imageblend32_args_init(&args, srca, srcb, dst, img, alpha_off, amap);
+    run_bands(imageblend32_mmx_band, &args, dst->h, dst->w);
+
     Py_END_ALLOW_THREADS
 }
 
@@ -1793,41 +2117,36 @@ void imageblend32_core(PyObject *pysrca, PyObject *pysrcb,
 }
 
 
-void colormatrix32_core(PyObject *pysrc, PyObject *pydst,
-                        float c00, float c01, float c02, float c03, float c04,
-                        float c10, float c11, float c12, float c13, float c14,
-                        float c20, float c21, float c22, float c23, float c24,
-                        float c30, float c31, float c32, float c33, float c34) {
-
-    SDL_Surface *src;
-    SDL_Surface *dst;
-
-    int srcpitch, dstpitch;
-    unsigned short dstw, dsth;
-    unsigned short y;
-
+struct colormatrix32_args {
     unsigned char *srcpixels;
     unsigned char *dstpixels;
+    int srcpitch, dstpitch;
+    int dstw;
+    float c[4][5];
+};
 
-    src = PySurface_AsSurface(pysrc);
-    dst = PySurface_AsSurface(pydst);
+static int colormatrix32_band(void *p, int y0, int y1) {
+    struct colormatrix32_args *args = (struct colormatrix32_args *) p;
 
-    Py_BEGIN_ALLOW_THREADS
+    int y;
 
-    srcpixels = (unsigned char *) src->pixels;
-    dstpixels = (unsigned char *) dst->pixels;
-    srcpitch = src->pitch;
-    dstpitch = dst->pitch;
+    unsigned char *srcpixels = args->srcpixels;
+    unsigned char *dstpixels = args->dstpixels;
+    int srcpitch = args->srcpitch;
+    int dstpitch = args->dstpitch;
+    int dstw = args->dstw;
 
-    dstw = dst->w;
-    dsth = dst->h;
+    float c00 = args->c[0][0], c01 = args->c[0][1], c02 = args->c[0][2], c03 = args->c[0][3], c04 = args->c[0][4];
+    float c10 = args->c[1][0], c11 = args->c[1][1], c12 = args->c[1][2], c13 = args->c[1][3], c14 = args->c[1][4];
+    float c20 = args->c[2][0], c21 = args->c[2][1], c22 = args->c[2][2], c23 = args->c[2][3], c24 = args->c[2][4];
+    float c30 = args->c[3][0], c31 = args->c[3][1], c32 = args->c[3][2], c33 = args->c[3][3], c34 = args->c[3][4];
 
     int o0 = c04 * 255;
     int o1 = c14 * 255;
     int o2 = c24 * 255;
     int o3 = c34 * 255;
 
-    for (y = 0; y < dsth; y++) {
+    for (y = y0; y < y1; y++) {
 
         int r;
 
@@ -1872,6 +2191,41 @@ void colormatrix32_core(PyObject *pysrc, PyObject *pydst,
         }
     }
 
+    return 0;
+}
+
+void colormatrix32_core(PyObject *pysrc, PyObject *pydst,
+                        float c00, float c01, float c02, float c03, float c04,
+                        float c10, float c11, float c12, float c13, float c14,
+                        float c20, float c21, float c22, float c23, float c24,
+                        float c30, float c31, float c32, float c33, float c34) {
+
+    SDL_Surface *src;
+    SDL_Surface *dst;
+
+    struct colormatrix32_args args = {
+        NULL, NULL, 0, 0, 0,
+        {
+            { c00, c01, c02, c03, c04 },
+            { c10, c11, c12, c13, c14 },
+            { c20, c21, c22, c23, c24 },
+            { c30, c31, c32, c33, c34 },
+        }
+    };
+
+    src = PySurface_AsSurface(pysrc);
+    dst = PySurface_AsSurface(pydst);
+
+    Py_BEGIN_ALLOW_THREADS
+
+    args.srcpixels = (unsigned char *) src->pixels;
+    args.dstpixels = (unsigned char *) dst->pixels;
+    args.srcpitch = src->pitch;
+    args.dstpitch = dst->pitch;
+    args.dstw = dst->w;
+
+    run_bands(colormatrix32_band, &args, dst->h, dst->w);
+
     Py_END_ALLOW_THREADS
 }
 
@@ -19,6 +19,10 @@ static int audio_sample_rate = 44100;
 static int audio_sample_increase = 44100 / 5;
 static int audio_target_samples = 44100 * 2;
 
+/* If true, reading audio waits for it to be decoded, rather than
+ * returning what's available. */
+static int audio_blocking = 0;
+
 const int CHANNELS = 2;
 const int BPC = 2; // Bytes per channel.
 const int BPS = 4; // Bytes per sample.
@@ -238,6 +242,17 @@ typedef struct MediaState {
 	/* The wall time the last video frame was read. */
 	double video_read_time;
 
+	/* Decoded Audio Stuff ***************************************************/
+
+	/* If not NULL, the decoded audio this stream plays, rather than
+	 * decoding a file.
+	 */
+	Uint8 *pcm;
+
+	/* The length of pcm, and the position in it, in bytes. */
+	int pcm_len;
+	int pcm_pos;
+
 } MediaState;
 
 static AVFrame *dequeue_frame(FrameQueue *fq);
@@ -997,10 +1012,10 @@ static int decode_thread(void *arg) {
 
 		SDL_LockMutex(ms->lock);
 
-		if (!ms->ready) {
-			ms->ready = 1;
-			SDL_CondBroadcast(ms->cond);
-		}
+		ms->ready = 1;
+
+		/* Wake up readers that are waiting for audio to be decoded. */
+		SDL_CondBroadcast(ms->cond);
 
 		if (!(ms->needs_decode || ms->quit)) {
 			SDL_CondWait(ms->cond, ms->lock);
@@ -1019,6 +1034,11 @@ finish:
 
 	SDL_LockMutex(ms->lock);
 
+	/* Ensures that blocking readers do not wait for audio that will never
+	 * be decoded. */
+	ms->audio_finished = 1;
+	SDL_CondBroadcast(ms->cond);
+
 	/* Ensures that every stream becomes ready. */
 	if (!ms->ready) {
 		ms->ready = 1;
@@ -1037,10 +1057,58 @@ finish:
 }
 
 
+/**
+ * Reads audio from a stream that plays decoded audio.
+ */
+static int read_pcm_audio(struct MediaState *ms, Uint8 *stream, int len) {
+	int rv = 0;
+
+	if (ms->audio_duration >= 0) {
+		unsigned int remaining = (ms->audio_duration - ms->audio_read_samples) * BPS;
+		if (len > remaining) {
+			len = remaining;
+		}
+	}
+
+	int count = ms->pcm_len - ms->pcm_pos;
+
+	if (count > len) {
+		count = len;
+	}
+
+	memcpy(stream, &ms->pcm[ms->pcm_pos], count);
+
+	ms->pcm_pos += count;
+	ms->audio_read_samples += count / BPS;
+
+	rv += count;
+	len -= count;
+	stream += count;
+
+	/* Pad with silence to the end, as media_read_audio does. */
+	if (ms->audio_duration >= 0) {
+		memset(stream, 0, len);
+		ms->audio_read_samples += len / BPS;
+		rv += len;
+	}
+
+	return rv;
+}
+
 int media_read_audio(struct MediaState *ms, Uint8 *stream, int len) {
 
+	if (ms->pcm) {
+		return read_pcm_audio(ms, stream, len);
+	}
+
 	SDL_LockMutex(ms->lock);
 
+	if (audio_blocking) {
+		while (!ms->ready) {
+			SDL_CondWait(ms->cond, ms->lock);
+		}
+	}
+
     if(!ms->ready) {
 	    SDL_UnlockMutex(ms->lock);
 	    memset(stream, 0, len);
@@ -1061,6 +1129,14 @@ int media_read_audio(struct MediaState *ms, Uint8 *stream, int len) {
 
 	}
 
+	if (audio_blocking) {
+		while (!ms->audio_finished && ms->audio_queue_samples * BPS < len) {
+			ms->needs_decode = 1;
+			SDL_CondBroadcast(ms->cond);
+			SDL_CondWait(ms->cond, ms->lock);
+		}
+	}
+
 	while (len) {
 
 		if (!ms->audio_out_frame) {
@@ -1139,6 +1215,18 @@ double media_duration(MediaState *ms) {
 void media_start(MediaState *ms) {
 	char buf[1024];
 
+	if (ms->pcm) {
+		int skip = BPS * (int) (ms->skip * audio_sample_rate);
+
+		if (skip > ms->pcm_len) {
+			skip = ms->pcm_len;
+		}
+
+		ms->pcm_pos = skip;
+		ms->ready = 1;
+		return;
+	}
+
 	snprintf(buf, 1024, "decode: %s", ms->filename);
 	SDL_Thread *t = SDL_CreateThread(decode_thread, buf, (void *) ms);
 
@@ -1163,6 +1251,27 @@ MediaState *media_open(SDL_RWops *rwops, const char *filename) {
 	return ms;
 }
 
+/**
+ * Opens a stream that plays `len` bytes of decoded audio, in the format
+ * produced by media_decode_audio. The audio is copied, so `pcm` can be
+ * freed once this returns.
+ */
+MediaState *media_open_pcm(const Uint8 *pcm, int len, const char *filename) {
+	MediaState *ms = media_open(NULL, filename);
+
+	ms->pcm = av_malloc(len ? len : 1);
+	memcpy(ms->pcm, pcm, len);
+	ms->pcm_len = len;
+
+	ms->video_stream = -1;
+	ms->audio_stream = -1;
+	ms->video_finished = 1;
+
+	ms->total_duration = 1.0 * len / BPS / audio_sample_rate;
+
+	return ms;
+}
+
 /**
  * Sets the start and end of the stream. This must be called before
  * media_start.
@@ -1195,6 +1304,16 @@ void media_want_video(MediaState *ms) {
 
 void media_close(MediaState *ms) {
 
+	if (ms->pcm) {
+		SDL_DestroyCond(ms->cond);
+		SDL_DestroyMutex(ms->lock);
+
+		av_free(ms->pcm);
+		av_free(ms->filename);
+		av_free(ms);
+		return;
+	}
+
 	if (!ms->started) {
 		deallocate(ms);
 		return;
@@ -1208,10 +1327,198 @@ void media_close(MediaState *ms) {
 
 }
 
+/**
+ * Appends the audio in `frame` to `*data`, after converting it to the
+ * output format. Returns 0 on success, or -1 if this would make the
+ * audio longer than `max_len` bytes.
+ */
+static int append_audio(SwrContext *swr, AVFrame *frame, Uint8 **data, int *len, int *size, int max_len) {
+
+	AVFrame *converted_frame = av_frame_alloc();
+	converted_frame->sample_rate = audio_sample_rate;
+	converted_frame->channel_layout = AV_CH_LAYOUT_STEREO;
+	converted_frame->format = AV_SAMPLE_FMT_S16;
+
+	if (frame && !frame->channel_layout) {
+		frame->channel_layout = av_get_default_channel_layout(frame->channels);
+	}
+
+	if (swr_convert_frame(swr, converted_frame, frame)) {
+		av_frame_free(&converted_frame);
+		return 0;
+	}
+
+	int count = converted_frame->nb_samples * BPS;
+
+	if (!count) {
+		av_frame_free(&converted_frame);
+		return 0;
+	}
+
+	if (*len + count > max_len) {
+		av_frame_free(&converted_frame);
+		return -1;
+	}
+
+	if (*len + count > *size) {
+		while (*len + count > *size) {
+			*size *= 2;
+		}
+
+		*data = SDL_realloc(*data, *size);
+	}
+
+	memcpy(*data + *len, converted_frame->data[0], count);
+	*len += count;
+
+	av_frame_free(&converted_frame);
+	return 0;
+}
+
+/**
+ * Decodes all of the audio in a file at once, converting it to 16-bit
+ * stereo samples at the output sample rate.
+ *
+ * On success, stores a buffer allocated with SDL_malloc in `*data`, and
+ * returns its length in bytes. Returns -1 if the file could not be decoded,
+ * or if its audio is longer than `max_duration` seconds. The rwops is
+ * closed in either case.
+ */
+int media_decode_audio(SDL_RWops *rwops, const char *filename, double max_duration, Uint8 **data) {
+
+	AVFormatContext *ctx = avformat_alloc_context();
+	AVIOContext *io_context = rwops_open(rwops);
+	AVCodecContext *audio_context = NULL;
+	SwrContext *swr = NULL;
+	AVFrame *frame = NULL;
+	AVPacket pkt;
+
+	int audio_stream = -1;
+	int max_len = BPS * (int) (max_duration * audio_sample_rate);
+	int size = 65536;
+	int len = 0;
+	int rv = -1;
+
+	*data = NULL;
+
+	ctx->pb = io_context;
+
+	if (avformat_open_input(&ctx, filename, NULL, NULL)) {
+		goto finish;
+	}
+
+	if (avformat_find_stream_info(ctx, NULL)) {
+		goto finish;
+	}
+
+	for (int i = 0; i < ctx->nb_streams; i++) {
+		if (ctx->streams[i]->codec->codec_type == AVMEDIA_TYPE_AUDIO) {
+			audio_stream = i;
+			break;
+		}
+	}
+
+	/* Reject long files without decoding them, if we can. */
+	if (ctx->duration != AV_NOPTS_VALUE && av_fmt_ctx_get_duration_estimation_method(ctx) != AVFMT_DURATION_FROM_BITRATE) {
+		if (1.0 * ctx->duration / AV_TIME_BASE > max_duration) {
+			goto finish;
+		}
+	}
+
+	audio_context = find_context(ctx, audio_stream);
+
+	if (!audio_context) {
+		goto finish;
+	}
+
+	swr = swr_alloc();
+	frame = av_frame_alloc();
+	*data = SDL_malloc(size);
+
+	av_init_packet(&pkt);
+
+	while (av_read_frame(ctx, &pkt) >= 0) {
+
+		AVPacket pkt_temp = pkt;
+
+		while (pkt.stream_index == audio_stream && pkt_temp.size > 0) {
+			int got_frame = 0;
+			int read_size = avcodec_decode_audio4(audio_context, frame, &got_frame, &pkt_temp);
+
+			if (read_size < 0) {
+				break;
+			}
+
+			pkt_temp.data += read_size;
+			pkt_temp.size -= read_size;
+
+			if (got_frame && append_audio(swr, frame, data, &len, &size, max_len)) {
+				av_packet_unref(&pkt);
+				goto finish;
+			}
+		}
+
+		av_packet_unref(&pkt);
+	}
+
+	/* Flush the frames buffered by the decoder, then the resampler. */
+	pkt.data = NULL;
+	pkt.size = 0;
+
+	while (1) {
+		int got_frame = 0;
+
+		if (avcodec_decode_audio4(audio_context, frame, &got_frame, &pkt) < 0 || !got_frame) {
+			break;
+		}
+
+		if (append_audio(swr, frame, data, &len, &size, max_len)) {
+			goto finish;
+		}
+	}
+
+	if (append_audio(swr, NULL, data, &len, &size, max_len)) {
+		goto finish;
+	}
+
+	rv = len;
+
+finish:
+
+	if (rv < 0) {
+		SDL_free(*data);
+		*data = NULL;
+	}
+
+	av_frame_free(&frame);
+	swr_free(&swr);
+	avcodec_free_context(&audio_context);
+
+	/* The AVFormatContext is freed by avformat_open_input on failure. */
+	if (ctx) {
+		avformat_close_input(&ctx);
+	}
+
+	av_freep(&io_context->buffer);
+	av_freep(&io_context);
+
+	rwops_close(rwops);
+
+	return rv;
+}
+
 void media_advance_time(void) {
 	current_time = SPEED * av_gettime() * 1e-6;
 }
 
+/**
+ * Sets if reading audio should wait for it to be decoded. This makes the
+ * audio that is read independent of how fast decoding happens.
+ */
+void media_set_blocking(int blocking) {
+	audio_blocking = blocking;
+}
+
 void media_sample_surfaces(SDL_Surface *rgb, SDL_Surface *rgba) {
 	rgb_surface = rgb;
 	rgba_surface = rgba;
@@ -7,6 +7,8 @@
 void core_init(void);
 void subpixel_init(void);
 
+void band_parallel_core(int threads, int threshold);
+
 void save_png_core(PyObject *pysurf, SDL_RWops *file, int compress);
 
 void pixellate32_core(PyObject *pysrc,
@@ -36,11 +36,14 @@ struct MediaState;
 typedef struct MediaState MediaState;
 
 void media_init(int rate, int status);
+void media_set_blocking(int blocking);
 
 void media_advance_time(void);
 void media_sample_surfaces(SDL_Surface *rgb, SDL_Surface *rgba);
 
 MediaState *media_open(SDL_RWops *, const char *);
+MediaState *media_open_pcm(const Uint8 *, int, const char *);
+int media_decode_audio(SDL_RWops *, const char *, double, Uint8 **);
 void media_want_video(MediaState *);
 void media_start_end(MediaState *, double, double);
 void media_start(MediaState *);
@@ -114,6 +117,11 @@ static const char *error_msg = NULL;
 /* Have we been initialized? */
 static int initialized = 0;
 
+/* Are we mixing offline, without an audio device? When we are, the
+ * callback is called by RPS_mix, and the time spent decoding and mixing
+ * each channel is recorded. */
+static int offline = 0;
+
 /*
  * This structure represents a channel the system knows about
  * and can play from.
@@ -202,6 +210,13 @@ struct Channel {
     /* This is set to true if this is a movie channel. */
     int video;
 
+    /* When mixing offline, the time spent decoding and mixing audio on
+     * this channel, in performance counter ticks, and the number of
+     * bytes mixed. */
+    Uint64 decode_ticks;
+    Uint64 mix_ticks;
+    long long mixed_bytes;
+
 };
 
 struct Dying {
@@ -454,10 +469,22 @@ static void callback(void *userdata, Uint8 *stream, int length) {
             Uint8 buffer[mixleft];
             int bytes;
 
+            Uint64 ticks = 0;
+
             // Decode some amount of data.
 
+            if (offline) {
+                ticks = SDL_GetPerformanceCounter();
+            }
+
             bytes = media_read_audio(c->playing, buffer, mixleft);
 
+            if (offline) {
+                Uint64 now = SDL_GetPerformanceCounter();
+                c->decode_ticks += now - ticks;
+                ticks = now;
+            }
+
             // We have some data in the buffer.
             if (c->stop_bytes && bytes) {
 
@@ -467,6 +494,11 @@ static void callback(void *userdata, Uint8 *stream, int length) {
                 pan_audio(c, buffer, bytes);
                 fade_mixaudio(c, &stream[mixed], buffer, bytes);
 
+                if (offline) {
+                    c->mix_ticks += SDL_GetPerformanceCounter() - ticks;
+                    c->mixed_bytes += bytes;
+                }
+
                 mixed += bytes;
 
                 if (c->stop_bytes != -1)
@@ -557,12 +589,19 @@ static int check_channel(int c) {
 
 
 /*
- * Loads the provided sample. Returns the sample on success, NULL on
- * failure.
+ * Loads the provided sample. If pcm is not NULL, the sample plays the
+ * pcm_len bytes of decoded audio it points to, and rw is ignored. Returns
+ * the sample on success, NULL on failure.
  */
-struct MediaState *load_sample(SDL_RWops *rw, const char *ext, double start, double end, int video) {
+struct MediaState *load_sample(SDL_RWops *rw, const char *ext, const Uint8 *pcm, int pcm_len, double start, double end, int video) {
     struct MediaState *rv;
-    rv = media_open(rw, ext);
+
+    if (pcm) {
+        rv = media_open_pcm(pcm, pcm_len, ext);
+    } else {
+        rv = media_open(rw, ext);
+    }
+
     media_start_end(rv, start, end);
 
     if (video) {
@@ -574,7 +613,7 @@ struct MediaState *load_sample(SDL_RWops *rw, const char *ext, double start, dou
 }
 
 
-void RPS_play(int channel, SDL_RWops *rw, const char *ext, PyObject *name, int fadein, int tight, int paused, double start, double end) {
+void RPS_play(int channel, SDL_RWops *rw, const Uint8 *pcm, int pcm_len, const char *ext, PyObject *name, int fadein, int tight, int paused, double start, double end) {
 
     BEGIN();
 
@@ -610,7 +649,7 @@ void RPS_play(int channel, SDL_RWops *rw, const char *ext, PyObject *name, int f
 
     /* Allocate playing sample. */
 
-    c->playing = load_sample(rw, ext, start, end, c->video);
+    c->playing = load_sample(rw, ext, pcm, pcm_len, start, end, c->video);
 
     if (! c->playing) {
     	UNLOCK_NAME();
@@ -638,7 +677,7 @@ void RPS_play(int channel, SDL_RWops *rw, const char *ext, PyObject *name, int f
     error(SUCCESS);
 }
 
-void RPS_queue(int channel, SDL_RWops *rw, const char *ext, PyObject *name, int fadein, int tight, double start, double end) {
+void RPS_queue(int channel, SDL_RWops *rw, const Uint8 *pcm, int pcm_len, const char *ext, PyObject *name, int fadein, int tight, double start, double end) {
 
     BEGIN();
 
@@ -655,7 +694,7 @@ void RPS_queue(int channel, SDL_RWops *rw, const char *ext, PyObject *name, int
     /* If we're not playing, then we should play instead of queue. */
     if (!c->playing) {
         EXIT();
-        RPS_play(channel, rw, ext, name, fadein, tight, 0, start, end);
+        RPS_play(channel, rw, pcm, pcm_len, ext, name, fadein, tight, 0, start, end);
         return;
     }
 
@@ -670,7 +709,7 @@ void RPS_queue(int channel, SDL_RWops *rw, const char *ext, PyObject *name, int
     }
 
     /* Allocate queued sample. */
-    c->queued = load_sample(rw, ext, start, end, c->video);
+    c->queued = load_sample(rw, ext, pcm, pcm_len, start, end, c->video);
 
     if (! c->queued) {
         EXIT();
@@ -1198,7 +1237,7 @@ void RPS_set_video(int channel, int video) {
  * Initializes the sound to the given frequencies, channels, and
  * sample buffer size.
  */
-void RPS_init(int freq, int stereo, int samples, int status) {
+void RPS_init(int freq, int stereo, int samples, int status, int offline_mix) {
 
     if (initialized) {
         return;
@@ -1220,11 +1259,6 @@ void RPS_init(int freq, int stereo, int samples, int status) {
         return;
     }
 
-    if (SDL_Init(SDL_INIT_AUDIO)) {
-        error(SDL_ERROR);
-        return;
-    }
-
     audio_spec.freq = freq;
     audio_spec.format = AUDIO_S16SYS;
     audio_spec.channels = stereo;
@@ -1232,14 +1266,27 @@ void RPS_init(int freq, int stereo, int samples, int status) {
     audio_spec.callback = callback;
     audio_spec.userdata = NULL;
 
-    if (SDL_OpenAudio(&audio_spec, NULL)) {
-        error(SDL_ERROR);
-        return;
+    offline = offline_mix;
+
+    if (!offline) {
+
+        if (SDL_Init(SDL_INIT_AUDIO)) {
+            error(SDL_ERROR);
+            return;
+        }
+
+        if (SDL_OpenAudio(&audio_spec, NULL)) {
+            error(SDL_ERROR);
+            return;
+        }
     }
 
     media_init(audio_spec.freq, status);
+    media_set_blocking(offline);
 
-    SDL_PauseAudio(0);
+    if (!offline) {
+        SDL_PauseAudio(0);
+    }
 
     initialized = 1;
 
@@ -1255,21 +1302,80 @@ void RPS_quit() {
 
     int i;
 
-    ENTER();
-    SDL_PauseAudio(1);
-    EXIT();
+    if (!offline) {
+        ENTER();
+        SDL_PauseAudio(1);
+        EXIT();
+    }
 
     for (i = 0; i < num_channels; i++) {
         RPS_stop(i);
     }
 
-    SDL_CloseAudio();
+    if (!offline) {
+        SDL_CloseAudio();
+    }
+
+    offline = 0;
+    media_set_blocking(0);
 
     num_channels = 0;
     initialized = 0;
     error(SUCCESS);
 }
 
+/*
+ * When mixing offline, mixes the next length bytes of audio, and returns
+ * them as a string.
+ */
+PyObject *RPS_mix(int length) {
+    BEGIN();
+    PyObject *rv;
+
+    if (!offline) {
+        error(RPS_ERROR);
+        error_msg = "Not mixing offline.";
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    rv = PyString_FromStringAndSize(NULL, length);
+
+    if (!rv) {
+        return NULL;
+    }
+
+    ENTER();
+    callback(NULL, (Uint8 *) PyString_AS_STRING(rv), length);
+    EXIT();
+
+    error(SUCCESS);
+    return rv;
+}
+
+/*
+ * When mixing offline, returns a (decode seconds, mix seconds, mixed
+ * samples) tuple giving the cost of mixing channel.
+ */
+PyObject *RPS_get_mix_stats(int channel) {
+    struct Channel *c;
+    double freq = (double) SDL_GetPerformanceFrequency();
+
+    if (check_channel(channel)) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    c = &channels[channel];
+
+    error(SUCCESS);
+
+    return Py_BuildValue("(ddL)",
+        c->decode_ticks / freq,
+        c->mix_ticks / freq,
+        c->mixed_bytes / (audio_spec.channels * 2));
+}
+
 /* This must be called frequently, to take care of deallocating dead
  * streams. */
 void RPS_periodic() {
@@ -1291,6 +1397,32 @@ void RPS_periodic() {
     EXIT();
 }
 
+/*
+ * Decodes the file in rw, and returns a string containing its audio, as
+ * 16-bit stereo samples at the output sample rate. Returns None if the file
+ * can't be decoded or is longer than max_duration seconds.
+ */
+PyObject *RPS_decode(SDL_RWops *rw, const char *ext, double max_duration) {
+    BEGIN();
+    Uint8 *data;
+    int len;
+    PyObject *rv;
+
+    ALTENTER();
+    len = media_decode_audio(rw, ext, max_duration, &data);
+    ALTEXIT();
+
+    if (len < 0) {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    rv = PyString_FromStringAndSize((const char *) data, len);
+    SDL_free(data);
+
+    return rv;
+}
+
 void RPS_advance_time(void) {
 	media_advance_time();
 }
@@ -434,6 +434,7 @@ def import_all():
     import renpy.display.behavior  # layout @UnresolvedImport
     import renpy.display.transition  # core, layout @UnresolvedImport
     import renpy.display.movetransition  # core @UnresolvedImport
+    import renpy.display.diskcache
     import renpy.display.im
     import renpy.display.imagelike
     import renpy.display.image  # core, behavior, im, imagelike @UnresolvedImport
@@ -499,6 +500,7 @@ def import_all():
     import renpy.test.testparser
     import renpy.test.testexecution
 
+    import renpy.snapshot
     import renpy.main
 
     # Back up the Ren'Py modules.
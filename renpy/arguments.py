@@ -41,7 +41,7 @@ except:
 commands = { }
 
 # Commands that force compile to be set.
-compile_commands = { "compile", "add_from", "merge_strings" }
+compile_commands = { "compile", "add_from", "merge_strings", "compile-benchmark" }
 
 
 class ArgumentParser(argparse.ArgumentParser):
@@ -109,6 +109,15 @@ class ArgumentParser(argparse.ArgumentParser):
             "--compile", action='store_true', dest='compile',
             help='Forces all .rpy scripts to be recompiled before proceeding.')
 
+        self.add_argument(
+            "--compile-workers", action='store', dest='compile_workers', type=int, default=0, metavar="N",
+            help="If greater than 0, .rpy files are parsed by N worker processes. (Only on platforms that support fork.)")
+
+        self.add_argument(
+            "--compile-level", action='store', dest='compile_level', type=int, default=9, metavar="LEVEL",
+            choices=range(-1, 10),
+            help="The zlib compression level (0-9, or -1 for zlib's default) used when writing .rpyc files.")
+
         self.add_argument(
             "--keep-orphan-rpyc", action="store_true",
             help="Prevents the compile command from deleting orphan rpyc files.")
@@ -117,6 +126,12 @@ class ArgumentParser(argparse.ArgumentParser):
             "--lint", action="store_true", dest="lint",
             help=argparse.SUPPRESS)
 
+        profile = self.add_argument_group("Profiling arguments", description="Ren'Py can record a trace of what it does each frame, and write it out in the Chrome trace event format.")
+        profile.add_argument("--profile-trace", action="store", metavar="FILE", help="Records a trace, and writes it to FILE when Ren'Py quits.")
+        profile.add_argument("--startup-profile", action="store", metavar="FILE", help="Records a trace of startup, writes it to FILE, and quits once the first frame has been drawn.")
+        profile.add_argument("--profile-frames", action="store", type=int, default=None, metavar="N", help="Quits after N frames have been drawn. (Use with --profile-trace, and the dummy SDL video driver to run without a window.)")
+        profile.add_argument("--offline-audio", action="store", metavar="WAV", nargs='?', const="", default=None, help="Mixes audio without an audio device, advancing the audio clock only when renpy.audio.audio.offline.advance is called. If WAV is given, the mixed audio is written to it.")
+
         dump = self.add_argument_group("JSON dump arguments", description="Ren'Py can dump information about the game to a JSON file. These options let you select the file, and choose what is dumped.")
         dump.add_argument("--json-dump", action="store", metavar="FILE", help="The name of the JSON file.")
         dump.add_argument("--json-dump-private", action="store_true", default=False, help="Include private names. (Names beginning with _.)")
@@ -30,9 +30,11 @@ import renpy.display  # @UnusedImport
 import time
 import pygame_sdl2  # @UnusedImport
 import os
+import collections
 import re
 import threading
 import sys
+import wave
 
 # Import the appropriate modules, or set them to None if we cannot.
 
@@ -47,6 +49,9 @@ else:
 # This is True if we were able to sucessfully enable the pcm audio.
 pcm_ok = None
 
+# If not None, the OfflineMixer that mixes audio without an audio device.
+offline = None
+
 unique = time.time()
 serial = 0
 
@@ -70,6 +75,306 @@ def load(fn):
     return rv
 
 
+class PCMCache(object):
+    """
+    An LRU cache of the decoded audio of short files, so that sounds that
+    are played often are only decoded once. Files are decoded in a
+    background thread, when they are predicted or first played.
+    """
+
+    def __init__(self):
+
+        # A map from filename to decoded audio, with the least recently
+        # used first.
+        self.cache = collections.OrderedDict()
+
+        # The total length of the decoded audio in the cache, in bytes.
+        self.size = 0
+
+        # Files that can't be decoded, or are too long to be cached.
+        self.uncacheable = set()
+
+        # Files that are waiting to be decoded.
+        self.pending = [ ]
+
+        # Protects the fields above, and is notified when a file is added
+        # to pending.
+        self.condition = threading.Condition()
+
+        # The decode thread, and a flag that asks it to quit.
+        self.thread = None
+        self.quit = False
+
+    def enabled(self):
+        return (self.thread is not None) and (renpy.config.audio_cache_size > 0) and (renpy.config.audio_cache_max_length > 0)
+
+    def get(self, fn):
+        """
+        Returns the decoded audio of `fn`, or None if it is not in the cache.
+        When None is returned, `fn` is queued to be decoded.
+        """
+
+        if not self.enabled():
+            return None
+
+        with self.condition:
+
+            rv = self.cache.pop(fn, None)
+
+            if rv is not None:
+                self.cache[fn] = rv
+                return rv
+
+            uncacheable = fn in self.uncacheable
+
+        # When mixing offline, decode now, so the audio that's mixed doesn't
+        # depend on how long decoding takes.
+        if (offline is not None) and not uncacheable:
+            self.decode(fn)
+
+            with self.condition:
+                return self.cache.get(fn, None)
+
+        self.predict(fn)
+
+        return None
+
+    def predict(self, fn):
+        """
+        Queues `fn` to be decoded, if it's not already in the cache.
+        """
+
+        if not self.enabled():
+            return
+
+        with self.condition:
+
+            if (fn in self.cache) or (fn in self.uncacheable) or (fn in self.pending):
+                return
+
+            self.pending.append(fn)
+            self.condition.notify()
+
+    def decode(self, fn):
+        """
+        Decodes `fn`, and adds it to the cache, removing the least recently
+        used files if the cache is full.
+        """
+
+        try:
+            pcm = renpysound.decode(load(fn), fn, renpy.config.audio_cache_max_length)
+        except:
+            pcm = None
+
+        with self.condition:
+
+            if (pcm is None) or (len(pcm) > renpy.config.audio_cache_size):
+                self.uncacheable.add(fn)
+                return
+
+            self.cache[fn] = pcm
+            self.size += len(pcm)
+
+            while self.size > renpy.config.audio_cache_size:
+                _, old = self.cache.popitem(last=False)
+                self.size -= len(old)
+
+    def thread_main(self):
+
+        while True:
+
+            with self.condition:
+
+                while not (self.pending or self.quit):
+                    self.condition.wait()
+
+                if self.quit:
+                    return
+
+                fn = self.pending.pop(0)
+
+            self.decode(fn)
+
+    def start(self):
+        """
+        Starts the decode thread. This must be called after renpysound
+        has been initialized.
+        """
+
+        self.quit = False
+
+        self.thread = threading.Thread(target=self.thread_main)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the decode thread, and empties the cache.
+        """
+
+        if self.thread is None:
+            return
+
+        with self.condition:
+            self.quit = True
+            self.condition.notify()
+
+        self.thread.join()
+        self.thread = None
+
+        self.cache.clear()
+        self.size = 0
+        self.uncacheable.clear()
+        self.pending = [ ]
+
+
+pcm_cache = PCMCache()
+
+
+class OfflineMixer(object):
+    """
+    Mixes audio without an audio device. Audio is only mixed when advance
+    is called, which moves a virtual clock forward, so the mixed audio
+    doesn't depend on how fast the game runs. The mixed audio is written
+    to a wav file, or kept in memory.
+    """
+
+    # The number of samples mixed at once, like the buffer of an audio
+    # device.
+    chunk = 2048
+
+    def __init__(self, filename=None):
+
+        # The file the audio is written to, or None to keep it in memory.
+        self.filename = filename
+
+        # The wave file being written, if it's open.
+        self.wave = None
+
+        # If filename is None, a list of strings of mixed audio.
+        self.data = [ ]
+
+        # The number of samples that have been mixed.
+        self.samples = 0
+
+        # The number of seconds spent mixing.
+        self.mix_time = 0.0
+
+    def get_time(self):
+        """
+        Returns the virtual time, the number of seconds of audio that have
+        been mixed.
+        """
+
+        return 1.0 * self.samples / renpy.config.sound_sample_rate
+
+    def advance(self, seconds):
+        """
+        Mixes the next `seconds` seconds of audio.
+        """
+
+        if not pcm_ok:
+            return
+
+        end = int(round((self.get_time() + seconds) * renpy.config.sound_sample_rate))
+
+        with lock:
+
+            if (self.filename is not None) and (self.wave is None):
+                self.wave = wave.open(self.filename, "wb")
+                self.wave.setnchannels(2)
+                self.wave.setsampwidth(2)
+                self.wave.setframerate(renpy.config.sound_sample_rate)
+
+            while self.samples < end:
+
+                for c in all_channels:
+                    c.get_context()
+
+                periodic_pass()
+
+                n = min(self.chunk, end - self.samples)
+
+                start = time.time()
+                data = renpysound.mix(n)
+                self.mix_time += time.time() - start
+
+                if self.wave is not None:
+                    self.wave.writeframes(data)
+                else:
+                    self.data.append(data)
+
+                self.samples += n
+
+    def get_data(self):
+        """
+        Returns the audio that's been mixed and kept in memory, as a string
+        of 16-bit stereo samples.
+        """
+
+        return b"".join(self.data)
+
+    def report(self):
+        """
+        Returns a list of (channel name, decode time, mix time, samples)
+        tuples, giving the number of seconds spent decoding and mixing each
+        channel that has been used, and the number of samples mixed. This is
+        also written to profile_audio.txt.
+        """
+
+        rv = [ ]
+
+        if not pcm_ok:
+            return rv
+
+        log = renpy.log.open("profile_audio", developer=True, append=False, flush=False)
+        log.write("Mixed %.3f seconds of audio in %.3f seconds.", self.get_time(), self.mix_time)
+
+        for c in all_channels:
+
+            if c._number is None:
+                continue
+
+            decode, mix, samples = renpysound.get_mix_stats(c._number)
+
+            log.write("%s: decode %.3f ms, mix %.3f ms, %d samples", c.name, decode * 1000, mix * 1000, samples)
+            rv.append((c.name, decode, mix, samples))
+
+        return rv
+
+    def close(self):
+        """
+        Reports the cost of mixing, and closes the wav file.
+        """
+
+        self.report()
+
+        if self.wave is not None:
+            self.wave.close()
+            self.wave = None
+
+        # Audio mixed after this point is kept in memory, rather than
+        # reopening and overwriting the file.
+        self.filename = None
+
+
+def set_offline(filename=None):
+    """
+    Causes audio to be mixed offline, with a virtual clock, rather than
+    being played through an audio device. This must be called before
+    the audio system is initialized. If `filename` is given, the mixed
+    audio is written to it, as a wav file.
+
+    Returns the OfflineMixer, which is also available as
+    renpy.audio.audio.offline.
+    """
+
+    global offline
+
+    offline = OfflineMixer(filename)
+    return offline
+
+
 class QueueEntry(object):
     """
     A queue entry object.
@@ -319,6 +624,18 @@ class Channel(object):
 
         return fn, start, end
 
+    def predict(self, filename):
+        """
+        Called to predict that `filename` will soon be played on this
+        channel.
+        """
+
+        if self.movie:
+            return
+
+        filename, _start, _end = self.split_filename(filename, False)
+        pcm_cache.predict(self.file_prefix + filename + self.file_suffix)
+
     def periodic(self):
         """
         This is the periodic call that causes this channel to load new stuff
@@ -406,14 +723,24 @@ class Channel(object):
                 if (end >= 0) and ((end - start) <= 0) and self.queue:
                     continue
 
-                topf = load(self.file_prefix + filename + self.file_suffix)
+                fn = self.file_prefix + filename + self.file_suffix
+
+                if not self.movie:
+                    pcm = pcm_cache.get(fn)
+                else:
+                    pcm = None
+
+                if pcm is None:
+                    topf = load(fn)
+                else:
+                    topf = None
 
                 renpysound.set_video(self.number, self.movie)
 
                 if depth == 0:
-                    renpysound.play(self.number, topf, topq.filename, paused=self.synchro_start, fadein=topq.fadein, tight=topq.tight, start=start, end=end)
+                    renpysound.play(self.number, topf, topq.filename, paused=self.synchro_start, fadein=topq.fadein, tight=topq.tight, start=start, end=end, pcm=pcm)
                 else:
-                    renpysound.queue(self.number, topf, topq.filename, fadein=topq.fadein, tight=topq.tight, start=start, end=end)
+                    renpysound.queue(self.number, topf, topq.filename, fadein=topq.fadein, tight=topq.tight, start=start, end=end, pcm=pcm)
 
                 self.playing = True
 
@@ -798,8 +1125,11 @@ def init():
             bufsize = int(os.environ['RENPY_SOUND_BUFSIZE'])
 
         try:
-            renpysound.init(renpy.config.sound_sample_rate, 2, bufsize, False)
+            renpysound.init(renpy.config.sound_sample_rate, 2, bufsize, False, offline=(offline is not None))
             pcm_ok = True
+
+            if renpy.config.audio_cache_size > 0:
+                pcm_cache.start()
         except:
             if renpy.config.debug_sound:
                 raise
@@ -857,6 +1187,11 @@ def quit():  # @ReservedAssignment
         c.wait_stop = False
         c.synchro_start = False
 
+    pcm_cache.stop()
+
+    if offline is not None:
+        offline.close()
+
     renpysound.quit()
 
     pcm_ok = None
@@ -982,6 +1317,11 @@ def periodic():
     global periodic_exc
     global run_periodic
 
+    # When mixing offline, the OfflineMixer calls periodic_pass as the
+    # virtual clock advances.
+    if offline is not None:
+        return
+
     if not renpy.config.audio_periodic_thread:
         periodic_pass()
         return
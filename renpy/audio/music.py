@@ -225,6 +225,42 @@ def playable(filename, channel="music"):
     return renpy.loader.loadable(c.file_prefix + filename + c.file_suffix)
 
 
+def predict(filenames, channel="music"):
+    """
+    Predicts that `filenames` will soon be played on `channel`, so that
+    short files can be decoded ahead of time.
+    """
+
+    # Predicting is only useful when decoded audio is cached, and is done
+    # for every predicted button, so return before taking the lock when
+    # there's nothing to do.
+    if filenames is None:
+        return
+
+    if not renpy.audio.audio.pcm_cache.enabled():
+        return
+
+    if isinstance(filenames, basestring):
+        filenames = [ filenames ]
+    else:
+        filenames = [ i for i in filenames if i is not None ]
+
+        if not filenames:
+            return
+
+    with renpy.audio.audio.lock:
+
+        try:
+            c = get_channel(channel)
+
+            for fn in filenames:
+                c.predict(fn)
+
+        except:
+            if renpy.config.debug_sound:
+                raise
+
+
 def stop(channel="music", fadeout=None):
     """
     :doc: audio
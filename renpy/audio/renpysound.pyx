@@ -24,8 +24,8 @@ import_pygame_sdl2()
 
 cdef extern from "renpysound_core.h":
 
-    void RPS_play(int channel, SDL_RWops *rw, char *ext, object name, int fadein, int tight, int paused, double start, double end)
-    void RPS_queue(int channel, SDL_RWops *rw, char *ext, object name, int fadein, int tight, double start, double end)
+    void RPS_play(int channel, SDL_RWops *rw, Uint8 *pcm, int pcm_len, char *ext, object name, int fadein, int tight, int paused, double start, double end)
+    void RPS_queue(int channel, SDL_RWops *rw, Uint8 *pcm, int pcm_len, char *ext, object name, int fadein, int tight, double start, double end)
     void RPS_stop(int channel)
     void RPS_dequeue(int channel, int even_tight)
     int RPS_queue_depth(int channel)
@@ -41,13 +41,17 @@ cdef extern from "renpysound_core.h":
     void RPS_set_pan(int channel, float pan, float delay)
     void RPS_set_secondary_volume(int channel, float vol2, float delay)
 
+    object RPS_decode(SDL_RWops *rw, char *ext, double max_duration)
+    object RPS_mix(int length)
+    object RPS_get_mix_stats(int channel)
+
     void RPS_advance_time()
     int RPS_video_ready(int channel)
     object RPS_read_video(int channel)
     void RPS_set_video(int channel, int video)
 
     void RPS_sample_surfaces(object, object)
-    void RPS_init(int freq, int stereo, int samples, int status)
+    void RPS_init(int freq, int stereo, int samples, int status, int offline)
     void RPS_quit()
 
     void RPS_periodic()
@@ -60,13 +64,24 @@ def check_error():
     if str(e):
         raise Exception(e)
 
-def play(channel, file, name, paused=False, fadein=0, tight=False, start=0, end=0):
-    cdef SDL_RWops *rw
+def play(channel, file, name, paused=False, fadein=0, tight=False, start=0, end=0, pcm=None):
+    """
+    Plays `file` on `channel`. If `pcm` is given, it's a string returned by
+    decode, which is played instead of file.
+    """
 
-    rw = RWopsFromPython(file)
+    cdef SDL_RWops *rw = NULL
+    cdef char *pcm_data = NULL
+    cdef int pcm_len = 0
 
-    if rw == NULL:
-        raise Exception("Could not create RWops.")
+    if pcm is not None:
+        pcm_data = pcm
+        pcm_len = len(pcm)
+    else:
+        rw = RWopsFromPython(file)
+
+        if rw == NULL:
+            raise Exception("Could not create RWops.")
 
     if paused:
         pause = 1
@@ -79,16 +94,22 @@ def play(channel, file, name, paused=False, fadein=0, tight=False, start=0, end=
         tight = 0
 
     extension = name.encode("utf-8")
-    RPS_play(channel, rw, extension, name, fadein, tight, pause, start, end)
+    RPS_play(channel, rw, <Uint8 *> pcm_data, pcm_len, extension, name, fadein, tight, pause, start, end)
     check_error()
 
-def queue(channel, file, name, fadein=0, tight=False, start=0, end=0):
-    cdef SDL_RWops *rw
+def queue(channel, file, name, fadein=0, tight=False, start=0, end=0, pcm=None):
+    cdef SDL_RWops *rw = NULL
+    cdef char *pcm_data = NULL
+    cdef int pcm_len = 0
 
-    rw = RWopsFromPython(file)
+    if pcm is not None:
+        pcm_data = pcm
+        pcm_len = len(pcm)
+    else:
+        rw = RWopsFromPython(file)
 
-    if rw == NULL:
-        raise Exception("Could not create RWops.")
+        if rw == NULL:
+            raise Exception("Could not create RWops.")
 
     if tight:
         tight = 1
@@ -96,9 +117,26 @@ def queue(channel, file, name, fadein=0, tight=False, start=0, end=0):
         tight = 0
 
     extension = name.encode("utf-8")
-    RPS_queue(channel, rw, extension, name, fadein, tight, start, end)
+    RPS_queue(channel, rw, <Uint8 *> pcm_data, pcm_len, extension, name, fadein, tight, start, end)
     check_error()
 
+def decode(file, name, max_duration):
+    """
+    Decodes the audio in `file`, and returns it as a string that can be
+    given to play or queue. Returns None if the file can't be decoded, or
+    is longer than `max_duration` seconds. This must be called after init.
+    """
+
+    cdef SDL_RWops *rw
+
+    rw = RWopsFromPython(file)
+
+    if rw == NULL:
+        raise Exception("Could not create RWops.")
+
+    extension = name.encode("utf-8")
+    return RPS_decode(rw, extension, max_duration)
+
 def stop(channel):
     RPS_stop(channel)
     check_error()
@@ -182,14 +220,45 @@ def set_video(channel, video):
     else:
         RPS_set_video(channel, 0)
 
-def init(freq, stereo, samples, status=False):
+def init(freq, stereo, samples, status=False, offline=False):
+    """
+    Initializes the audio system. If `offline` is true, no audio device is
+    opened, and audio is only mixed when mix is called.
+    """
+
     if status:
         status = 1
     else:
         status = 0
 
-    RPS_init(freq, stereo, samples, status)
+    if offline:
+        offline = 1
+    else:
+        offline = 0
+
+    RPS_init(freq, stereo, samples, status, offline)
+    check_error()
+
+def mix(samples):
+    """
+    When mixing offline, mixes the next `samples` samples of audio, and
+    returns them as a string of 16-bit stereo samples.
+    """
+
+    rv = RPS_mix(samples * 4)
+    check_error()
+    return rv
+
+def get_mix_stats(channel):
+    """
+    When mixing offline, returns a (decode time, mix time, samples) tuple,
+    where the times are the number of seconds spent decoding and mixing
+    `channel`, and samples is the number of samples mixed.
+    """
+
+    rv = RPS_get_mix_stats(channel)
     check_error()
+    return rv
 
 def quit(): # @ReservedAssignment
     RPS_quit()
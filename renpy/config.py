@@ -62,6 +62,10 @@ rollback_enabled = True
 # If the rollback is longer than this, we may trim it.
 rollback_length = 128
 
+# If not None, rollback entries older than this many of the most recent
+# entries are compressed in memory.
+rollback_compression_length = None
+
 # If set to True, clicking while in rollback will keep the roll forward
 # buffer if the data has not changed.
 keep_rollback_data = False
@@ -95,6 +99,20 @@ image_cache_size = None
 # The size of the image cache, in megabytes.
 image_cache_size_mb = 300
 
+# The maximum size of the on-disk cache of decoded images, in megabytes,
+# or None to disable the on-disk cache.
+image_disk_cache_size_mb = None
+
+# The number of threads used to decode images that are being preloaded.
+# If 0, images are decoded by the preload thread itself.
+image_decode_threads = 0
+
+# The number of threads the software pixel kernels (used by image
+# manipulators and the software renderer) may split an image between, and
+# the number of pixels an operation must cover before it is split.
+pixel_threads = 1
+pixel_thread_threshold = 256 * 256
+
 # The number of statements we will analyze when doing predictive
 # loading. Please note that this is a total number of statements in a
 # BFS along all paths, rather than the depth along any particular
@@ -601,6 +619,14 @@ drawable_resolution_text = bool(int(os.environ.get("RENPY_DRAWABLE_RESOLUTION_TE
 # Should we fill the virtual-resolution text box?
 draw_virtual_text_box = bool(int(os.environ.get("RENPY_DRAW_VIRTUAL_TEXT_BOX", "0")))
 
+# The size of the cache of text layouts that is shared between Text
+# displayables and kept across interactions, in megabytes.
+text_layout_cache_size_mb = 32
+
+# The size of the atlas that rendered glyphs are cached in, in megabytes.
+# If 0 or None, the atlas isn't used.
+glyph_cache_size_mb = 0
+
 # Bindings of gamepad buttons.
 pad_bindings = { }
 
@@ -754,6 +780,17 @@ line_log_callbacks = [ ]
 # A list of screens for which screen profiling should be enabled.
 profile_screens = [ ]
 
+# Should screen language screens be compiled to Python code?
+compile_screens = False
+
+# Should the state after init be saved, and restored on later launches
+# instead of running the init code?
+init_snapshot = False
+
+# Should non-constant screen language displayables be reused when the
+# variables they depend on have not changed?
+track_screen_dependencies = False
+
 # Should Ren'Py search for system fonts.
 allow_sysfonts = False
 
@@ -805,6 +842,14 @@ fast_skipping_callbacks = [ ]
 # Should the audio periodic callback run in its own thread.
 audio_periodic_thread = True
 
+# The maximum amount of decoded audio kept in the audio cache, in bytes. If
+# 0, the audio cache is disabled.
+audio_cache_size = 0
+
+# Files with audio shorter than this many seconds are decoded and placed
+# in the audio cache.
+audio_cache_max_length = 2.0
+
 # A list of fonts to preload on Ren'Py startup.
 preload_fonts = [ ]
 
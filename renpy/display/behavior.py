@@ -706,6 +706,12 @@ class Button(renpy.display.layout.Window):
     def _duplicate(self, args):
         return self
 
+    def predict_one(self):
+        super(Button, self).predict_one()
+
+        renpy.audio.music.predict(self.style.hover_sound, channel=renpy.config.play_channel)
+        renpy.audio.music.predict(self.style.activate_sound, channel=renpy.config.play_channel)
+
     def predict_one_action(self):
         predict_action(self.clicked)
         predict_action(self.hovered)
@@ -2029,20 +2029,33 @@ class Interface(object):
 
     def draw_screen(self, root_widget, fullscreen_video, draw):
 
+        renpy.performance.begin("update")
+
         try:
             renpy.display.render.per_frame = True
             renpy.display.screen.per_frame()
         finally:
             renpy.display.render.per_frame = False
+            renpy.performance.end("update")
+
+        renpy.performance.begin("render")
 
-        surftree = renpy.display.render.render_screen(
-            root_widget,
-            renpy.config.screen_width,
-            renpy.config.screen_height,
-            )
+        try:
+            surftree = renpy.display.render.render_screen(
+                root_widget,
+                renpy.config.screen_width,
+                renpy.config.screen_height,
+                )
+        finally:
+            renpy.performance.end("render")
 
         if draw:
-            renpy.display.draw.draw_screen(surftree, fullscreen_video)
+            renpy.performance.begin("draw")
+
+            try:
+                renpy.display.draw.draw_screen(surftree, fullscreen_video)
+            finally:
+                renpy.performance.end("draw")
 
         now = time.time()
 
@@ -2674,20 +2687,25 @@ class Interface(object):
 
         if count[0] >= renpy.config.idle_gc_count:
             renpy.plog(2, "before gc")
+            renpy.performance.begin("gc")
 
-            if count[2] >= renpy.config.gc_thresholds[2]:
-                gen = 2
-            elif count[1] >= renpy.config.gc_thresholds[1]:
-                gen = 1
-            else:
-                gen = 0
+            try:
+
+                if count[2] >= renpy.config.gc_thresholds[2]:
+                    gen = 2
+                elif count[1] >= renpy.config.gc_thresholds[1]:
+                    gen = 1
+                else:
+                    gen = 0
 
-            gc.collect(gen)
+                gc.collect(gen)
 
-            if gc.garbage:
-                renpy.memory.print_garbage(gen)
-                gc.garbage[:] = [ ]
+                if gc.garbage:
+                    renpy.memory.print_garbage(gen)
+                    gc.garbage[:] = [ ]
 
+            finally:
+                renpy.performance.end("gc")
             renpy.plog(2, "after gc")
 
     def idle_frame(self, can_block, expensive):
@@ -2732,12 +2750,16 @@ class Interface(object):
                     step += 1
                     continue
 
+                renpy.performance.begin("predict")
+
                 try:
                     result = self.prediction_coroutine.send(expensive)
                 except ValueError:
                     # Saw this happen once during a quit, giving a
                     # ValueError: generator already executing
                     result = None
+                finally:
+                    renpy.performance.end("predict")
 
                 if result is None:
                     self.prediction_coroutine = None
@@ -2915,11 +2937,16 @@ class Interface(object):
         renpy.plog(1, "computed scene")
 
         # If necessary, load all images here.
-        for w in scene.itervalues():
-            try:
-                renpy.display.predict.displayable(w)
-            except:
-                pass
+        renpy.performance.begin("predict")
+
+        try:
+            for w in scene.itervalues():
+                try:
+                    renpy.display.predict.displayable(w)
+                except:
+                    pass
+        finally:
+            renpy.performance.end("predict")
 
         renpy.plog(1, "final predict")
 
@@ -3132,6 +3159,8 @@ class Interface(object):
                     frame += 1
                     renpy.config.frames += 1
 
+                    renpy.performance.frame()
+
                     # If profiling is enabled, report the profile time.
                     if renpy.config.profile or self.profile_once:
 
@@ -3425,6 +3454,8 @@ class Interface(object):
 
                 self.event_time = end_time = get_time()
 
+                renpy.performance.begin("event")
+
                 try:
 
                     if self.touch:
@@ -3459,6 +3490,9 @@ class Interface(object):
                     if ev.type != TIMEEVENT:
                         self.post_time_event()
 
+                finally:
+                    renpy.performance.end("event")
+
                 # Check again after handling the event.
                 needs_redraw |= renpy.display.render.process_redraws()
 
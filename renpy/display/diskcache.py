@@ -0,0 +1,268 @@
+# Copyright 2004-2018 Tom Rothamel <pytom@bishoujo.us>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# This file contains the disk cache, which stores the surfaces produced by
+# images and image manipulators on disk, so that the next time the game is
+# run, they can be read back in rather than being decoded and processed
+# again.
+
+from __future__ import print_function
+
+import renpy.display
+
+import os
+import struct
+import hashlib
+import threading
+import collections
+
+import pygame_sdl2 as pygame
+
+# The directory, relative to the game directory, the cache is stored in.
+DIRECTORY = "cache/images"
+
+# The extension of cache files.
+EXTENSION = ".rpyi"
+
+# The header at the start of each cache file. This is followed by
+# width * height * 4 bytes of RGBA pixel data.
+HEADER = struct.Struct("<4sII")
+
+# The magic number in the header.
+MAGIC = b"RPI1"
+
+
+class DiskCache(object):
+    """
+    The disk cache. Each entry is a file named after a hash of the image's
+    identity and the hash of the files it's loaded from, containing the
+    image's pixels as uncompressed RGBA, so it can be read into a surface
+    without being decoded.
+    """
+
+    def __init__(self):
+
+        # The directory the cache is stored in, or None if the disk cache
+        # is disabled.
+        self.directory = None
+
+        # The maximum size of the cache, in bytes.
+        self.limit = 0
+
+        # A map from key to the size of the entry's file, ordered from the
+        # least to the most recently used entry.
+        self.entries = collections.OrderedDict()
+
+        # The total size of the files in the cache.
+        self.total_size = 0
+
+        # A lock that must be held when accessing entries.
+        self.lock = threading.RLock()
+
+    def init(self):
+        """
+        Enables the disk cache if config.image_disk_cache_size_mb is set, and
+        scans the cache directory to find the existing entries.
+        """
+
+        self.directory = None
+        self.entries.clear()
+        self.total_size = 0
+
+        if renpy.config.image_disk_cache_size_mb is None:
+            return
+
+        self.limit = int(renpy.config.image_disk_cache_size_mb * 1024 * 1024)
+
+        directory = renpy.loader.get_path(DIRECTORY + "/")
+
+        if not os.path.isdir(directory):
+            return
+
+        self.directory = directory
+
+        files = [ ]
+
+        for fn in os.listdir(directory):
+            if not fn.endswith(EXTENSION):
+                continue
+
+            try:
+                st = os.stat(os.path.join(directory, fn))
+            except:
+                continue
+
+            files.append((st.st_mtime, fn[:-len(EXTENSION)], st.st_size))
+
+        files.sort()
+
+        with self.lock:
+            for _mtime, key, size in files:
+                self.entries[key] = size
+                self.total_size += size
+
+            self.evict()
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def key(self, image):
+        """
+        Returns the key used to store `image`, or None if the image can't
+        be stored.
+        """
+
+        try:
+            h = image.get_hash()
+        except:
+            return None
+
+        ident = repr(image)
+
+        # Objects without a repr of their own have an address in their
+        # repr, which changes from run to run.
+        if " at 0x" in ident:
+            return None
+
+        if isinstance(ident, unicode):
+            ident = ident.encode("utf-8")
+
+        return hashlib.md5(ident + "\0" + str(h)).hexdigest()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits within
+        its limit. This must be called with the lock held.
+        """
+
+        while self.entries and self.total_size > self.limit:
+            key, size = self.entries.popitem(last=False)
+            self.total_size -= size
+
+            try:
+                os.unlink(self.filename(key))
+            except:
+                pass
+
+    def load(self, image):
+        """
+        Returns a surface containing `image`, or None if the image is not in
+        the cache.
+        """
+
+        if self.directory is None:
+            return None
+
+        key = self.key(image)
+
+        if key is None:
+            return None
+
+        with self.lock:
+            size = self.entries.pop(key, None)
+
+            if size is None:
+                return None
+
+            self.entries[key] = size
+
+        fn = self.filename(key)
+
+        try:
+            with open(fn, "rb") as f:
+                magic, width, height = HEADER.unpack(f.read(HEADER.size))
+
+                if magic != MAGIC:
+                    raise Exception("Bad image cache file.")
+
+                pixels = f.read()
+
+            if len(pixels) != width * height * 4:
+                raise Exception("Bad image cache file.")
+
+            surf = pygame.image.fromstring(pixels, (width, height), "RGBA")
+
+            os.utime(fn, None)
+
+        except:
+
+            with self.lock:
+                if self.entries.pop(key, None) is not None:
+                    self.total_size -= size
+
+            try:
+                os.unlink(fn)
+            except:
+                pass
+
+            return None
+
+        renpy.performance.stat("image_disk_cache.hits")
+
+        return renpy.display.pgrender.copy_surface_unscaled(surf)
+
+    def save(self, image, surf):
+        """
+        Stores `surf`, the result of loading `image`, in the cache.
+        """
+
+        if self.directory is None:
+            return
+
+        key = self.key(image)
+
+        if key is None:
+            return
+
+        width, height = surf.get_size()
+        size = HEADER.size + width * height * 4
+
+        if size > self.limit:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                return
+
+        fn = self.filename(key)
+        tmp = fn + ".new"
+
+        try:
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, width, height))
+                f.write(pygame.image.tostring(surf, "RGBA"))
+
+            if os.path.exists(fn):
+                os.unlink(fn)
+
+            os.rename(tmp, fn)
+
+        except:
+            return
+
+        renpy.performance.stat("image_disk_cache.writes")
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = size
+                self.total_size += size
+
+            self.evict()
@@ -32,6 +32,9 @@ import cStringIO
 import threading
 import time
 import io
+import collections
+import itertools
+import Queue
 
 
 # This is an entry in the image cache.
@@ -60,6 +63,10 @@ class CacheEntry(object):
         # The time when this cache entry was last used.
         self.time = 0
 
+        # The size of this entry, as included in the total size of the
+        # cache.
+        self.counted_size = 0
+
     def size(self):
         rv = 0
 
@@ -83,11 +90,47 @@ class Cache(object):
         # interaction.)
         self.time = 0
 
-        # A map from Image object to CacheEntry.
-        self.cache = { }
+        # A map from Image object to CacheEntry. This is ordered from the
+        # least to the most recently used entry, and must only be changed
+        # while holding self.lock.
+        self.cache = collections.OrderedDict()
+
+        # The total size of the entries in the cache, in pixels.
+        self.total_size = 0
+
+        # Counters of cache activity in the current tick, and the counters
+        # from the last complete tick.
+        self.counters = self.new_counters()
+        self.last_counters = self.new_counters()
+
+        # A queue of Image objects that we want to preload, in the order
+        # they were predicted.
+        self.preloads = collections.deque()
+
+        # Incremented each time the preloads are reset, so requests from
+        # before the reset can be recognized as stale.
+        self.preload_generation = 0
+
+        # The threads that decode images for the preload thread, and the
+        # queue of (generation, image) requests they take work from.
+        self.decode_threads = [ ]
+        self.decode_queue = Queue.Queue()
+
+        # A lock that must be held when accessing decoding and decoded.
+        self.decode_lock = threading.Condition()
+
+        # The set of images submitted to the decode threads that haven't
+        # been decoded yet.
+        self.decoding = set()
 
-        # A list of Image objects that we want to preload.
-        self.preloads = [ ]
+        # A map from image to the surface a decode thread decoded for it.
+        self.decoded = { }
+
+        # The worker field of this is True in the decode threads.
+        self.decode_local = threading.local()
+
+        # The cache of images stored on disk.
+        self.disk_cache = renpy.display.diskcache.DiskCache()
 
         # False if this is not the first preload in this tick.
         self.first_preload_in_tick = True
@@ -128,21 +171,26 @@ class Cache(object):
         # This is only updated when config.developer is True.
         self.load_log = [ ]
 
+    def new_counters(self):
+        return dict(hits=0, misses=0, evictions=0, evicted_size=0, preloaded=0, preload_time=0.0)
+
+    def get_counters(self):
+        """
+        Returns a dict giving the number of hits, misses, and evictions, the
+        total size (in pixels) of the evicted entries, the number of images
+        preloaded, and the wall-clock time spent preloading them, during the
+        last complete tick.
+        """
+
+        return dict(self.last_counters)
+
     def get_total_size(self):
         """
         Returns the total size of the surfaces and textures that make up the
         cache, in pixels.
         """
 
-        rv = sum(i.size() for i in self.cache.values())
-
-#         print("Total cache size: {:.1f}/{:.1f} MB (Textures {:.1f} MB)".format(
-#             4.0 * rv / 1024 / 1024,
-#             4.0 * self.cache_limit / 1024 / 1024,
-#             1.0 * renpy.exports.get_texture_size()[0] / 1024 / 1024,
-#             ))
-
-        return rv
+        return self.total_size
 
     def get_current_size(self, generations):
         """
@@ -152,9 +200,48 @@ class Cache(object):
 
         start = self.time - generations
 
-        rv = sum(i.size() for i in self.cache.values() if i.time > start)
+        rv = 0
+
+        with self.lock:
+            for image in reversed(self.cache):
+                ce = self.cache[image]
+
+                if ce.time <= start:
+                    break
+
+                rv += ce.counted_size
+
         return rv
 
+    def update_size(self, ce):
+        """
+        Updates the total size of the cache to reflect changes to the size
+        of `ce`. This must be called with the lock held.
+        """
+
+        if self.cache.get(ce.what, None) is not ce:
+            return
+
+        size = ce.size()
+        self.total_size += size - ce.counted_size
+        ce.counted_size = size
+
+    def touch(self, ce):
+        """
+        Marks `ce` as used in the current generation, moving it to the
+        most recently used end of the cache.
+        """
+
+        if ce.time == self.time:
+            return
+
+        with self.lock:
+            ce.time = self.time
+
+            if self.cache.get(ce.what, None) is ce:
+                del self.cache[ce.what]
+                self.cache[ce.what] = ce
+
     def init(self):
         """
         Updates the cache object to make use of settings that might be provided
@@ -166,7 +253,27 @@ class Cache(object):
         else:
             self.cache_limit = int(renpy.config.image_cache_size_mb * 1024 * 1024 // 4)
 
+        self.disk_cache.init()
+
+        renpy.display.module.band_parallel(renpy.config.pixel_threads, renpy.config.pixel_thread_threshold)
+
+        while len(self.decode_threads) < renpy.config.image_decode_threads:
+            t = threading.Thread(target=self.decode_thread_main, name="decoder")
+            t.setDaemon(True)
+            t.start()
+
+            self.decode_threads.append(t)
+
     def quit(self):  # @ReservedAssignment
+
+        for _i in self.decode_threads:
+            self.decode_queue.put((None, None))
+
+        for i in self.decode_threads:
+            i.join()
+
+        self.decode_threads = [ ]
+
         if not self.preload_thread.isAlive():
             return
 
@@ -178,14 +285,27 @@ class Cache(object):
 
         self.clear()
 
+    def reset_preloads(self):
+        """
+        Empties the preload queue, and marks the requests given to the
+        decode threads as stale, so they're skipped or discarded.
+        """
+
+        self.preloads = collections.deque()
+        self.preload_generation += 1
+
+        with self.decode_lock:
+            self.decoded.clear()
+
     # Clears out the cache.
     def clear(self):
 
         self.lock.acquire()
 
-        self.preloads = [ ]
+        self.reset_preloads()
         self.pin_cache = { }
-        self.cache = { }
+        self.cache = collections.OrderedDict()
+        self.total_size = 0
         self.first_preload_in_tick = True
 
         self.added.clear()
@@ -198,10 +318,13 @@ class Cache(object):
 
         with self.lock:
             self.time += 1
-            self.preloads = [ ]
+            self.reset_preloads()
             self.first_preload_in_tick = True
             self.added.clear()
 
+            self.last_counters = self.counters
+            self.counters = self.new_counters()
+
         if renpy.config.debug_image_cache:
             renpy.display.ic_log.write("----")
             filename, line = renpy.exports.get_filename_line()
@@ -210,7 +333,7 @@ class Cache(object):
     # The preload thread can deal with this update, so we don't need
     # to lock things.
     def end_tick(self):
-        self.preloads = [ ]
+        self.reset_preloads()
 
     # This returns the pygame surface corresponding to the provided
     # image. It also takes care of updating the age of images in the
@@ -236,10 +359,13 @@ class Cache(object):
 
         if ce is not None:
 
-            ce.time = self.time
+            self.touch(ce)
 
             if texture and (ce.texture is not None):
 
+                with self.lock:
+                    self.counters["hits"] += 1
+
                 if predict:
                     return None
 
@@ -252,20 +378,35 @@ class Cache(object):
 
             if ce.surf is None:
                 ce = None
+            else:
+                with self.lock:
+                    self.counters["hits"] += 1
 
         # Otherwise, we load the image ourselves.
         if ce is None:
 
+            with self.lock:
+                self.counters["misses"] += 1
+
             try:
+                surf = None
+
                 if image in self.pin_cache:
                     surf = self.pin_cache[image]
-                else:
+                elif self.decode_threads and not getattr(self.decode_local, "worker", False):
+
+                    # A decode thread loads the children of image
+                    # manipulators itself, as waiting for a decode queued
+                    # behind the one it's working on would deadlock.
+                    surf = self.take_decoded(image)
+
+                if surf is None:
 
                     if not predict:
                         with renpy.game.ExceptionInfo("While loading %r:", image):
-                            surf = image.load()
+                            surf = self.load(image)
                     else:
-                        surf = image.load()
+                        surf = self.load(image)
 
             except:
                 raise
@@ -281,8 +422,15 @@ class Cache(object):
 
             with self.lock:
 
+                old_ce = self.cache.pop(image, None)
+                if old_ce is not None:
+                    self.total_size -= old_ce.counted_size
+                    old_ce.counted_size = 0
+
                 ce = CacheEntry(image, surf, bounds)
+                ce.time = self.time
                 self.cache[image] = ce
+                self.update_size(ce)
 
                 # Indicate that this surface had changed.
                 renpy.display.render.mutated_surface(ce.surf)
@@ -295,7 +443,7 @@ class Cache(object):
 
         # Move it into the current generation.
 
-        ce.time = self.time
+        self.touch(ce)
 
         # Load the texture.
 
@@ -311,6 +459,9 @@ class Cache(object):
 
                 ce.texture = renpy.display.draw.load_texture(texsurf)
 
+                with self.lock:
+                    self.update_size(ce)
+
             if not predict:
                 if render:
                     rv = renpy.display.render.Render(ce.width, ce.height)
@@ -330,6 +481,9 @@ class Cache(object):
 
             ce.surf = None
 
+            with self.lock:
+                self.update_size(ce)
+
         if (ce.surf is None) and (ce.texture is None):
             with self.lock:
                 self.kill(ce)
@@ -344,8 +498,17 @@ class Cache(object):
         if ce.surf is not None:
             renpy.display.draw.mutated_surface(ce.surf)
 
+        # Another thread may have replaced ce, or cleared the cache, since
+        # ce was looked up. In that case, its size is no longer counted,
+        # and the entry under its key isn't ours to remove.
+        if self.cache.get(ce.what, None) is not ce:
+            return
+
         del self.cache[ce.what]
 
+        self.total_size -= ce.counted_size
+        ce.counted_size = 0
+
         if renpy.config.debug_image_cache:
             renpy.display.ic_log.write("Removed %r", ce.what)
 
@@ -356,27 +519,25 @@ class Cache(object):
         bigger and we don't want to continue preloading.
         """
 
-        # If we're within the limit, return.
-        if self.get_total_size() <= self.cache_limit:
-            return True
-
         # If we're outside the cache limit, we need to go and start
-        # killing off some of the entries until we're back inside it.
+        # killing off the least recently used entries until we're back
+        # inside it.
+
+        while self.total_size > self.cache_limit:
 
-        for ce in sorted(self.cache.itervalues(), key=lambda a : a.time):
+            ce = next(self.cache.itervalues())
 
             if ce.time == self.time:
                 # If we're bigger than the limit, and there's nothing
                 # to remove, we should stop the preloading right away.
                 return False
 
+            self.counters["evictions"] += 1
+            self.counters["evicted_size"] += ce.counted_size
+
             # Otherwise, kill off the given cache entry.
             self.kill(ce)
 
-            # If we're in the limit, we're done.
-            if self.get_total_size() <= self.cache_limit:
-                break
-
         return True
 
     def preload_texture(self, im):
@@ -412,6 +573,8 @@ class Cache(object):
 
             if ce and ce.texture:
                 ce.time = self.time
+                del self.cache[im]
+                self.cache[im] = ce
                 in_cache = True
             else:
                 self.preloads.append(im)
@@ -434,6 +597,91 @@ class Cache(object):
         with self.preload_lock:
             self.preload_lock.notify()
 
+    def load(self, image):
+        """
+        Loads `image`, taking it from the disk cache if it's there, and
+        adding it to the disk cache if it isn't.
+        """
+
+        rv = self.disk_cache.load(image)
+
+        if rv is None:
+            rv = image.load()
+            self.disk_cache.save(image, rv)
+
+        return rv
+
+    def submit_decodes(self):
+        """
+        Submits the images at the front of the preload queue to the decode
+        threads, so they're decoded in parallel ahead of when the preload
+        thread needs them.
+        """
+
+        if not self.decode_threads:
+            return
+
+        with self.lock:
+
+            for image in itertools.islice(self.preloads, 0, 2 * len(self.decode_threads)):
+
+                if image in self.preload_blacklist:
+                    continue
+
+                if image in self.cache:
+                    continue
+
+                with self.decode_lock:
+                    if (image in self.decoding) or (image in self.decoded):
+                        continue
+
+                    self.decoding.add(image)
+
+                self.decode_queue.put((self.preload_generation, image))
+
+    def take_decoded(self, image):
+        """
+        Returns the surface a decode thread decoded for `image`, waiting
+        for it if the image is being decoded. Returns None if the image
+        hasn't been decoded.
+        """
+
+        with self.decode_lock:
+
+            while image in self.decoding:
+                self.decode_lock.wait()
+
+            return self.decoded.pop(image, None)
+
+    def decode_thread_main(self):
+
+        self.decode_local.worker = True
+
+        while True:
+
+            generation, image = self.decode_queue.get()
+
+            if image is None:
+                return
+
+            surf = None
+
+            if generation == self.preload_generation:
+                try:
+                    surf = self.load(image)
+                except:
+                    # The preload thread will load the image itself, and
+                    # report the error.
+                    pass
+
+            with self.decode_lock:
+                self.decoding.discard(image)
+
+                if (surf is not None) and (generation == self.preload_generation):
+                    self.decoded[image] = surf
+
+                self.decode_lock.notify_all()
+
     def preload_thread_main(self):
 
         while self.keep_preloading:
@@ -442,6 +690,9 @@ class Cache(object):
             self.preload_lock.wait()
             self.preload_lock.release()
 
+            start = time.time()
+            preloaded = 0
+
             while self.preloads and self.keep_preloading:
 
                 # If the size of the current generation is bigger than the
@@ -455,16 +706,19 @@ class Cache(object):
                             for i in self.preloads:
                                 renpy.display.ic_log.write("Overfull %r", i)
 
-                        self.preloads = [ ]
+                        self.reset_preloads()
 
                         break
 
+                self.submit_decodes()
+
                 try:
-                    image = self.preloads.pop(0)
+                    image = self.preloads.popleft()
 
                     if image not in self.preload_blacklist:
                         try:
                             self.preload_texture(image)
+                            preloaded += 1
                         except:
                             self.preload_blacklist.add(image)
                 except:
@@ -473,6 +727,13 @@ class Cache(object):
             with self.lock:
                 self.cleanout()
 
+                if preloaded:
+                    self.counters["preloaded"] += preloaded
+                    self.counters["preload_time"] += time.time() - start
+
+            if preloaded and renpy.config.debug_image_cache:
+                renpy.display.ic_log.write("Preloaded %d images in %.1f ms", preloaded, (time.time() - start) * 1000)
+
             # If we have time, preload pinned images.
             if self.keep_preloading and not renpy.game.less_memory:
 
@@ -41,6 +41,132 @@ image_attributes = collections.defaultdict(list)
 image_names = [ ]
 
 
+class AttributeIndex(object):
+    """
+    An index of the attribute tuples for a single tag, as stored in
+    image_attributes, that allows the images with a given set of
+    attributes to be found with bitset operations. Bit i of a bitset
+    corresponds to the i-th entry in the list of attribute tuples.
+    """
+
+    def __init__(self, attributes):
+
+        # The list of attribute tuples being indexed.
+        self.attributes = attributes
+
+        # A bitset with a bit set for every entry.
+        self.all = 0
+
+        # A map from attribute to a bitset of the entries containing it.
+        self.bits = { }
+
+        # A map from the number of distinct attributes in an entry to a
+        # bitset of the entries with that many attributes.
+        self.lengths = { }
+
+        # A bitset of entries that contain the same attribute more than
+        # once. These are checked attribute by attribute, as the matching
+        # rules count repeated required attributes more than once.
+        self.duplicates = 0
+
+        # The number of entries indexed so far.
+        self.count = 0
+
+        self.update()
+
+    def update(self):
+        """
+        Indexes entries that have been added to the list of attribute
+        tuples since the last update.
+        """
+
+        attributes = self.attributes
+        bits = self.bits
+        lengths = self.lengths
+
+        for i in range(self.count, len(attributes)):
+            attrs = attributes[i]
+            bit = 1 << i
+
+            self.all |= bit
+
+            distinct = set(attrs)
+
+            for a in distinct:
+                bits[a] = bits.get(a, 0) | bit
+
+            lengths[len(distinct)] = lengths.get(len(distinct), 0) | bit
+
+            if len(distinct) != len(attrs):
+                self.duplicates |= bit
+
+        self.count = len(attributes)
+
+    def having(self, attributes):
+        """
+        Returns a bitset of the entries that contain all of `attributes`.
+        """
+
+        rv = self.all
+
+        for a in attributes:
+            rv &= self.bits.get(a, 0)
+
+            if not rv:
+                break
+
+        return rv
+
+    def excluding(self, allowed):
+        """
+        Returns a bitset of the entries that only contain attributes in
+        `allowed`.
+        """
+
+        rv = self.all
+
+        for a, b in self.bits.iteritems():
+            if a not in allowed:
+                rv &= ~b
+
+        return rv
+
+    def entries(self, bitset):
+        """
+        Returns a list of the indexes of the entries in `bitset`, in order.
+        """
+
+        rv = [ ]
+
+        while bitset:
+            low = bitset & -bitset
+            rv.append(low.bit_length() - 1)
+            bitset ^= low
+
+        return rv
+
+
+# A map from tag to the AttributeIndex for that tag.
+attribute_indexes = { }
+
+
+def get_attribute_index(tag):
+    """
+    Returns an up-to-date AttributeIndex for `tag`.
+    """
+
+    attributes = image_attributes[tag]
+
+    rv = attribute_indexes.get(tag, None)
+
+    if (rv is None) or (rv.attributes is not attributes) or (rv.count > len(attributes)):
+        rv = attribute_indexes[tag] = AttributeIndex(attributes)
+    elif rv.count != len(attributes):
+        rv.update()
+
+    return rv
+
+
 def list_images():
     """
     :doc: image_func
@@ -72,19 +198,16 @@ def get_available_image_attributes(tag, attributes=()):
     in that iterable are returned.
     """
 
-    rv = [ ]
-
     if tag not in image_attributes:
-        return rv
+        return [ ]
 
-    for at in image_attributes[tag]:
-        for a in attributes:
-            if a not in at:
-                break
-        else:
-            rv.append(at)
+    index = get_attribute_index(tag)
+    having = index.having(attributes)
 
-    return rv
+    if having == index.all:
+        return list(index.attributes)
+
+    return [ index.attributes[i] for i in index.entries(having) ]
 
 
 def get_tag_method(tag, method):
@@ -822,7 +945,29 @@ class ShownImageInfo(renpy.object.Object):
         # The list of matching images.
         matches = None
 
-        for attrs in image_attributes[tag]:
+        index = get_attribute_index(tag)
+
+        # The entries that have every required attribute, and no attribute
+        # that is neither required nor optional.
+        allowed = set(required)
+        allowed.update(optional)
+
+        candidates = index.having(required) & index.excluding(allowed)
+
+        # Entries with repeated attributes are checked individually.
+        candidates |= index.duplicates
+
+        # Only consider entries of the longest length that match.
+        for length in sorted(index.lengths, reverse=True):
+            if candidates & index.lengths[length] & ~index.duplicates:
+                candidates &= index.lengths[length] | index.duplicates
+                break
+        else:
+            candidates &= index.duplicates
+
+        for n in index.entries(candidates):
+
+            attrs = index.attributes[n]
 
             num_required = 0
 
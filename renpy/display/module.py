@@ -27,6 +27,7 @@ import renpy.display
 import _renpy
 
 import sys
+import time
 
 
 def convert_and_call(function, src, dst, *args):
@@ -255,3 +256,91 @@ def subpixel(src, dst, x, y):
 
     shift = src.get_shifts()[3]
     _renpy.subpixel(src, dst, x, y, shift)
+
+
+def band_parallel(threads, threshold):
+    """
+    Sets the number of threads the 32-bit pixel kernels may split their
+    rows between, and the number of destination pixels a kernel must
+    process before it is split into bands.
+    """
+
+    # Older versions of the _renpy module don't have band-parallel
+    # kernels.
+    if not hasattr(_renpy, "band_parallel"):
+        return
+
+    _renpy.band_parallel(max(threads, 1), threshold)
+
+
+def benchmark(threads=(1, 2, 4), rounds=5):
+    """
+    Times each of the band-parallel pixel kernels at 720p, 1080p, and 4K,
+    with each of the thread counts in `threads`, and writes the results
+    to log.txt. Raises an exception if a thread count produces output
+    that differs from the serial kernel.
+    """
+
+    import random
+
+    amap = "".join(chr(255 - i) for i in range(256))
+    matrix = [ .3, .59, .11, 0, 0, .3, .59, .11, 0, 0, .3, .59, .11, 0, 0, 0, 0, 0, 1, 0 ]
+
+    kernels = [
+        ("scale", lambda a, b, img, dst : bilinear_scale(a, dst, 0, 0, a.get_width() // 2, a.get_height() // 2)),
+        ("transform", lambda a, b, img, dst : transform(a, dst, 10.5, 20.25, 0.8, 0.3, -0.3, 0.8, 1.0, True)),
+        ("blend", lambda a, b, img, dst : blend(a, b, dst, 128)),
+        ("imageblend", lambda a, b, img, dst : imageblend(a, b, dst, img, amap)),
+        ("colormatrix", lambda a, b, img, dst : colormatrix(a, dst, matrix)),
+        ("map", lambda a, b, img, dst : map(a, dst, amap, amap, amap, amap)),
+        ]
+
+    sizes = [ (1280, 720), (1920, 1080), (3840, 2160) ]
+
+    def noise(size):
+        # An odd-length chunk, so that each row is different.
+        chunk = "".join(chr(random.randint(0, 255)) for _i in range(4093))
+        length = size[0] * size[1] * 4
+        data = (chunk * (length // len(chunk) + 1))[:length]
+
+        rv = pygame_sdl2.image.fromstring(data, size, "RGBA")
+        return renpy.display.pgrender.copy_surface(rv)
+
+    try:
+        for size in sizes:
+
+            a = noise(size)
+            b = noise(size)
+            img = noise(size)
+
+            for name, kernel in kernels:
+
+                expected = None
+                results = [ ]
+
+                for t in threads:
+                    band_parallel(t, 0)
+
+                    dst = renpy.display.pgrender.surface(size, True)
+
+                    start = time.time()
+
+                    for _i in range(rounds):
+                        dst.fill((0, 0, 0, 0))
+                        kernel(a, b, img, dst)
+
+                    duration = (time.time() - start) * 1000.0 / rounds
+
+                    data = pygame_sdl2.image.tostring(dst, "RGBA")
+
+                    if expected is None:
+                        expected = data
+                    elif data != expected:
+                        raise Exception("The {} kernel with {} threads did not match the serial kernel.".format(name, t))
+
+                    results.append("{} threads {:.1f} ms".format(t, duration))
+
+                renpy.display.log.write("Kernel benchmark: {} {}x{}: {}.".format(name, size[0], size[1], ", ".join(results)))
+
+    finally:
+        band_parallel(renpy.config.pixel_threads, renpy.config.pixel_thread_threshold)
@@ -21,6 +21,7 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import collections
+import heapq
 import pygame_sdl2 as pygame
 import threading
 import renpy
@@ -37,9 +38,28 @@ blit_lock = threading.Condition()
 # displayable.
 render_cache = collections.defaultdict(dict)
 
-# The queue of redraws. A list of (time, displayable) pairs.
+# The queue of redraws. A heap of (time, serial, displayable) tuples. The
+# serial breaks ties, so displayables are never compared.
 redraw_queue = [ ]
 
+# A map from the id of a displayable to the earliest time a redraw of that
+# displayable is scheduled for. Entries in redraw_queue that don't match
+# this are stale, and are skipped.
+redraw_pending = { }
+
+# Used to give each entry in redraw_queue a unique serial number.
+redraw_serial = 0
+
+# Counters of redraws that were scheduled, coalesced into an earlier
+# redraw of the same displayable, and fired, since the last frame.
+cdef int redraws_scheduled
+cdef int redraws_coalesced
+cdef int redraws_fired
+
+redraws_scheduled = 0
+redraws_coalesced = 0
+redraws_fired = 0
+
 # The render returned from render_screen.
 screen_render = None
 
@@ -278,44 +298,55 @@ def process_redraws():
     need to redraw the screen now, false otherwise.
     """
 
-    global redraw_queue
-
-    redraw_queue.sort()
+    global redraws_scheduled
+    global redraws_coalesced
+    global redraws_fired
 
     now = renpy.display.core.get_time()
     rv = False
 
-    new_redraw_queue = [ ]
-    seen = set()
-
-    for t in redraw_queue:
-        when, d = t
+    while redraw_queue:
+        when, _serial, d = redraw_queue[0]
 
         id_d = id(d)
 
-        if id_d in seen:
+        # Skip stale entries.
+        if redraw_pending.get(id_d, None) != when:
+            heapq.heappop(redraw_queue)
             continue
 
-        seen.add(id_d)
-
+        # Drop redraws of displayables that have left the render cache.
         if id_d not in render_cache:
+            heapq.heappop(redraw_queue)
+            del redraw_pending[id_d]
             continue
 
-        if when <= now:
+        if when > now:
+            break
 
-            # Remove this displayable and all its parents from the
-            # render cache. But don't kill them yet, as that will kill the
-            # children that we want to reuse.
+        heapq.heappop(redraw_queue)
+        del redraw_pending[id_d]
 
-            for v in render_cache[id_d].values():
-                v.kill_cache()
+        # Remove this displayable and all its parents from the
+        # render cache. But don't kill them yet, as that will kill the
+        # children that we want to reuse.
 
-            rv = True
+        for v in render_cache[id_d].values():
+            v.kill_cache()
 
-        else:
-            new_redraw_queue.append(t)
+        redraws_fired += 1
+        rv = True
+
+    if rv:
+        renpy.plog(1, "redraws: {} scheduled, {} coalesced, {} fired", redraws_scheduled, redraws_coalesced, redraws_fired)
 
-    redraw_queue = new_redraw_queue
+        renpy.performance.stat("redraw.scheduled", redraws_scheduled)
+        renpy.performance.stat("redraw.coalesced", redraws_coalesced)
+        renpy.performance.stat("redraw.fired", redraws_fired)
+
+        redraws_scheduled = 0
+        redraws_coalesced = 0
+        redraws_fired = 0
 
     return rv
 
@@ -339,6 +370,10 @@ def redraw(d, when):
     elapsed.
     """
 
+    global redraw_serial
+    global redraws_scheduled
+    global redraws_coalesced
+
     if not renpy.game.interface:
         return
 
@@ -346,7 +381,23 @@ def redraw(d, when):
         invalidate(d)
         return
 
-    redraw_queue.append((when + renpy.game.interface.frame_time, d))
+    when = when + renpy.game.interface.frame_time
+
+    id_d = id(d)
+    pending = redraw_pending.get(id_d, None)
+
+    # An earlier redraw of d is already scheduled, and will cause d to
+    # be rendered again, at which point it can ask for another redraw.
+    if (pending is not None) and (pending <= when):
+        redraws_coalesced += 1
+        return
+
+    redraw_pending[id_d] = when
+
+    redraw_serial += 1
+    heapq.heappush(redraw_queue, (when, redraw_serial, d))
+
+    redraws_scheduled += 1
 
 
 cdef class Matrix2D:
@@ -69,7 +69,10 @@ class ScreenProfile(renpy.object.Object):
 
         `time`
             If true, Ren'Py will log the amount of time it takes to evaluate
-            the screen.
+            the screen. If :var:`config.track_screen_dependencies` is true,
+            Ren'Py also logs how many displayables were reused because the
+            variables they depend on had not changed, and how many were
+            re-evaluated.
 
         `debug`
             If true, Ren'Py will log information as to how screens are
@@ -343,11 +346,15 @@ class ScreenDisplayable(renpy.display.layout.Container):
 
         # The scope associated with this statement. This is passed in
         # as keyword arguments to the displayable.
-        self.scope = renpy.python.RevertableDict(scope)
+        self.scope = renpy.python.RevertableScope(scope)
 
         # The child associated with this screen.
         self.child = None
 
+        # The value of renpy.python.mutation_serial when this screen was
+        # last updated.
+        self.mutation_serial = 0
+
         # Widget properties given to this screen the last time it was
         # shown.
         self.widget_properties = widget_properties
@@ -586,6 +593,9 @@ class ScreenDisplayable(renpy.display.layout.Container):
 
                 start = time.time()
 
+                renpy.sl2.slast.skipped_count = 0
+                renpy.sl2.slast.executed_count = 0
+
                 if self.profile.debug:
                     debug = True
 
@@ -605,6 +615,12 @@ class ScreenDisplayable(renpy.display.layout.Container):
 
         old_cache = self.cache.get(NAME, None)
 
+        # Displayables compare their inputs against the serial from before
+        # the screen is evaluated, so a mutation made while the screen is
+        # being evaluated causes them to be evaluated again on the next
+        # update.
+        self.mutation_serial = renpy.python.mutation_serial
+
         # Evaluate the screen.
         try:
 
@@ -612,16 +628,18 @@ class ScreenDisplayable(renpy.display.layout.Container):
             self.child = renpy.ui.default_fixed(focus="_screen_" + "_".join(self.screen_name))
             self.children = [ self.child ]
 
-            self.scope["_scope"] = self.scope
-            self.scope["_name"] = NAME
-            self.scope["_debug"] = debug
+            # These entries are internal to the screen, and so are stored
+            # without counting as mutations of the scope.
+            dict.__setitem__(self.scope, "_scope", self.scope)
+            dict.__setitem__(self.scope, "_name", NAME)
+            dict.__setitem__(self.scope, "_debug", debug)
 
             self.screen.function(**self.scope)
 
             renpy.ui.close()
 
         finally:
-            del self.scope["_scope"]
+            dict.__delitem__(self.scope, "_scope")
 
             renpy.ui.screen = old_ui_screen
             pop_current_screen()
@@ -651,6 +669,11 @@ class ScreenDisplayable(renpy.display.layout.Container):
             if self.profile.time:
                 profile_log.write("* %.2f ms", 1000 * (end - start))
 
+                if renpy.config.track_screen_dependencies:
+                    profile_log.write("* %d displayables reused, %d re-evaluated",
+                                      renpy.sl2.slast.skipped_count,
+                                      renpy.sl2.slast.executed_count)
+
             if self.profile.debug:
                 profile_log.write("\n")
 
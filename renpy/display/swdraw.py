@@ -32,6 +32,151 @@ from renpy.display.render import blit_lock, IDENTITY, BLIT, DISSOLVE, IMAGEDISSO
 rle_cache = weakref.WeakKeyDictionary()
 
 
+# The size of the tiles the damage grid divides the screen into, in pixels.
+DAMAGE_TILE_SIZE = 16
+
+# The maximum number of rectangles that will be drawn separately, rather
+# than drawing the bounding box of all of them.
+MAX_SEPARATE_REDRAWS = 8
+
+
+class DamageGrid(object):
+    """
+    This divides the screen into square tiles, and tracks which of those
+    tiles have been damaged. Each row of tiles is represented as a bitset,
+    with bit n representing the nth tile from the left.
+    """
+
+    def __init__(self, width, height, tile=DAMAGE_TILE_SIZE):
+
+        self.width = width
+        self.height = height
+        self.tile = tile
+
+        self.columns = (width + tile - 1) // tile
+
+        # A list of bitsets, one per row of tiles.
+        self.rows = [ 0 ] * ((height + tile - 1) // tile)
+
+    def damage(self, x0, y0, x1, y1):
+        """
+        Marks the tiles overlapping the rectangle from (`x0`, `y0`) to
+        (`x1`, `y1`) as damaged.
+        """
+
+        tile = self.tile
+
+        tx0 = max(int(x0) // tile, 0)
+        ty0 = max(int(y0) // tile, 0)
+        tx1 = min((int(math.ceil(x1)) + tile - 1) // tile, self.columns)
+        ty1 = min((int(math.ceil(y1)) + tile - 1) // tile, len(self.rows))
+
+        if tx0 >= tx1 or ty0 >= ty1:
+            return
+
+        mask = ((1 << (tx1 - tx0)) - 1) << tx0
+
+        rows = self.rows
+
+        for ty in range(ty0, ty1):
+            rows[ty] |= mask
+
+    def full(self):
+        """
+        Returns true if every tile has been damaged.
+        """
+
+        full = (1 << self.columns) - 1
+
+        for i in self.rows:
+            if i != full:
+                return False
+
+        return True
+
+    def rectangles(self):
+        """
+        Returns a list of (x, y, w, h) rectangles that cover the damaged
+        tiles. Runs of damaged tiles in a row are merged, and then identical
+        runs in consecutive rows are merged.
+        """
+
+        tile = self.tile
+
+        # A list of (tx0, ty0, tx1, ty1) rectangles that can't grow any
+        # further.
+        closed = [ ]
+
+        # A map from a (tx0, tx1) run to the rectangle ending in the
+        # previous row that has that run.
+        growing = { }
+
+        for ty, bits in enumerate(self.rows):
+
+            grown = { }
+
+            while bits:
+                tx0 = (bits & -bits).bit_length() - 1
+                run = bits >> tx0
+                tx1 = tx0 + (run ^ (run + 1)).bit_length() - 1
+
+                bits &= ~(((1 << (tx1 - tx0)) - 1) << tx0)
+
+                r = growing.pop((tx0, tx1), None)
+
+                if r is None:
+                    r = [ tx0, ty, tx1, ty + 1 ]
+                else:
+                    r[3] = ty + 1
+
+                grown[tx0, tx1] = r
+
+            closed.extend(growing.itervalues())
+            growing = grown
+
+        closed.extend(growing.itervalues())
+        closed.sort(key=lambda r : (r[1], r[0]))
+
+        rv = [ ]
+
+        for tx0, ty0, tx1, ty1 in closed:
+            x0 = tx0 * tile
+            y0 = ty0 * tile
+            x1 = min(tx1 * tile, self.width)
+            y1 = min(ty1 * tile, self.height)
+
+            rv.append((x0, y0, x1 - x0, y1 - y0))
+
+        return rv
+
+
+def redraw_rects(cliprect, updates):
+    """
+    Given the clipping rectangle and updates returned by Clipper.compute,
+    returns the list of (x, y, w, h) rectangles that should be redrawn.
+    A few small updates far apart from each other are redrawn separately,
+    while everything else redraws the bounding box.
+    """
+
+    if cliprect is None:
+        return [ ]
+
+    if len(updates) <= 1 or len(updates) > MAX_SEPARATE_REDRAWS:
+        return [ cliprect ]
+
+    area = 0
+
+    for _x, _y, w, h in updates:
+        area += w * h
+
+    _x, _y, w, h = cliprect
+
+    if area * 2 > w * h:
+        return [ cliprect ]
+
+    return updates
+
+
 class Clipper(object):
     """
     This is used to calculate the clipping rectangle and update rectangles
@@ -76,7 +221,6 @@ class Clipper(object):
 
         sw = renpy.config.screen_width
         sh = renpy.config.screen_height
-        sa = sw * sh
 
         # A tuple representing the size of the fullscreen.
         fullscreen = (0, 0, sw, sh)
@@ -93,147 +237,139 @@ class Clipper(object):
         if fullscreen in changes:
             return fullscreen, [ fullscreen ]
 
-        # Compute the differences between the two sets, and add those
-        # to changes.
-        i0 = 0
-        i1 = 0
-        bl1set = set(bl1)
+        grid = DamageGrid(sw, sh)
 
-        while True:
-            if i0 >= len(bl0) or i1 >= len(bl1):
-                break
+        def damage(x0, y0, x1, y1, (sx0, sy0, sx1, sy1)):
 
-            b0 = bl0[i0]
-            b1 = bl1[i1]
+            # Round up by a pixel, to prevent visual artifacts when scaled down.
+            x1 += 1
+            y1 += 1
 
-            if b0 == b1:
-                if id(b0[5]) in mutated:
-                    changes.add(b0[:5])
+            grid.damage(max(x0, sx0), max(y0, sy0), min(x1, sx1), min(y1, sy1))
 
-                i0 += 1
-                i1 += 1
+        for i in changes:
+            damage(*i)
 
-            elif b0 not in bl1set:
-                changes.add(b0[:5])
-                i0 += 1
+        # Blits that appear in only one of the two frames.
+        bl0set = set(bl0)
+        bl1set = set(bl1)
 
-            else:
-                changes.add(b1[:5])
-                i1 += 1
+        for b in bl0set.symmetric_difference(bl1set):
+            damage(*b[:5])
 
-        changes.update(i[:5] for i in bl0[i0:])
-        changes.update(i[:5] for i in bl1[i1:])
+        # Blits that appear in both frames, but in a different order, or
+        # whose surfaces have been mutated.
+        common0 = [ b for b in bl0 if b in bl1set ]
+        common1 = [ b for b in bl1 if b in bl0set ]
 
-        # No changes? Quit.
-        if not changes:
-            return None, [ ]
+        for b0, b1 in zip(common0, common1):
+            if b0 != b1:
+                damage(*b0[:5])
+                damage(*b1[:5])
 
-        # Compute the sizes of the updated rectangles.
-        sized = [ ]
+            elif mutated and id(b0[5]) in mutated:
+                damage(*b0[:5])
 
-        for x0, y0, x1, y1, (sx0, sy0, sx1, sy1) in changes:
+        if grid.full():
+            return fullscreen, [ fullscreen ]
 
-            # Round up by a pixel, to prevent visual artifacts when scaled down.
-            x1 += 1
-            y1 += 1
+        updates = grid.rectangles()
 
-            if x0 < sx0:
-                x0 = sx0
-            if y0 < sy0:
-                y0 = sy0
-            if x1 > sx1:
-                x1 = sx1
-            if y1 > sy1:
-                y1 = sy1
+        if not updates:
+            return None, [ ]
 
-            w = x1 - x0
-            h = y1 - y0
+        x0, y0, w, h = updates[0]
+        x1 = x0 + w
+        y1 = y0 + h
 
-            if w <= 0 or h <= 0:
-                continue
+        for ix, iy, iw, ih in updates:
+            x0 = min(x0, ix)
+            y0 = min(y0, iy)
+            x1 = max(x1, ix + iw)
+            y1 = max(y1, iy + ih)
 
-            area = w * h
+        return (x0, y0, x1 - x0, y1 - y0), updates
 
-            if area >= sa:
-                return fullscreen, [ fullscreen ]
 
-            sized.append((area, x0, y0, x1, y1))
+clippers = [ Clipper() ]
 
-        sized.sort()
 
-        # The list of non-contiguous updates.
-        noncont = [ ]
+def benchmark_damage(frames=300):
+    """
+    Runs the damage tracker over a simulated dialogue screen, without
+    drawing anything, and writes the average number of pixels redrawn per
+    frame to log.txt. The simulated screen has a background, a sprite,
+    a textbox and namebox, quick menu buttons, slow text that is re-rendered
+    every frame while it is being shown, a blinking click-to-continue
+    indicator, and a clock that changes once a second. Returns the average
+    number of pixels redrawn per frame.
+    """
 
-        # The total area of noncont.
-        nca = 0
+    sw = renpy.config.screen_width
+    sh = renpy.config.screen_height
 
-        # Pick the largest area, merge with all overlapping smaller areas, repeat
-        # until no merge possible.
-        while sized:
-            area, x0, y0, x1, y1 = sized.pop()
+    clip = (0, 0, sw, sh)
 
-            merged = False
+    def blit(x0, y0, x1, y1, surf):
+        return (int(x0 * sw), int(y0 * sh), int(x1 * sw), int(y1 * sh), clip, surf, None)
 
-            if nca + area >= sa:
-                return (0, 0, sw, sh), [ (0, 0, sw, sh) ]
+    background = blit(0, 0, 1, 1, object())
+    sprite = blit(.3, .1, .7, 1, object())
+    textbox = blit(0, .75, 1, 1, object())
+    namebox = blit(.18, .7, .35, .76, object())
+    ctc = blit(.78, .92, .8, .95, object())
 
-            i = 0
+    buttons = [ blit(.3 + i * .07, .97, .36 + i * .07, 1, object()) for i in range(6) ]
+    hovered = [ blit(.3 + i * .07, .97, .36 + i * .07, 1, object()) for i in range(6) ]
 
-            while i < len(sized):
-                _iarea, ix0, iy0, ix1, iy1 = sized[i]
+    clipper = Clipper()
 
-                if (x0 <= ix0 <= x1 or x0 <= ix1 <= x1) and \
-                   (y0 <= iy0 <= y1 or y0 <= iy1 <= y1):
+    # The number of frames it takes to show a line of slow text, and the
+    # number of frames the line waits for a click afterwards.
+    text_frames = 45
+    wait_frames = 75
 
-                    merged = True
-                    x0 = min(x0, ix0)
-                    x1 = max(x1, ix1)
-                    y0 = min(y0, iy0)
-                    y1 = max(y1, iy1)
+    redrawn = 0
 
-                    area = (x1 - x0) * (y1 - y0)
+    for frame in range(frames):
 
-                    sized.pop(i)
+        line_frame = frame % (text_frames + wait_frames)
 
-                else:
-                    i += 1
+        blits = [ background, sprite, textbox, namebox ]
 
-            if merged:
-                sized.append((area, x0, y0, x1, y1))
-            else:
-                noncont.append((x0, y0, x1, y1))
-                nca += area
+        if line_frame < text_frames:
+            # Slow text is re-rendered each frame, growing as it goes.
+            width = .6 * (line_frame + 1) / text_frames
+            blits.append(blit(.2, .8, .2 + width, .9, object()))
+        else:
+            blits.append(blit(.2, .8, .8, .9, "text"))
 
-        if not noncont:
-            return None, [ ]
+            # The indicator blinks every 15 frames.
+            if (line_frame // 15) % 2:
+                blits.append(ctc)
 
-        x0, y0, x1, y1 = noncont.pop()
-        x0 = int(x0)
-        y0 = int(y0)
-        x1 = int(math.ceil(x1))
-        y1 = int(math.ceil(y1))
+        # The mouse moves over a different quick menu button every 40 frames.
+        hover = (frame // 40) % len(buttons)
 
-        # A list of (x, y, w, h) tuples for each update.
-        updates = [ (x0, y0, x1 - x0, y1 - y0) ]
+        for i, b in enumerate(buttons):
+            blits.append(hovered[i] if i == hover else b)
 
-        for ix0, iy0, ix1, iy1 in noncont:
+        # The clock, at 60 frames per second.
+        blits.append(blit(.9, 0, 1, .05, frame // 60))
 
-            ix0 = int(ix0)
-            iy0 = int(iy0)
-            ix1 = int(math.ceil(ix1))
-            iy1 = int(math.ceil(iy1))
+        clipper.blits = blits
 
-            x0 = min(x0, ix0)
-            y0 = min(y0, iy0)
-            x1 = max(x1, ix1)
-            y1 = max(y1, iy1)
+        cliprect, updates = clipper.compute(frame == 0)
 
-            updates.append((ix0, iy0, ix1 - ix0, iy1 - iy0))
+        for _x, _y, w, h in redraw_rects(cliprect, updates):
+            redrawn += w * h
 
-        return (x0, y0, x1 - x0, y1 - y0), updates
+    rv = 1.0 * redrawn / frames
 
+    renpy.display.log.write("Damage benchmark: {}x{}, {} frames, {:.0f} pixels ({:.1f}% of the screen) redrawn per frame.".format(
+        sw, sh, frames, rv, 100.0 * rv / (sw * sh)))
 
-clippers = [ Clipper() ]
+    return rv
 
 
 def surface(w, h, alpha):
@@ -658,13 +794,18 @@ def do_draw_screen(screen_render, full_redraw, swdraw):
 
     cliprect, updates = clipper.compute(full_redraw)
 
-    if cliprect is None:
-        return [ ]
+    redrawn = 0
+
+    for rect in redraw_rects(cliprect, updates):
+        x, y, w, h = rect
+
+        dest = swdraw.window.subsurface(rect)
+        draw(dest, None, screen_render, -x, -y, True)
 
-    x, y, _w, _h = cliprect
+        redrawn += w * h
 
-    dest = swdraw.window.subsurface(cliprect)
-    draw(dest, None, screen_render, -x, -y, True)
+    renpy.performance.stat("swdraw.frames")
+    renpy.performance.stat("swdraw.redrawn_pixels", redrawn)
 
     return updates
 
@@ -491,11 +491,36 @@ class Viewport(renpy.display.layout.Container):
 renpy.display.layout.Viewport = Viewport
 
 
+# The number of children a virtual VPGrid has created for it before it has
+# been rendered, and so before it knows how many are visible.
+VIRTUAL_INITIAL = 100
+
+
 class VPGrid(Viewport):
 
     __version__ = Viewport.__version__
 
-    def __init__(self, cols=None, rows=None, transpose=None, style="vpgrid", **properties):
+    # True if this is a virtual VPGrid, where only the children that are
+    # visible (or nearly visible) are created.
+    virtual = False
+
+    # The total number of children of a virtual VPGrid, or None if it's not
+    # known.
+    virtual_count = None
+
+    # The index of the first child that has been created.
+    virtual_start = 0
+
+    # The (xstep, ystep, width, height) of the last render of a virtual
+    # VPGrid, where xstep and ystep are the distances between cells, or None
+    # if it has not been rendered.
+    virtual_layout = None
+
+    # True if we've asked for the screen to be updated so more children
+    # can be created, and virtual_window has not been called since.
+    virtual_pending = False
+
+    def __init__(self, cols=None, rows=None, transpose=None, style="vpgrid", virtual=False, **properties):
 
         super(VPGrid, self).__init__(style=style, **properties)
 
@@ -509,22 +534,19 @@ class VPGrid(Viewport):
         self.grid_rows = rows
         self.grid_transpose = transpose
 
-    def render(self, width, height, st, at):
-
-        self.width = width
-        self.height = height
+        self.virtual = virtual
 
-        child_width = self.child_width or width
-        child_height = self.child_height or height
+        replaces = properties.get("replaces", None)
 
-        if not self.children:
-            self.offsets = [ ]
-            return renpy.display.render.Render(0, 0)
+        if virtual and isinstance(replaces, VPGrid):
+            self.virtual_layout = replaces.virtual_layout
 
-        # The number of children.
-        lc = len(self.children)
+    def grid_size(self, lc):
+        """
+        Returns the number of columns and rows used to lay out `lc`
+        children.
+        """
 
-        # Figure out the number of columns and rows.
         cols = self.grid_cols
         rows = self.grid_rows
 
@@ -538,6 +560,111 @@ class VPGrid(Viewport):
             if rows * cols < lc:
                 rows += 1
 
+        return cols, rows
+
+    def visible_lines(self, lc, layout):
+        """
+        Returns the number of children in each line that's scrolled
+        through (a row, or a column if transposed), and the indexes of the
+        first line visible and the first line after it that is not, given
+        `lc` children and the `layout` from virtual_layout.
+        """
+
+        xstep, ystep, width, height = layout
+
+        cols, rows = self.grid_size(lc)
+
+        if self.grid_transpose:
+            per_line = rows
+            step = xstep
+            value = self.xadjustment.value
+            page = width
+        else:
+            per_line = cols
+            step = ystep
+            value = self.yadjustment.value
+            page = height
+
+        if step <= 0:
+            return per_line, 0, lc
+
+        first = int(value // step)
+        last = int((value + page) // step) + 1
+
+        return per_line, first, last
+
+    def virtual_window(self, count):
+        """
+        Called by the for statement that creates the children of a virtual
+        VPGrid, with the number of elements it iterates over. Returns a
+        (start, end) tuple, giving the indexes of the elements that children
+        should be created for.
+        """
+
+        self.virtual_count = count
+        self.virtual_pending = False
+
+        if self.virtual_layout is None:
+
+            # We haven't been rendered yet, so create the children near
+            # the initial offset.
+            size = min(count, VIRTUAL_INITIAL)
+
+            if self.grid_transpose:
+                offset = self.xoffset
+            else:
+                offset = self.yoffset
+
+            if isinstance(offset, float):
+                start = int(count * offset) - size // 2
+            else:
+                start = 0
+
+            start = max(0, min(start, count - size))
+            end = start + size
+
+        else:
+
+            per_line, first, last = self.visible_lines(count, self.virtual_layout)
+
+            # Create an extra page of children before and after the visible
+            # ones, so small scrolls do not need the screen to be updated.
+            margin = last - first
+
+            start = max(0, (first - margin) * per_line)
+            end = min(count, (last + margin) * per_line)
+
+            start = min(start, end)
+
+        self.virtual_start = start
+
+        return start, end
+
+    def render(self, width, height, st, at):
+
+        self.width = width
+        self.height = height
+
+        child_width = self.child_width or width
+        child_height = self.child_height or height
+
+        if not self.children:
+            self.offsets = [ ]
+            return renpy.display.render.Render(0, 0)
+
+        virtual = self.virtual and (self.virtual_count is not None)
+
+        # The number of children.
+        if virtual:
+            lc = self.virtual_count
+            start = self.virtual_start
+        else:
+            lc = len(self.children)
+            start = 0
+
+        # Figure out the number of columns and rows.
+        cols, rows = self.grid_size(lc)
+
         # Determine the total size.
         xspacing = self.style.xspacing
         yspacing = self.style.yspacing
@@ -568,7 +695,7 @@ class VPGrid(Viewport):
         # Render everything.
         rv = renpy.display.render.Render(width, height)
 
-        for index, c in enumerate(self.children):
+        for index, c in enumerate(self.children, start):
 
             if self.grid_transpose:
                 x = index // rows
@@ -601,6 +728,18 @@ class VPGrid(Viewport):
 
             self.offsets.append(pos)
 
+        if virtual:
+            self.virtual_layout = (cw + xspacing, ch + yspacing, width, height)
+
+            # If children that are visible have not been created, update
+            # the screen to create them.
+            per_line, first, last = self.visible_lines(lc, self.virtual_layout)
+
+            if (first * per_line < start) or (min(lc, last * per_line) > start + len(self.children)):
+                if not self.virtual_pending:
+                    self.virtual_pending = True
+                    renpy.exports.restart_interaction()
+
         rv = rv.subsurface((0, 0, width, height), focus=True)
 
         if self.draggable or self.arrowkeys:
@@ -29,6 +29,8 @@ import types
 import threading
 import zlib
 import re
+import mmap
+import struct
 
 # Ensure the utf-8 codec is loaded, to prevent recursion when we use it
 # to look up filenames.
@@ -91,6 +93,14 @@ except ImportError:
 # other things, using a new version of bytecode.rpyb will break.
 archives = [ ]
 
+# A map from archive prefix to an mmap of the archive file, or None if the
+# archive couldn't be mapped.
+archive_mmaps = { }
+
+# A map from filename to (archive filename, mmap, index) for the first
+# archive containing that file. This is built lazily, by get_archive_table.
+archive_table = None
+
 # The value of renpy.config.archives the last time index_archives was
 # run.
 old_config_archives = None
@@ -99,6 +109,103 @@ old_config_archives = None
 lower_map = { }
 
 
+class RPA4Index(object):
+    """
+    The index of an RPA-4.0 archive. Rather than being unpickled, the index
+    is a sorted table of fixed-size records, followed by a blob of utf-8
+    encoded names, that is searched in place inside a mmap of the archive.
+
+    Each record is (data offset, data length, name offset, name length),
+    with the name offset being relative to the start of the names blob.
+    The records are sorted by the utf-8 encoding of the name.
+    """
+
+    record = struct.Struct("<QQII")
+
+    def __init__(self, data, offset, count):
+
+        # An mmap or string containing the index.
+        self.data = data
+
+        # The offset of the first record.
+        self.offset = offset
+
+        # The number of records.
+        self.count = count
+
+        # The offset of the names blob.
+        self.names_offset = offset + count * self.record.size
+
+    def entry(self, i):
+        return self.record.unpack_from(self.data, self.offset + i * self.record.size)
+
+    def name(self, i):
+        _offset, _dlen, noff, nlen = self.entry(i)
+        start = self.names_offset + noff
+        return self.data[start:start + nlen]
+
+    def find(self, name):
+        """
+        Returns the number of the record with `name`, or None if no such
+        record exists.
+        """
+
+        if isinstance(name, unicode):
+            name = name.encode("utf-8")
+
+        lo = 0
+        hi = self.count
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+
+            if self.name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if (lo < self.count) and (self.name(lo) == name):
+            return lo
+
+        return None
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    def __getitem__(self, name):
+        i = self.find(name)
+
+        if i is None:
+            raise KeyError(name)
+
+        offset, dlen, _noff, _nlen = self.entry(i)
+        return [ (offset, dlen, b"") ]
+
+    def __len__(self):
+        return self.count
+
+    def iterkeys(self):
+        for i in xrange(self.count):
+            yield self.name(i).decode("utf-8")
+
+    __iter__ = iterkeys
+
+    def keys(self):
+        return list(self.iterkeys())
+
+
+def map_archive(f):
+    """
+    Returns a read-only mmap of the open archive file `f`, or None if the
+    file can't be mapped.
+    """
+
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except:
+        return None
+
+
 def index_archives():
     """
     Loads in the indexes for the archive files. Also updates the lower_map.
@@ -119,15 +226,43 @@ def index_archives():
     cleardirfiles()
 
     global archives
+    global archive_table
+
     archives = [ ]
+    archive_table = None
+
+    # The mmaps are not closed here, as files loaded from them may still
+    # be in use. They're closed when they're garbage collected.
+    archive_mmaps.clear()
 
     for prefix in renpy.config.archives:
 
+        renpy.performance.begin("index " + prefix)
+
         try:
             fn = transfn(prefix + ".rpa")
             f = file(fn, "rb")
             l = f.readline()
 
+            # 4.0 Branch.
+            if l.startswith("RPA-4.0 "):
+                offset = int(l[8:24], 16)
+                count = int(l[25:33], 16)
+
+                mm = map_archive(f)
+
+                if mm is not None:
+                    index = RPA4Index(mm, offset, count)
+                else:
+                    f.seek(offset)
+                    index = RPA4Index(f.read(), 0, count)
+
+                archive_mmaps[prefix] = mm
+                archives.append((prefix, index))
+
+                f.close()
+                continue
+
             # 3.0 Branch.
             if l.startswith("RPA-3.0 "):
                 offset = int(l[8:24], 16)
@@ -144,6 +279,7 @@ def index_archives():
                     else:
                         index[k] = [ (offset ^ key, dlen ^ key, start) for offset, dlen, start in index[k] ]
 
+                archive_mmaps[prefix] = map_archive(f)
                 archives.append((prefix, index))
 
                 f.close()
@@ -154,6 +290,7 @@ def index_archives():
                 offset = int(l[8:], 16)
                 f.seek(offset)
                 index = loads(f.read().decode("zlib"))
+                archive_mmaps[prefix] = map_archive(f)
                 archives.append((prefix, index))
                 f.close()
                 continue
@@ -164,13 +301,40 @@ def index_archives():
             fn = transfn(prefix + ".rpi")
             index = loads(file(fn, "rb").read().decode("zlib"))
             archives.append((prefix, index))
-        except:
-            raise
+        finally:
+            renpy.performance.end("index " + prefix)
 
     for dir, fn in listdirfiles():  # @ReservedAssignment
         lower_map[fn.lower()] = fn
 
 
+def get_archive_table():
+    """
+    Returns a map from filename to an (archive filename, mmap, index) tuple
+    for the first archive that contains the file, building it if necessary.
+    """
+
+    global archive_table
+
+    if archive_table is not None:
+        return archive_table
+
+    rv = { }
+
+    for prefix, index in archives:
+        afn = transfn(prefix + ".rpa")
+        mm = archive_mmaps.get(prefix, None)
+
+        value = (afn, mm, index)
+
+        for name in index.iterkeys():
+            if name not in rv:
+                rv[name] = value
+
+    archive_table = rv
+    return rv
+
+
 def walkdir(dir):  # @ReservedAssignment
     rv = [ ]
 
@@ -435,6 +599,119 @@ class SubFile(object):
         raise Exception("Write not supported by SubFile")
 
 
+class MMapSubFile(SubFile):
+    """
+    A SubFile that reads its data out of a mmap of the archive, rather than
+    opening the archive file. This doesn't use a file descriptor, and the
+    view method allows the data to be accessed without copying it.
+    """
+
+    def __init__(self, fn, mm, base, length, start):
+        super(MMapSubFile, self).__init__(fn, base, length, start)
+        self.mm = mm
+
+    def open(self):
+        return
+
+    def read(self, length=None):
+
+        maxlength = self.length - self.offset
+
+        if length is not None:
+            length = min(length, maxlength)
+        else:
+            length = maxlength
+
+        rv1 = self.start[self.offset:self.offset + length]
+        length -= len(rv1)
+        self.offset += len(rv1)
+
+        if length:
+            pos = self.base + self.offset - len(self.start)
+            rv2 = self.mm[pos:pos + length]
+            self.offset += len(rv2)
+        else:
+            rv2 = ""
+
+        return (rv1 + rv2)
+
+    def readline(self, length=None):
+
+        if self.offset < len(self.start):
+            return super(MMapSubFile, self).readline(length)
+
+        maxlength = self.length - self.offset
+        if length is not None:
+            length = min(length, maxlength)
+        else:
+            length = maxlength
+
+        pos = self.base + self.offset - len(self.start)
+        end = self.mm.find("\n", pos, pos + length)
+
+        if end != -1:
+            length = end + 1 - pos
+
+        return self.read(length)
+
+    def seek(self, offset, whence=0):
+
+        if whence == 1:
+            offset = self.offset + offset
+        elif whence == 2:
+            offset = self.length + offset
+
+        self.offset = max(0, min(offset, self.length))
+
+    def view(self, length=None):
+        """
+        Returns a read-only buffer containing up to `length` bytes of the
+        file (or the rest of the file, if `length` is None), and seeks
+        past them. The buffer shares memory with the mmap, so no data is
+        copied.
+        """
+
+        if self.offset < len(self.start):
+            return self.read(length)
+
+        maxlength = self.length - self.offset
+
+        if length is not None:
+            length = min(length, maxlength)
+        else:
+            length = maxlength
+
+        pos = self.base + self.offset - len(self.start)
+        rv = buffer(self.mm, pos, length)
+        self.offset += length
+
+        return rv
+
+    def close(self):
+        return
+
+
+def read_view(f, length=None):
+    """
+    Reads up to `length` bytes (or the rest of the file, if `length` is
+    None) from `f`, a file returned by load. When `f` is backed by a mmapped
+    archive, this returns a read-only buffer sharing memory with the mmap.
+    Otherwise, it returns a string.
+
+    The result can be passed to anything that takes a buffer, like
+    zlib.decompress or hashlib, but shouldn't be kept around after the
+    archive is closed.
+    """
+
+    if isinstance(f, MMapSubFile):
+        return f.view(length)
+
+    if length is None:
+        return f.read()
+
+    return f.read(length)
+
+
 open_file = open
 
 if "RENPY_FORCE_SUBFILE" in os.environ:
@@ -478,11 +755,11 @@ def load_core(name):
             pass
 
     # Look for it in archive files.
-    for prefix, index in archives:
-        if not name in index:
-            continue
+    entry = get_archive_table().get(name, None)
 
-        afn = transfn(prefix + ".rpa")
+    if entry is not None:
+
+        afn, mm, index = entry
 
         data = [ ]
 
@@ -496,7 +773,10 @@ def load_core(name):
             else:
                 offset, dlen, start = t
 
-            rv = SubFile(afn, offset, dlen, start)
+            if mm is not None:
+                rv = MMapSubFile(afn, mm, offset, dlen, start)
+            else:
+                rv = SubFile(afn, offset, dlen, start)
 
         # Compatibility path.
         else:
@@ -577,10 +857,9 @@ def loadable_core(name):
     except:
         pass
 
-    for _prefix, index in archives:
-        if name in index:
-            loadable_cache[name] = True
-            return True
+    if name in get_archive_table():
+        loadable_cache[name] = True
+        return True
 
     loadable_cache[name] = False
     return False
@@ -645,6 +924,9 @@ def get_hash(name):
     try:
         f = load(name)
 
+        if isinstance(f, MMapSubFile):
+            rv = zlib.adler32(f.view(), rv)
+
         while True:
             data = f.read(1024 * 1024)
 
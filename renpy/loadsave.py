@@ -21,12 +21,16 @@
 
 # This file contains functions that load and save the game state.
 
+from __future__ import print_function
+
 import pickle
 import cPickle
 
-from cStringIO import StringIO
-
 import zipfile
+import zlib
+import tempfile
+import inspect
+import time
 import re
 import threading
 import types
@@ -319,18 +323,177 @@ def safe_rename(old, new):
                 pass
 
 
+# True if ZipEntryFile can be used. ZipEntryFile relies on the internals of
+# the Python 2.7 zipfile module (_writecheck, _didModify, filelist,
+# NameToInfo, and FileHeader taking zip64), so it's only used when those
+# are known to be present. Otherwise, TempEntryFile is used.
+zip_entry_streaming = (
+    (sys.version_info[:2] == (2, 7)) and
+    hasattr(zipfile.ZipFile, "_writecheck") and
+    ("zip64" in inspect.getargspec(zipfile.ZipInfo.FileHeader).args)
+    )
+
+
+class ZipEntryFile(object):
+    """
+    A file-like object that compresses what is written to it into the
+    entry `name` of the zipfile `zf`, so the entry never has to be held
+    in memory. No other entry may be written until this is closed.
+
+    This uses the internals of the zipfile module, and should only be
+    created through open_zip_entry.
+    """
+
+    def __init__(self, zf, name):
+        self.zf = zf
+
+        zinfo = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0600 << 16
+        zinfo.header_offset = zf.fp.tell()
+        zinfo.CRC = 0
+        zinfo.compress_size = 0
+        zinfo.file_size = 0
+
+        zf._writecheck(zinfo)
+        zf._didModify = True
+
+        self.zinfo = zinfo
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+
+        # Pickle writes many small strings, which are gathered up here
+        # before they're compressed.
+        self.buffer = [ ]
+        self.buffer_size = 0
+
+        # The sizes and CRC aren't known yet, so the header is written
+        # again when the entry is closed.
+        zf.fp.write(zinfo.FileHeader(False))
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffer_size += len(data)
+
+        if self.buffer_size >= 65536:
+            self.flush()
+
+    def flush(self):
+        zinfo = self.zinfo
+
+        data = "".join(self.buffer)
+        self.buffer = [ ]
+        self.buffer_size = 0
+
+        zinfo.file_size += len(data)
+        zinfo.CRC = zlib.crc32(data, zinfo.CRC) & 0xffffffff
+
+        data = self.compressor.compress(data)
+        zinfo.compress_size += len(data)
+        self.zf.fp.write(data)
+
+    def close(self):
+        zf = self.zf
+        zinfo = self.zinfo
+
+        self.flush()
+
+        data = self.compressor.flush()
+        zinfo.compress_size += len(data)
+        zf.fp.write(data)
+
+        if (zinfo.file_size > zipfile.ZIP64_LIMIT) or (zinfo.compress_size > zipfile.ZIP64_LIMIT):
+            raise zipfile.LargeZipFile("The {} entry is too large.".format(zinfo.filename))
+
+        position = zf.fp.tell()
+        zf.fp.seek(zinfo.header_offset)
+        zf.fp.write(zinfo.FileHeader(False))
+        zf.fp.seek(position)
+
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+
+    def discard(self):
+        """
+        Called instead of close when writing the entry failed. The zipfile
+        is left incomplete, and should be deleted.
+        """
+
+        return
+
+
+class TempEntryFile(object):
+    """
+    A file that writes to a temporary file, which is added to the zipfile
+    `zf` as the entry `name` when it is closed. This only uses the public
+    zipfile API, and is used when ZipEntryFile can't be.
+    """
+
+    def __init__(self, zf, name):
+        self.zf = zf
+        self.name = name
+
+        fd, self.filename = tempfile.mkstemp(prefix="renpy-save-")
+        self.f = os.fdopen(fd, "wb")
+
+    def write(self, data):
+        self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        try:
+            self.f.close()
+            self.zf.write(self.filename, self.name)
+        finally:
+            self.discard()
+
+    def discard(self):
+        """
+        Called instead of close when writing the entry failed.
+        """
+
+        try:
+            self.f.close()
+        except:
+            pass
+
+        try:
+            os.unlink(self.filename)
+        except:
+            pass
+
+
+def open_zip_entry(zf, name):
+    """
+    Returns a file-like object that writes the entry `name` of the zipfile
+    `zf`. When writing succeeds, the object's close method must be called.
+    When it fails, its discard method must be called instead.
+    """
+
+    if zip_entry_streaming:
+        return ZipEntryFile(zf, name)
+    else:
+        return TempEntryFile(zf, name)
+
+
 class SaveRecord(object):
     """
     This is passed to the save locations. It contains the information that
     goes into a save file in uncompressed form, and the logic to save that
     information to a Ren'Py-standard format save file.
+
+    `log` is a string containing the pickled log. If `log_writer` is
+    given, it's a function that is called with a file object, and pickles
+    the log into it. This is used instead of `log`.
     """
 
-    def __init__(self, screenshot, extra_info, json, log):
+    def __init__(self, screenshot, extra_info, json, log, log_writer=None):
         self.screenshot = screenshot
         self.extra_info = extra_info
         self.json = json
         self.log = log
+        self.log_writer = log_writer
 
         self.first_filename = None
 
@@ -349,22 +512,53 @@ class SaveRecord(object):
 
         zf = zipfile.ZipFile(filename_new, "w", zipfile.ZIP_DEFLATED)
 
-        # Screenshot.
-        zf.writestr("screenshot.png", self.screenshot)
+        try:
+
+            # Screenshot.
+            zf.writestr("screenshot.png", self.screenshot)
+
+            # Extra info.
+            zf.writestr("extra_info", self.extra_info.encode("utf-8"))
+
+            # Json
+            zf.writestr("json", self.json)
 
-        # Extra info.
-        zf.writestr("extra_info", self.extra_info.encode("utf-8"))
+            # Version.
+            zf.writestr("renpy_version", renpy.version)
 
-        # Json
-        zf.writestr("json", self.json)
+            # The actual game.
+            if self.log_writer is not None:
+                f = open_zip_entry(zf, "log")
 
-        # Version.
-        zf.writestr("renpy_version", renpy.version)
+                try:
+                    self.log_writer(f)
+                except:
+                    t, e, tb = sys.exc_info()
+                    f.discard()
+                    raise t, e, tb
+
+                f.close()
+            else:
+                zf.writestr("log", self.log)
+
+            zf.close()
+
+        except:
+
+            # Don't leave a partial save behind.
+            t, e, tb = sys.exc_info()
+
+            try:
+                zf.close()
+            except:
+                pass
 
-        # The actual game.
-        zf.writestr("log", self.log)
+            try:
+                os.unlink(filename_new)
+            except:
+                pass
 
-        zf.close()
+            raise t, e, tb
 
         safe_rename(filename_new, filename)
 
@@ -397,29 +591,38 @@ def save(slotname, extra_info='', mutate_flag=False):
     if renpy.config.save_dump:
         save_dump(roots, renpy.game.log)
 
-    logf = StringIO()
-    try:
-        dump((roots, renpy.game.log), logf)
-    except:
-
-        t, e, tb = sys.exc_info()
+    start = time.time()
 
-        if mutate_flag:
-            raise t, e, tb
+    def log_writer(logf):
+        """
+        Pickles the log straight into the save file that's being written.
+        The other locations copy that file, so this is only called once. An
+        abort raises before the file is renamed into place, which leaves
+        every location untouched.
+        """
 
         try:
-            bad = find_bad_reduction(roots, renpy.game.log)
+            dump((roots, renpy.game.log), logf)
         except:
-            raise t, e, tb
 
-        if bad is None:
-            raise t, e, tb
+            t, e, tb = sys.exc_info()
+
+            if mutate_flag:
+                raise t, e, tb
+
+            try:
+                bad = find_bad_reduction(roots, renpy.game.log)
+            except:
+                raise t, e, tb
 
-        e.args = ( e.args[0] + ' (perhaps {})'.format(bad), ) + e.args[1:]
-        raise t, e, tb
+            if bad is None:
+                raise t, e, tb
+
+            e.args = ( e.args[0] + ' (perhaps {})'.format(bad), ) + e.args[1:]
+            raise t, e, tb
 
-    if mutate_flag and renpy.python.mutate_flag:
-        raise SaveAbort()
+        if mutate_flag and renpy.python.mutate_flag:
+            raise SaveAbort()
 
     screenshot = renpy.game.interface.get_screenshot()
 
@@ -430,9 +633,12 @@ def save(slotname, extra_info='', mutate_flag=False):
 
     json = json_dumps(json)
 
-    sr = SaveRecord(screenshot, extra_info, json, logf.getvalue())
+    sr = SaveRecord(screenshot, extra_info, json, None, log_writer=log_writer)
     location.save(slotname, sr)
 
+    renpy.performance.stat("save.saves")
+    renpy.performance.stat("save.time", time.time() - start)
+
     location.scan()
     clear_slot(slotname)
 
@@ -728,6 +934,71 @@ def load(filename):
     log.unfreeze(roots, label="_after_load")
 
 
+def save_benchmark():
+    """
+    The save-benchmark command. This grows a rollback log, and at each of
+    the given lengths, reports the size of the pickled log and the time it
+    takes to save it to a slot and load it again.
+    """
+
+    ap = renpy.arguments.ArgumentParser(description="Reports the size of a save, and the time taken to save and load it, as the rollback log grows.")
+    ap.add_argument("lengths", nargs="*", type=int, default=[ 1, 16, 64, 128, 256 ], help="The rollback log lengths to measure.")
+    ap.add_argument("--rounds", type=int, default=3, help="The number of times each length is measured.")
+
+    args = ap.parse_args()
+
+    lengths = sorted(args.lengths)
+    slotname = "_save_benchmark"
+
+    renpy.config.rollback_length = max(lengths + [ 0 ]) + 1
+
+    log = renpy.game.log = renpy.python.RollbackLog()
+    renpy.game.contexts = [ renpy.execution.Context(True) ]
+
+    # Each entry in the log changes a variable, and mutates a list.
+    renpy.store._save_benchmark = renpy.python.RevertableList()
+
+    print("{:>8} {:>10} {:>8} {:>8}".format("length", "bytes", "save", "load"))
+
+    for length in lengths:
+
+        while len(log.log) < length:
+            log.begin(force=True)
+            renpy.store._save_benchmark.append(len(log.log))
+            renpy.store._save_benchmark_length = len(log.log)
+
+        save_time = 0.0
+        load_time = 0.0
+        size = 0
+
+        for _i in range(args.rounds):
+
+            start = time.time()
+
+            roots = log.freeze(None)
+            sr = SaveRecord("", u"", json_dumps({ }), None, log_writer=lambda f : dump((roots, log), f))
+            location.save(slotname, sr)
+            log.discard_freeze()
+
+            save_time += time.time() - start
+
+            data = location.load(slotname)
+            size = len(data)
+
+            start = time.time()
+            loads(data)
+            load_time += time.time() - start
+
+        print("{:8d} {:10d} {:8.4f} {:8.4f}".format(len(log.log), size, save_time / args.rounds, load_time / args.rounds))
+
+    location.unlink(slotname)
+
+    return False
+
+
+renpy.arguments.register_command("save-benchmark", save_benchmark)
+
+
 def unlink_save(filename):
     """
     :doc: loadsave
@@ -41,6 +41,9 @@ last_clock = time.time()
 def log_clock(s):
     global last_clock
     now = time.time()
+
+    renpy.performance.complete(s, last_clock, now)
+
     s = "{} took {:.2f}s".format(s, now - last_clock)
 
     renpy.display.log.write(s)
@@ -76,6 +79,7 @@ def run(restart):
     log_clock("Build styles")
 
     renpy.sl2.slast.load_cache()
+    renpy.sl2.slast.load_compiled_cache()
     log_clock("Load screen analysis")
 
     # Analyze the screens.
@@ -91,6 +95,10 @@ def run(restart):
 
     log_clock("Prepare screens")
 
+    if not restart:
+        renpy.sl2.slast.save_compiled_cache()
+        log_clock("Save compiled screens")
+
     if not restart:
         renpy.pyanalysis.save_cache()
         log_clock("Save pyanalysis.")
@@ -98,6 +106,8 @@ def run(restart):
         renpy.game.script.save_bytecode()
         log_clock("Save bytecode.")
 
+        renpy.performance.report_stats("bytecode.")
+
     # Handle arguments and commands.
     if not renpy.arguments.post_init():
         renpy.exports.quit()
@@ -235,6 +245,17 @@ def choose_variants():
 
 def main():
 
+    # Start recording a trace, if we've been asked to.
+    if renpy.game.args.startup_profile:  # @UndefinedVariable
+        renpy.performance.start_trace(renpy.game.args.startup_profile, 1)  # @UndefinedVariable
+    elif renpy.game.args.profile_trace:  # @UndefinedVariable
+        renpy.performance.start_trace(renpy.game.args.profile_trace, renpy.game.args.profile_frames)  # @UndefinedVariable
+
+    # This has to happen before the audio system is initialized, which is
+    # before commands like test run.
+    if renpy.game.args.offline_audio is not None:  # @UndefinedVariable
+        renpy.audio.audio.set_offline(renpy.game.args.offline_audio or None)  # @UndefinedVariable
+
     log_clock("Bootstrap to the start of init.init")
 
     renpy.game.exception_info = 'Before loading the script.'
@@ -417,13 +438,28 @@ def main():
 
         renpy.game.exception_info = 'While executing init code:'
 
-        for _prio, node in game.script.initcode:
+        # If there's an init snapshot for this script, restore it rather
+        # than running the init code.
+        restored = renpy.snapshot.restore()
+
+        if restored:
+            log_clock("Restoring init snapshot")
 
-            if isinstance(node, renpy.ast.Node):
-                renpy.game.context().run(node)
-            else:
-                # An init function.
-                node()
+        else:
+
+            for prio, node in game.script.initcode:
+
+                if isinstance(node, renpy.ast.Node):
+                    node_start = time.time()
+
+                    renpy.game.context().run(node)
+
+                    if renpy.performance.tracing:
+                        renpy.performance.complete("init {} {}:{}".format(prio, node.filename, node.linenumber), node_start, time.time())
+
+                else:
+                    # An init function.
+                    node()
 
         renpy.game.exception_info = 'After initialization, but before game start.'
 
@@ -454,6 +490,9 @@ def main():
         renpy.atl.compile_all()
         log_clock("Analyze and compile ATL")
 
+        if (not restored) and renpy.snapshot.save():
+            log_clock("Saving init snapshot")
+
         # Index the archive files. We should not have loaded an image
         # before this point. (As pygame will not have been initialized.)
         # We need to do this again because the list of known archives
@@ -530,6 +569,8 @@ def main():
 
         gc.set_debug(0)
 
+        renpy.performance.write_trace()
+
         renpy.loader.auto_quit()
         renpy.savelocation.quit()
         renpy.translation.write_updated_strings()
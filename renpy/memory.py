@@ -421,9 +421,23 @@ def profile_rollback():
 
     roots = [ ]
 
+    # The number of compressed Rollback objects, and the size of their
+    # compressed data.
+    spilled = 0
+    spilled_size = 0
+
     # Walk the log, finding new roots and rollback information.
     for rb in log:
 
+        if rb.spilled is not None:
+            spilled += 1
+            spilled_size += len(rb.spilled)
+
+            roots.append(("<compressed rollback references>", rb.spilled_externals))
+            roots.append(("<scene lists>", rb.context.scene_lists))
+            roots.append(("<context>", rb.context))
+            continue
+
         for store_name, store in rb.stores.iteritems():
             for var_name, o in store.iteritems():
                 name = store_name + "." + var_name
@@ -464,6 +478,17 @@ def profile_rollback():
 
     write("")
     write("{} Rollback objects exist.".format(len(log)))
+
+    if spilled:
+        write("{} are compressed, using {:,d} bytes.".format(spilled, spilled_size))
+
+    unspills = renpy.performance.stats.get("rollback.unspills", 0)
+
+    if unspills:
+        write("{} were decompressed, taking {:.1f} ms on average.".format(
+            unspills,
+            renpy.performance.stats.get("rollback.unspill_time", 0) * 1000.0 / unspills))
+
     write("")
 
 
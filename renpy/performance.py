@@ -25,6 +25,11 @@ from __future__ import print_function, unicode_literals
 
 
 import time
+import collections
+import json
+import thread
+import os
+
 import renpy
 
 # A list of (time, depth, message) tuples.
@@ -38,6 +43,29 @@ DEPTH_LEVELS = 4
 running = False
 
 
+# A map from the name of a statistic to its value. Unlike the FPL,
+# statistics are collected whether or not profiling is enabled.
+stats = { }
+
+
+def stat(name, value=1):
+    """
+    Adds `value` to the statistic `name`.
+    """
+
+    stats[name] = stats.get(name, 0) + value
+
+
+def report_stats(prefix=""):
+    """
+    Writes the statistics with names beginning with `prefix` to the log.
+    """
+
+    for k in sorted(stats):
+        if k.startswith(prefix):
+            renpy.display.log.write("{} = {}".format(k, stats[k]))
+
+
 def clear():
     global fpl
     fpl = [ ]
@@ -48,6 +76,9 @@ def clear():
 
 def log(depth, event, *args):
 
+    if tracing:
+        trace.append(("i", event, args, int(time.time() * 1000000000), thread.get_ident()))
+
     if (not renpy.config.profile) or (not running):
         return
 
@@ -114,3 +145,194 @@ def analyze():
 
         for i in range(depth, DEPTH_LEVELS):
             times[i] = t
+
+
+################################################################################
+# Tracing.
+
+# The default number of events kept in the trace. When the trace is full,
+# the oldest events are discarded.
+TRACE_SIZE = 1000000
+
+# Are we recording a trace?
+tracing = False
+
+# A ring buffer of (phase, name, args, time in ns, thread id) tuples. The
+# phase is "B" for the start of a span, "E" for the end of a span, "X" for
+# a complete span (with the duration in ns as the only arg), and "i" for an
+# instantaneous event, like those logged with renpy.plog.
+trace = collections.deque(maxlen=TRACE_SIZE)
+
+# The file the trace is written to when Ren'Py quits, or None not to write
+# the trace out automatically.
+trace_filename = None
+
+# The number of frames that are left before Ren'Py quits, or None to run
+# until the player quits.
+trace_frames = None
+
+
+def start_trace(filename=None, frames=None, size=TRACE_SIZE):
+    """
+    Starts recording a trace.
+
+    `filename`
+        If not None, the trace is written to this file by write_trace.
+
+    `frames`
+        If not None, Ren'Py will quit once this many frames have been
+        drawn.
+
+    `size`
+        The number of events that are kept.
+    """
+
+    global tracing
+    global trace
+    global trace_filename
+    global trace_frames
+
+    trace = collections.deque(maxlen=size)
+    trace_filename = filename
+    trace_frames = frames
+    tracing = True
+
+
+def stop_trace():
+    """
+    Stops recording the trace. The events recorded so far are kept.
+    """
+
+    global tracing
+    tracing = False
+
+
+def begin(name):
+    """
+    Marks the start of the span `name`. Spans on the same thread must be
+    properly nested.
+    """
+
+    if tracing:
+        trace.append(("B", name, (), int(time.time() * 1000000000), thread.get_ident()))
+
+
+def end(name):
+    """
+    Marks the end of the span `name`.
+    """
+
+    if tracing:
+        trace.append(("E", name, (), int(time.time() * 1000000000), thread.get_ident()))
+
+
+def complete(name, start, end):
+    """
+    Records a span named `name` that has already finished. `start` and
+    `end` are times, as returned by time.time().
+    """
+
+    if tracing:
+        trace.append(("X", name, (int((end - start) * 1000000000),), int(start * 1000000000), thread.get_ident()))
+
+
+class span(object):
+    """
+    A context manager that records a span around the code it contains.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        begin(self.name)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end(self.name)
+
+
+def frame():
+    """
+    Called by the interface each time a frame is drawn.
+    """
+
+    global trace_frames
+
+    if not tracing:
+        return
+
+    log(0, "frame {}", renpy.config.frames)
+
+    if trace_frames is None:
+        return
+
+    trace_frames -= 1
+
+    if trace_frames <= 0:
+        raise renpy.game.QuitException()
+
+
+def export_trace(filename):
+    """
+    Writes the trace to `filename`, in the Chrome trace event format
+    understood by chrome://tracing and other trace viewers.
+    """
+
+    events = [ ]
+    pid = os.getpid()
+
+    # A map from thread id to the indexes in events of the begin events of
+    # the spans open on that thread. The ring buffer may have discarded the
+    # start of a span, so unmatched ends are dropped, and spans that are
+    # still open when the trace is exported are dropped as well.
+    open_spans = collections.defaultdict(list)
+
+    for phase, name, args, t, tid in list(trace):
+
+        if phase == "B":
+            open_spans[tid].append(len(events))
+        elif phase == "E":
+            if not open_spans[tid]:
+                continue
+
+            open_spans[tid].pop()
+
+        if phase == "X":
+            e = { "name" : name, "ph" : phase, "ts" : t / 1000.0, "dur" : args[0] / 1000.0, "pid" : pid, "tid" : tid }
+            events.append(e)
+            continue
+
+        if args:
+            try:
+                name = name.format(*args)
+            except:
+                pass
+
+        e = { "name" : name, "ph" : phase, "ts" : t / 1000.0, "pid" : pid, "tid" : tid }
+
+        if phase == "i":
+            e["s"] = "t"
+
+        events.append(e)
+
+    unmatched = set()
+
+    for l in open_spans.itervalues():
+        unmatched.update(l)
+
+    if unmatched:
+        events = [ e for i, e in enumerate(events) if i not in unmatched ]
+
+    with open(filename, "wb") as f:
+        json.dump({ "traceEvents" : events, "displayTimeUnit" : "ns" }, f)
+
+
+def write_trace():
+    """
+    Called when Ren'Py quits, to write the trace to the file given when
+    it was started.
+    """
+
+    if tracing and trace_filename:
+        stop_trace()
+        export_trace(trace_filename)
@@ -29,6 +29,80 @@ import renpy
 
 from renpy.loadsave import dump, dumps, loads
 
+class TrackedDict(dict):
+    """
+    A dict that notes when it has been changed. This is used for the
+    large dicts Ren'Py keeps in the persistent object, so that finding
+    changes in them doesn't require comparing them against a copy.
+
+    This pickles as a plain dict, so persistent data remains readable by
+    older versions of Ren'Py.
+    """
+
+    # True if the dict has changed since find_changes last saw it. Storing
+    # a value equal to the one already in the dict isn't a change, since
+    # Ren'Py marks statements and images as seen every time they're used.
+    changed = False
+
+    def __reduce__(self):
+        return (dict, (), None, None, self.iteritems())
+
+    def __setitem__(self, key, value):
+        if (key not in self) or (dict.__getitem__(self, key) != value):
+            self.changed = True
+
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.changed = True
+
+    def clear(self):
+        if self:
+            self.changed = True
+
+        dict.clear(self)
+
+    def pop(self, key, *args):
+        if key in self:
+            self.changed = True
+
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        rv = dict.popitem(self)
+        self.changed = True
+        return rv
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.changed = True
+
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+
+        if (len(args) == 1) and (not kwargs) and isinstance(args[0], dict):
+            other = args[0]
+        else:
+            other = dict(*args, **kwargs)
+
+        if not self.changed:
+
+            for k, v in other.iteritems():
+                if (k not in self) or (dict.__getitem__(self, k) != v):
+                    self.changed = True
+                    break
+
+            else:
+                return
+
+        dict.update(self, other)
+
+
+# The fields of the persistent object that are stored in TrackedDicts.
+tracked_fields = [ "_seen_ever", "_seen_images", "_chosen", "_seen_audio" ]
+
 # The class that's used to hold the persistent data.
 
 
@@ -81,20 +155,13 @@ class Persistent(object):
         if self._preferences is None:
             self._preferences = renpy.preferences.Preferences()
 
-        # Initialize the set of statements seen ever.
-        if not self._seen_ever:
-            self._seen_ever = { }
+        # Initialize the sets of statements, images, and audio seen ever,
+        # and the set of chosen menu choices.
+        for field in tracked_fields:
+            value = self.__dict__.get(field, None)
 
-        # Initialize the set of images seen ever.
-        if not self._seen_images:
-            self._seen_images = { }
-
-        # Initialize the set of chosen menu choices.
-        if not self._chosen:
-            self._chosen = { }
-
-        if not self._seen_audio:
-            self._seen_audio = { }
+            if not isinstance(value, TrackedDict):
+                self.__dict__[field] = TrackedDict(value or { })
 
         # The set of seen translate identifiers.
         if not self._seen_translates:
@@ -138,10 +205,22 @@ def safe_deepcopy(o):
 
 
 # A map from field names to a backup of the field names in the persistent
-# object.
+# object. TrackedDicts are not copied - the backup is the dict itself.
 backup = { }
 
 
+def backup_field(f, value):
+    """
+    Backs up `value` as the value of the field `f`.
+    """
+
+    if isinstance(value, TrackedDict):
+        value.changed = False
+        backup[f] = value
+    else:
+        backup[f] = safe_deepcopy(value)
+
+
 def find_changes():
     """
     This finds changes in the persistent object. When it finds a change, it
@@ -169,12 +248,17 @@ def find_changes():
         old = backup.get(f, None)
         new = pvars.get(f, None)
 
-        if not (new == old):
+        if isinstance(new, TrackedDict) and (new is old):
+            if not new.changed:
+                continue
+
+        elif new == old:
+            continue
 
-            persistent._changed[f] = now
-            backup[f] = safe_deepcopy(new)
+        persistent._changed[f] = now
+        backup_field(f, new)
 
-            rv = True
+        rv = True
 
     return rv
 
@@ -233,7 +317,7 @@ def init():
     v = vars(persistent)
 
     for k, v in vars(persistent).iteritems():
-        backup[k] = safe_deepcopy(v)
+        backup_field(k, v)
 
     return persistent
 
@@ -309,7 +393,11 @@ def merge(other):
         pval = pvars.get(f, None)
         oval = ovars.get(f, None)
 
-        if pval == oval:
+        # TrackedDicts are merged in place, and are only considered changed
+        # if the merge added to them, so they aren't compared first.
+        tracked = isinstance(pval, TrackedDict)
+
+        if (not tracked) and (pval == oval):
             continue
 
         ptime = persistent._changed.get(f, 0)
@@ -328,10 +416,21 @@ def merge(other):
 
         merge_func = registry.get(f, default_merge)
 
-        val = merge_func(old, new, pval)
+        if tracked:
+            changed = pval.changed
+            pval.changed = False
+
+            val = merge_func(old, new, pval)
+
+            if (val is pval) and (not pval.changed):
+                pval.changed = changed
+                continue
+
+        else:
+            val = merge_func(old, new, pval)
 
         pvars[f] = val
-        backup[f] = safe_deepcopy(val)
+        backup_field(f, val)
         persistent._changed[f] = t
 
 
@@ -397,6 +496,12 @@ should_save_persistent = True
 def save():
     """
     Saves the persistent data to disk.
+
+    This always writes the whole persistent object. Every save location
+    reads the persistent file whole, and merges it with the others by
+    mtime, so a file holding only the changed keys couldn't be merged by
+    older versions, or by other processes. Change tracking instead keeps
+    save from being called when nothing has changed.
     """
 
     if not should_save_persistent:
@@ -520,6 +520,90 @@ class Analysis(object):
 
         return check_node(node)
 
+    def dependencies(self, node):
+        """
+        Returns a set giving the names of the variables the value of the
+        python AST `node` depends on, or None if that can't be known because
+        `node` calls a function that is not pure.
+
+        Global constants are not included. A variable that is reached
+        through attribute access is given as a dotted name, like
+        "gui.text_color".
+        """
+
+        rv = set()
+
+        def dotted_name(node):
+            if isinstance(node, ast.Name):
+                return node.id
+
+            elif isinstance(node, ast.Attribute):
+                name = dotted_name(node.value)
+
+                if name is not None:
+                    return name + "." + node.attr
+
+            return None
+
+        def add_name(node):
+            if isinstance(node.ctx, ast.Load) and (self.is_constant(node) != GLOBAL_CONST):
+                rv.add(dotted_name(node))
+
+        def check_nodes(nodes):
+            for i in nodes:
+                if not check_node(i):
+                    return False
+
+            return True
+
+        def check_node(node):
+            """
+            Adds the names `node` depends on to rv. Returns False if it
+            calls a function that is not pure.
+            """
+
+            if node is None:
+                return True
+
+            if isinstance(node, (ast.Name, ast.Attribute)) and (dotted_name(node) is not None):
+                add_name(node)
+                return True
+
+            elif isinstance(node, ast.Call):
+                func = node.func
+
+                if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Str):
+                    # A string method, like "{}".format.
+                    pass
+
+                elif dotted_name(func) in self.pure_functions:
+                    add_name(func)
+
+                else:
+                    return False
+
+                return (check_nodes(node.args) and
+                    check_nodes(i.value for i in node.keywords) and
+                    check_node(node.starargs) and
+                    check_node(node.kwargs))
+
+            elif isinstance(node, ast.Lambda):
+
+                # The body of a lambda is not run when the lambda is
+                # created, so it may call anything.
+                for i in ast.walk(node.body):
+                    if isinstance(i, ast.Name):
+                        add_name(i)
+
+                return check_nodes(node.args.defaults)
+
+            return check_nodes(ast.iter_child_nodes(node))
+
+        if not check_node(node):
+            return None
+
+        return rv
+
     def is_constant_expr(self, expr):
         """
         Compiles `expr` into an AST node, then returns the result of
@@ -729,7 +813,7 @@ def load_cache():
 
     try:
         f = renpy.loader.load(CACHE_FILENAME)
-        c = loads(zlib.decompress(f.read()))
+        c = loads(zlib.decompress(renpy.loader.read_view(f)))
         f.close()
 
         if c.version == ccache.version:
@@ -37,6 +37,10 @@ import weakref
 import re
 import sys
 import time
+import zlib
+import cPickle
+
+from cStringIO import StringIO
 
 import renpy.audio
 
@@ -328,63 +332,212 @@ class NoRollback(object):
     pass
 
 
-# parents = [ ]
+# Flags that describe how reached treats an object of a given type.
+
+# The object is a NoRollback (or a file), and is not looked into.
+REACH_NOROLLBACK = 1
+
+# The object is a store module, and is not looked into.
+REACH_STORE = 2
+
+# The object's fields are looked into.
+REACH_VARS = 4
+
+# The object is iterated over.
+REACH_ITER = 8
+
+# The object's values are looked into.
+REACH_VALUES = 16
+
+# The type can't be classified, as its instances may customize attribute
+# access. Each object is checked individually.
+REACH_GENERIC = 32
+
+# A map from type to the REACH_ flags for objects of that type.
+reach_kinds = { }
+
+# Builtin types whose attribute access is known not to be customized.
+reach_builtin_types = { object, int, long, float, complex, bool, basestring, str, unicode, type(None), list, tuple, dict, set, frozenset }
+
+# Py_TPFLAGS_HEAPTYPE, which is set on types created by class statements.
+HEAPTYPE = 1 << 9
+
+
+def reach_kind(t):
+    """
+    Computes the REACH_ flags for objects of type `t`.
+    """
+
+    if issubclass(t, (NoRollback, real_file)):  # @UndefinedVariable
+        return REACH_NOROLLBACK
+
+    if issubclass(t, StoreModule):
+        return REACH_STORE
+
+    for b in t.__mro__:
+
+        if b in reach_builtin_types:
+            continue
+
+        # Other types implemented in C (like weakref proxies and old-style
+        # instances) may do anything.
+        if not (b.__flags__ & HEAPTYPE):
+            return REACH_GENERIC
+
+        if ("__getattribute__" in b.__dict__) or ("__getattr__" in b.__dict__):
+            return REACH_GENERIC
+
+    rv = 0
+
+    for b in t.__mro__:
+        if "__dict__" in b.__dict__:
+            rv |= REACH_VARS
+            break
+
+    if hasattr(t, "__iter__") and not issubclass(t, basestring):
+        rv |= REACH_ITER
+
+    if hasattr(t, "itervalues"):
+        rv |= REACH_VALUES
+
+    return rv
+
 
 def reached(obj, reachable, wait):
     """
     @param obj: The object that was reached.
-    @param path: The path from the store via which it was reached.
 
     `reachable`
         A map from id(obj) to int. The int is 1 if the object was reached
         normally, and 0 if it was reached, but inherits from NoRollback.
 
+    This walks the objects reachable from `obj` using an explicit stack,
+    so deep structures can't exceed the recursion limit. How each object
+    is looked into is determined once per type, which avoids raising
+    and catching exceptions for objects that aren't containers.
     """
 
-    if wait:
-        wait()
+    kinds = reach_kinds
 
-    idobj = id(obj)
+    stack = [ obj ]
+    pop = stack.pop
+    extend = stack.extend
 
-    if idobj in reachable:
-        return
+    while stack:
 
-    if isinstance(obj, (NoRollback, real_file)):  # @UndefinedVariable
-        reachable[idobj] = 0
-        return
+        obj = pop()
 
-    reachable[idobj] = 1
+        if wait:
+            wait()
 
-    # Since the store module is the roots, there's no need to
-    # look into it.
-    if isinstance(obj, StoreModule):
-        return
+        idobj = id(obj)
 
-    # parents.append(obj)
+        if idobj in reachable:
+            continue
 
-    try:
-        # Treat as fields, indexed by strings.
-        for v in vars(obj).itervalues():
-            reached(v, reachable, wait)
-    except:
-        pass
+        t = type(obj)
 
-    try:
-        # Treat as iterable
-        if not isinstance(obj, basestring):
-            for v in obj.__iter__():
-                reached(v, reachable, wait)
-    except:
-        pass
+        kind = kinds.get(t, None)
 
-    try:
-        # Treat as dict.
-        for v in obj.itervalues():
-            reached(v, reachable, wait)
-    except:
+        if kind is None:
+            kind = kinds[t] = reach_kind(t)
+
+        if kind & REACH_GENERIC:
+
+            if isinstance(obj, (NoRollback, real_file)):  # @UndefinedVariable
+                kind = REACH_NOROLLBACK
+            elif isinstance(obj, StoreModule):
+                kind = REACH_STORE
+            elif isinstance(obj, basestring):
+                kind = REACH_VARS | REACH_VALUES
+            else:
+                kind = REACH_VARS | REACH_ITER | REACH_VALUES
+
+        if kind & REACH_NOROLLBACK:
+            reachable[idobj] = 0
+            continue
+
+        reachable[idobj] = 1
+
+        # Since the store module is the roots, there's no need to
+        # look into it.
+        if kind & REACH_STORE:
+            continue
+
+        # If iteration fails partway through, the objects already seen
+        # remain on the stack.
+
+        if kind & REACH_VARS:
+            try:
+                # Treat as fields, indexed by strings.
+                extend(vars(obj).itervalues())
+            except:
+                pass
+
+        if kind & REACH_ITER:
+            try:
+                # Treat as iterable
+                extend(obj.__iter__())
+            except:
+                pass
+
+        if kind & REACH_VALUES:
+            try:
+                # Treat as dict.
+                extend(obj.itervalues())
+            except:
+                pass
+
+
+def benchmark_reached(count=1000000):
+    """
+    Builds a store-like structure containing about `count` objects - a
+    mixture of objects, lists, dicts, and sets, along with a long linked
+    list - and logs how long it takes to find everything reachable
+    from it.
+    """
+
+    class Node(object):
         pass
 
-    # parents.pop()
+    store = { }
+    objects = 0
+    n = 0
+
+    while objects < count:
+
+        o = Node()
+        o.name = "node%d" % n
+        o.value = n
+        o.items = [ n, n + 1, (n, n + 2) ]
+        o.flags = { "a" : n, "b" : set([ n ]) }
+
+        store["var%d" % n] = o
+
+        # The node, its string and int fields, the list and its contents,
+        # the dict and its keys and values, and the set.
+        objects += 14
+        n += 1
+
+    head = None
+
+    for i in xrange(count // 10):
+        o = Node()
+        o.next = head
+        head = o
+
+    store["linked_list"] = head
+
+    start = time.time()
+
+    reachable = { }
+
+    for v in store.itervalues():
+        reached(v, reachable, None)
+
+    renpy.display.log.write("Reached {} objects in {:.1f} ms.".format(len(reachable), (time.time() - start) * 1000.0))
+
+    return reachable
 
 
 def reached_vars(store, reachable, wait):
@@ -617,10 +770,9 @@ def py_compile(source, mode, filename='<none>', lineno=1, ast_node=False, cache=
             old_py_compile_cache[key] = rv
             return rv
 
-        bytecode = renpy.game.script.bytecode_oldcache.get(key, None)
+        bytecode = renpy.game.script.bytecode_cache.get(filename, key)
         if bytecode is not None:
 
-            renpy.game.script.bytecode_newcache[key] = bytecode
             rv = marshal.loads(bytecode)
             py_compile_cache[key] = rv
             return rv
@@ -661,8 +813,7 @@ def py_compile(source, mode, filename='<none>', lineno=1, ast_node=False, cache=
 
         if cache:
             py_compile_cache[key] = rv
-            renpy.game.script.bytecode_newcache[key] = marshal.dumps(rv)
-            renpy.game.script.bytecode_dirty = True
+            renpy.game.script.bytecode_cache.set(filename, key, marshal.dumps(rv))
 
         return rv
 
@@ -697,12 +848,25 @@ def py_compile_eval_bytecode(source, **kwargs):
 # this to check to see if a background-save is valid.
 mutate_flag = True
 
+# This is incremented whenever a revertable object is mutated or rolled
+# back. Screen language uses it to tell if an object a displayable depends
+# on may have changed.
+mutation_serial = 0
+
 
-def mutator(method):
+def mutator(method, serial=True):
+    """
+    Wraps `method` so it logs the object it's called on for rollback. If
+    `serial` is false, the method doesn't change mutation_serial.
+    """
 
     def do_mutation(self, *args, **kwargs):
 
         global mutate_flag
+        global mutation_serial
+
+        if serial:
+            mutation_serial += 1
 
         mutated = renpy.game.log.mutated  # @UndefinedVariable
 
@@ -923,6 +1087,28 @@ class RevertableDict(dict):
             self[k] = v
 
 
+class RevertableScope(RevertableDict):
+    """
+    The scope of a screen. Changes to it are rolled back, but don't change
+    mutation_serial, since screen language assigns to the scope on every
+    update, and looks the values up again each time rather than tracking
+    the scope itself.
+    """
+
+    __delitem__ = mutator(dict.__delitem__, False)
+    __setitem__ = mutator(dict.__setitem__, False)
+    clear = mutator(dict.clear, False)
+    pop = mutator(dict.pop, False)
+    popitem = mutator(dict.popitem, False)
+    setdefault = mutator(dict.setdefault, False)
+    update = mutator(dict.update, False)
+
+    def copy(self):
+        rv = RevertableScope()
+        rv.update(self)
+        return rv
+
+
 class RevertableSet(set):
 
     def __setstate__(self, state):
@@ -1089,6 +1275,11 @@ generation = time.time()
 serial = 0
 
 
+# Types that Rollback.spill compresses by value, rather than keeping a
+# reference to.
+spill_value_types = { int, long, float, complex, bool, str, unicode, tuple, type(None) }
+
+
 class Rollback(renpy.object.Object):
     """
     Allows the state of the game to be rolled back to the point just
@@ -1122,6 +1313,15 @@ class Rollback(renpy.object.Object):
 
     identifier = None
 
+    nosave = [ 'spilled', 'spilled_externals' ]
+
+    # If not None, a compressed pickle of the stores, delta_ebc, and
+    # objects fields, created by spill.
+    spilled = None
+
+    # A list of the objects referred to by spilled.
+    spilled_externals = None
+
     def __init__(self):
 
         super(Rollback, self).__init__()
@@ -1178,12 +1378,19 @@ class Rollback(renpy.object.Object):
         if version < 5:
             self.delta_ebc = { }
 
-    def purge_unreachable(self, reachable, wait):
+    def purge_unreachable(self, reachable, wait, keep):
         """
         Adds objects that are reachable from the store of this
         rollback to the set of reachable objects, and purges
         information that is stored about totally unreachable objects.
 
+        `keep`
+            A list that the decompressed copies of a spilled Rollback
+            are added to. The ids of the containers in the copies are in
+            `reachable`, so the copies have to be kept alive until the
+            purge is over, or a container that's made later could reuse
+            an id and not be looked into.
+
         Returns True if this is the first time this method has been
         called, or False if it has already been called once before.
         """
@@ -1193,9 +1400,16 @@ class Rollback(renpy.object.Object):
 
         self.purged = True
 
+        # A spilled Rollback is examined through a copy, so it can stay
+        # compressed unless there is something to purge.
+        stores, delta_ebc, objects = self.unspilled()
+
+        if self.spilled is not None:
+            keep.append((stores, delta_ebc, objects))
+
         # Add objects reachable from the stores. (Objects that might be
         # unreachable at the moment.)
-        for changes in self.stores.itervalues():
+        for changes in stores.itervalues():
             for _k, v in changes.iteritems():
                 if v is not deleted:
                     reached(v, reachable, wait)
@@ -1212,7 +1426,7 @@ class Rollback(renpy.object.Object):
         # Purge object update information for unreachable objects.
         new_objects = [ ]
 
-        for o, rb in self.objects:
+        for o, rb in objects:
             if reachable.get(id(o), 0):
                 new_objects.append((o, rb))
                 reached(rb, reachable, wait)
@@ -1221,7 +1435,18 @@ class Rollback(renpy.object.Object):
                     print("Removing unreachable:", o, file=renpy.log.real_stdout)
                     pass
 
-        self.objects = new_objects
+        if self.spilled is None:
+            self.objects = new_objects
+
+        elif len(new_objects) != len(objects):
+            self.spilled = None
+            self.spilled_externals = None
+
+            self.stores = stores
+            self.delta_ebc = delta_ebc
+            self.objects = new_objects
+
+            self.spill()
 
         return True
 
@@ -1231,6 +1456,12 @@ class Rollback(renpy.object.Object):
         previous checkpoint.
         """
 
+        global mutation_serial
+
+        self.unspill()
+
+        mutation_serial += 1
+
         for obj, roll in reversed(self.objects):
             if roll is not None:
                 obj._rollback(roll)
@@ -1260,6 +1491,121 @@ class Rollback(renpy.object.Object):
         renpy.game.contexts.pop()
         renpy.game.contexts.append(self.context)
 
+    def __getstate__(self):
+        rv = super(Rollback, self).__getstate__()
+
+        # This may run in the autosave thread, so the spilled fields are
+        # decompressed into the state, rather than into this object.
+        if self.spilled is not None:
+            rv["stores"], rv["delta_ebc"], rv["objects"] = self.unspilled()
+
+        return rv
+
+    def spill(self):
+        """
+        Compresses the stores, delta_ebc, and objects fields of this
+        Rollback into a string, to save memory while it's unlikely to be
+        needed.
+
+        Only the containers created by the rollback system, and immutable
+        values, are compressed. Everything else might be shared with the
+        rest of the game, so it's kept as a reference to preserve its
+        identity.
+        """
+
+        if self.spilled is not None:
+            return
+
+        # The ids of the containers that belong to this Rollback.
+        internal = { id(self.stores), id(self.delta_ebc), id(self.objects) }
+
+        for d in self.stores.itervalues():
+            if d:
+                internal.add(id(d))
+
+        for d in self.delta_ebc.itervalues():
+            if d:
+                internal.add(id(d))
+
+        for _o, roll in self.objects:
+            if type(roll) in (list, dict):
+                internal.add(id(roll))
+
+        externals = [ ]
+        external_ids = { }
+
+        def persistent_id(o):
+
+            if type(o) in spill_value_types:
+                return None
+
+            ido = id(o)
+
+            if ido in internal:
+                return None
+
+            rv = external_ids.get(ido, None)
+
+            if rv is None:
+                rv = external_ids[ido] = len(externals)
+                externals.append(o)
+
+            return rv
+
+        f = StringIO()
+        pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump((self.stores, self.delta_ebc, self.objects))
+
+        # The externals are set first, so unspilled never sees spilled
+        # without them.
+        self.spilled_externals = externals
+        self.spilled = zlib.compress(f.getvalue(), 1)
+
+        self.stores = None
+        self.delta_ebc = None
+        self.objects = None
+
+        renpy.performance.stat("rollback.spills")
+
+    def unspilled(self):
+        """
+        Returns a (stores, delta_ebc, objects) tuple. If this Rollback is
+        spilled, these are newly decompressed copies, and this Rollback is
+        left unchanged. Otherwise, they are the fields themselves.
+        """
+
+        externals = self.spilled_externals
+        spilled = self.spilled
+
+        if spilled is None:
+            return self.stores, self.delta_ebc, self.objects
+
+        start = time.time()
+
+        unpickler = cPickle.Unpickler(StringIO(zlib.decompress(spilled)))
+        unpickler.persistent_load = externals.__getitem__
+
+        rv = unpickler.load()
+
+        renpy.performance.stat("rollback.unspills")
+        renpy.performance.stat("rollback.unspill_time", time.time() - start)
+
+        return rv
+
+    def unspill(self):
+        """
+        Restores the fields compressed by spill.
+        """
+
+        if self.spilled is None:
+            return
+
+        self.stores, self.delta_ebc, self.objects = self.unspilled()
+
+        self.spilled = None
+        self.spilled_externals = None
+
     def rollback_control(self):
         """
         This rolls back only the control information, while leaving
@@ -1388,6 +1734,11 @@ class RollbackLog(renpy.object.Object):
         if len(self.log) > renpy.config.rollback_length:
             self.log = self.log[-renpy.config.rollback_length:]
 
+        # Compress the older entries.
+        if renpy.config.rollback_compression_length is not None:
+            for rb in self.log[:max(0, len(self.log) - renpy.config.rollback_compression_length)]:
+                rb.spill()
+
         # check for the end of fixed rollback
         if self.log and self.log[-1] == self.current:
 
@@ -1492,13 +1843,19 @@ class RollbackLog(renpy.object.Object):
 
         reachable = { }
 
+        # Classes may have changed since the last purge.
+        reach_kinds.clear()
+
         reached_vars(roots, reachable, wait)
 
         revlog = self.log[:]
         revlog.reverse()
 
+        # The decompressed copies of spilled Rollbacks.
+        keep = [ ]
+
         for i in revlog:
-            if not i.purge_unreachable(reachable, wait):
+            if not i.purge_unreachable(reachable, wait, keep):
                 break
 
     def in_rollback(self):
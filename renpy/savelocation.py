@@ -81,6 +81,24 @@ class FileLocation(object):
         # The data loaded from the persistent file.
         self.persistent_data = None
 
+        # The mtime of the directory when it was last listed, or None if
+        # the next scan needs to list it.
+        self.directory_mtime = None
+
+        # The file the metadata index is stored in.
+        self.index_filename = os.path.join(self.directory, "saveindex.json")
+
+        # A map from slotname to a dict giving the mtime of the save file,
+        # its json, and the name of its screenshot member. This lets
+        # the save and load screens get at the metadata without opening
+        # each save file.
+        self.index = { }
+
+        # True if the index needs to be written to disk.
+        self.index_dirty = False
+
+        self.load_index()
+
     def filename(self, slotname):
         """
         Given a slot name, returns a filename.
@@ -88,6 +106,111 @@ class FileLocation(object):
 
         return os.path.join(self.directory, renpy.exports.fsencode(slotname + renpy.savegame_suffix))
 
+    def load_index(self):
+        """
+        Loads the metadata index from disk, if it exists.
+        """
+
+        try:
+            with open(self.index_filename, "rb") as f:
+                index = json.load(f)
+
+            if isinstance(index, dict):
+                self.index = index
+
+        except:
+            self.index = { }
+
+    def save_index(self):
+        """
+        Writes the metadata index to disk, if it has changed.
+        """
+
+        if not (self.active and self.index_dirty):
+            return
+
+        with disk_lock:
+
+            fn = self.index_filename
+            fn_tmp = fn + tmp
+
+            try:
+                with open(fn_tmp, "wb") as f:
+                    json.dump(self.index, f)
+
+                safe_rename(fn_tmp, fn)
+            except:
+                return
+
+            self.index_dirty = False
+
+            # Writing the index changes the directory.
+            self.directory_mtime = None
+
+    def read_index_entry(self, slotname, mtime):
+        """
+        Opens the save file in `slotname`, and returns an index entry for
+        it. Returns None if the file can't be opened.
+        """
+
+        try:
+            filename = self.filename(slotname)
+            zf = zipfile.ZipFile(filename, "r")
+        except:
+            return None
+
+        try:
+
+            try:
+                data = json.loads(zf.read("json"))
+            except:
+                try:
+                    extra_info = zf.read("extra_info").decode("utf-8")
+                    data = { "_save_name" : extra_info }
+                except:
+                    data = { }
+
+            names = zf.namelist()
+
+            if "screenshot.tga" in names:
+                screenshot = "screenshot.tga"
+            elif "screenshot.png" in names:
+                screenshot = "screenshot.png"
+            else:
+                screenshot = None
+
+        finally:
+            zf.close()
+
+        return { "mtime" : mtime, "json" : data, "screenshot" : screenshot }
+
+    def index_entry(self, slotname):
+        """
+        Returns the index entry for `slotname`, reading it from the save
+        file if the index is missing it or out of date. Returns None if
+        the slot is empty.
+        """
+
+        with disk_lock:
+
+            mtime = self.mtimes.get(slotname, None)
+
+            if mtime is None:
+                return None
+
+            rv = self.index.get(slotname, None)
+
+            if (rv is None) or (rv.get("mtime", None) != mtime):
+                rv = self.read_index_entry(slotname, mtime)
+
+                if rv is None:
+                    return None
+
+                self.index[slotname] = rv
+                self.index_dirty = True
+
+            return rv
+
     def scan(self):
         """
         Scan for files that are added or removed.
@@ -97,6 +220,23 @@ class FileLocation(object):
             return
 
         with disk_lock:
+            self.scan_directory()
+            self.save_index()
+
+    def scan_directory(self):
+        """
+        Called by scan, with the disk lock held, to do the actual scanning.
+        """
+
+        try:
+            directory_mtime = os.path.getmtime(self.directory)
+        except:
+            directory_mtime = None
+
+        # Adding, removing, or renaming a save changes the mtime of the
+        # directory, so if that hasn't changed there's no need to stat
+        # every save file.
+        if (directory_mtime is None) or (directory_mtime != self.directory_mtime):
 
             old_mtimes = self.mtimes
             new_mtimes = { }
@@ -125,16 +265,29 @@ class FileLocation(object):
                 if slotname not in new_mtimes:
                     clear_slot(slotname)
 
-            for pfn in [ self.persistent + ".new", self.persistent ]:
-                if os.path.exists(pfn):
-                    mtime = os.path.getmtime(pfn)
+            for slotname in list(self.index):
+                if slotname not in new_mtimes:
+                    del self.index[slotname]
+                    self.index_dirty = True
+
+            # Filesystem timestamps can be coarse, so a directory that was
+            # changed very recently may change again without its mtime
+            # changing. Only trust the mtime once it's a few seconds old.
+            if (directory_mtime is not None) and (time.time() - directory_mtime > 2):
+                self.directory_mtime = directory_mtime
+            else:
+                self.directory_mtime = None
+
+        for pfn in [ self.persistent + ".new", self.persistent ]:
+            if os.path.exists(pfn):
+                mtime = os.path.getmtime(pfn)
 
-                    if mtime != self.persistent_mtime:
-                        data = renpy.persistent.load(pfn)
-                        if data is not None:
-                            self.persistent_mtime = mtime
-                            self.persistent_data = data
-                            break
+                if mtime != self.persistent_mtime:
+                    data = renpy.persistent.load(pfn)
+                    if data is not None:
+                        self.persistent_mtime = mtime
+                        self.persistent_data = data
+                        break
 
     def save(self, slotname, record):
         """
@@ -146,6 +299,14 @@ class FileLocation(object):
         with disk_lock:
             record.write_file(filename)
 
+            try:
+                mtime = os.path.getmtime(filename)
+                self.mtimes[slotname] = mtime
+                self.index[slotname] = { "mtime" : mtime, "json" : json.loads(record.json), "screenshot" : "screenshot.png" }
+                self.index_dirty = True
+            except:
+                pass
+
         self.scan()
 
     def list(self):
@@ -173,33 +334,12 @@ class FileLocation(object):
         Returns None if the slot is empty.
         """
 
-        with disk_lock:
+        entry = self.index_entry(slotname)
 
-            try:
-                filename = self.filename(slotname)
-                zf = zipfile.ZipFile(filename, "r")
-            except:
-                return None
-
-            try:
-
-                try:
-                    data = zf.read("json")
-                    data = json.loads(data)
-                    return data
-                except:
-                    pass
-
-                try:
-                    extra_info = zf.read("extra_info").decode("utf-8")
-                    return { "_save_name" : extra_info }
-                except:
-                    pass
-
-                return { }
+        if entry is None:
+            return None
 
-            finally:
-                zf.close()
+        return entry["json"]
 
     def screenshot(self, slotname):
         """
@@ -208,34 +348,12 @@ class FileLocation(object):
         Returns None if the slot is empty.
         """
 
-        with disk_lock:
+        entry = self.index_entry(slotname)
 
-            mtime = self.mtime(slotname)
-
-            if mtime is None:
-                return None
-
-            try:
-                filename = self.filename(slotname)
-                zf = zipfile.ZipFile(filename, "r")
-            except:
-                return None
-
-            try:
-                png = False
-                zf.getinfo('screenshot.tga')
-            except:
-                png = True
-                zf.getinfo('screenshot.png')
-
-            zf.close()
-
-            if png:
-                screenshot = renpy.display.im.ZipFileImage(filename, "screenshot.png", mtime)
-            else:
-                screenshot = renpy.display.im.ZipFileImage(filename, "screenshot.tga", mtime)
+        if (entry is None) or (entry["screenshot"] is None):
+            return None
 
-            return screenshot
+        return renpy.display.im.ZipFileImage(self.filename(slotname), entry["screenshot"], entry["mtime"])
 
     def load(self, slotname):
         """
@@ -264,6 +382,11 @@ class FileLocation(object):
             if os.path.exists(filename):
                 os.unlink(filename)
 
+            self.mtimes.pop(slotname, None)
+
+            if self.index.pop(slotname, None) is not None:
+                self.index_dirty = True
+
             self.scan()
 
     def rename(self, old, new):
@@ -273,6 +396,9 @@ class FileLocation(object):
 
         with disk_lock:
 
+            old_slotname = old
+            new_slotname = new
+
             old = self.filename(old)
             new = self.filename(new)
 
@@ -284,6 +410,16 @@ class FileLocation(object):
 
             os.rename(old, new)
 
+            # Renaming keeps the mtime, so the index entry can move with
+            # the file.
+            entry = self.index.pop(old_slotname, None)
+            self.index.pop(new_slotname, None)
+
+            if entry is not None:
+                self.index[new_slotname] = entry
+
+            self.index_dirty = True
+
             self.scan()
 
     def copy(self, old, new):
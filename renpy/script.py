@@ -33,6 +33,7 @@ import time
 import marshal
 import struct
 import zlib
+import threading
 
 from cPickle import loads, dumps
 import shutil
@@ -52,6 +53,13 @@ RPYC2_HEADER = "RENPY RPC2"
 # A string
 BYTECODE_FILE = "cache/bytecode.rpyb"
 
+# The directory containing the shards of the bytecode cache.
+BYTECODE_DIR = "cache/bytecode/"
+
+# The number of files a CompilePool parses ahead of the file being loaded,
+# per worker.
+COMPILE_LOOKAHEAD = 2
+
 
 class ScriptError(Exception):
     """
@@ -74,6 +82,369 @@ def collapse_stmts(stmts):
     return rv
 
 
+class BytecodeCache(object):
+    """
+    The bytecode cache, sharded by the file the code comes from. Each shard
+    is stored in its own file in BYTECODE_DIR, is loaded the first time
+    code from its file is looked up, and is only written back when code
+    from its file has been compiled.
+    """
+
+    def __init__(self):
+
+        # A map from shard name to the dict of bytecode loaded from that
+        # shard.
+        self.oldcache = { }
+
+        # A map from shard name to the dict of bytecode that has been used
+        # this run, and will be written out if the shard is saved.
+        self.newcache = { }
+
+        # The set of shards that need to be saved.
+        self.dirty = set()
+
+        # The contents of BYTECODE_FILE, the cache used by older versions
+        # of Ren'Py, or None if it hasn't been loaded. This is loaded the
+        # first time a lookup misses, to avoid recompiling everything after
+        # an upgrade, and is moved into the shards by the first save.
+        self.legacy = None
+
+        self.lock = threading.Lock()
+
+    def shard_name(self, filename):
+        """
+        Returns the name of the shard containing code from `filename`.
+        """
+
+        if isinstance(filename, unicode):
+            filename = filename.encode("utf-8")
+
+        return hashlib.md5(filename).hexdigest()[:16]
+
+    def read(self, fn):
+        """
+        Reads the cache file `fn`, returning the dict of bytecode in it, or
+        an empty dict if it can't be read.
+        """
+
+        try:
+            f = renpy.loader.load_core(fn)
+            if f is None:
+                return { }
+
+            data = f.read()
+            f.close()
+
+            version, cache = loads(data.decode("zlib"))
+
+            if version == BYTECODE_VERSION:
+                return cache
+
+        except:
+            pass
+
+        return { }
+
+    def load_shard(self, shard):
+        """
+        Loads `shard`, if it hasn't been loaded yet. This must be called with
+        the lock held.
+        """
+
+        if shard in self.oldcache:
+            return
+
+        start = time.time()
+
+        self.newcache[shard] = { }
+        self.oldcache[shard] = self.read(BYTECODE_DIR + shard + ".rpyb")
+
+        renpy.performance.stat("bytecode.shards_loaded")
+        renpy.performance.stat("bytecode.load_time", time.time() - start)
+
+    def load_legacy(self):
+        """
+        Loads BYTECODE_FILE, if it hasn't been loaded yet. This must be called
+        with the lock held.
+        """
+
+        if self.legacy is None:
+            self.legacy = self.read(BYTECODE_FILE)
+
+    def get(self, filename, key):
+        """
+        Returns the bytecode for `key`, which is code from `filename`, or
+        None if it is not in the cache.
+        """
+
+        shard = self.shard_name(filename)
+
+        with self.lock:
+
+            self.load_shard(shard)
+
+            rv = self.oldcache[shard].get(key, None)
+
+            if rv is None:
+
+                self.load_legacy()
+
+                rv = self.legacy.get(key, None)
+
+                if rv is None:
+                    renpy.performance.stat("bytecode.misses")
+                    return None
+
+                self.dirty.add(shard)
+
+            self.newcache[shard][key] = rv
+            return rv
+
+    def set(self, filename, key, code):
+        """
+        Stores the bytecode `code` for `key`, which is code from `filename`.
+        """
+
+        shard = self.shard_name(filename)
+
+        with self.lock:
+            self.load_shard(shard)
+            self.newcache[shard][key] = code
+            self.dirty.add(shard)
+
+    def migrate_legacy(self):
+        """
+        Moves the entries in BYTECODE_FILE into the shards they belong to,
+        and marks those shards as needing to be saved. Returns the path
+        to BYTECODE_FILE if it should be deleted once the shards have been
+        saved, or None if there's nothing to migrate.
+        """
+
+        legacy_fn = renpy.loader.get_path(BYTECODE_FILE)
+
+        if not os.path.exists(legacy_fn):
+            return None
+
+        with self.lock:
+            self.load_legacy()
+
+        # Shards used this run only keep the entries that were used, so
+        # legacy entries are only added to shards that aren't dirty.
+        used = set(self.dirty)
+
+        for key, code in self.legacy.iteritems():
+
+            try:
+                if isinstance(key, tuple):
+                    filename = key[1]
+                else:
+                    filename = marshal.loads(code).co_filename
+            except:
+                continue
+
+            shard = self.shard_name(filename)
+
+            if shard in used:
+                continue
+
+            with self.lock:
+
+                if shard not in self.dirty:
+                    self.load_shard(shard)
+                    self.newcache[shard] = dict(self.oldcache[shard])
+                    self.dirty.add(shard)
+
+                self.newcache[shard].setdefault(key, code)
+
+        return legacy_fn
+
+    def save(self):
+        """
+        Writes out the shards that have changed. The first time this is
+        called, the contents of BYTECODE_FILE are moved into the shards.
+        """
+
+        legacy_fn = self.migrate_legacy()
+
+        ok = True
+
+        for shard in sorted(self.dirty):
+
+            try:
+                fn = renpy.loader.get_path(BYTECODE_DIR + shard + ".rpyb")
+                data = dumps((BYTECODE_VERSION, self.newcache[shard]), 2).encode("zlib")
+
+                with open(fn, "wb") as f:
+                    f.write(data)
+
+                renpy.performance.stat("bytecode.shards_written")
+                renpy.performance.stat("bytecode.bytes_written", len(data))
+
+            except:
+                ok = False
+
+        self.dirty.clear()
+
+        if ok and (legacy_fn is not None):
+            try:
+                os.unlink(legacy_fn)
+                self.legacy = { }
+            except:
+                pass
+
+
+class CompileTimes(object):
+    """
+    Records the time spent parsing, pickling, and compressing a single .rpy
+    file.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.parse = 0.0
+        self.pickle = 0.0
+        self.compress = 0.0
+
+
+def parse_worker(fn):
+    """
+    Parses the .rpy file `fn` in a CompilePool worker process, names its
+    statements, and pickles them in the form stored in slot 1 of the .rpyc
+    file.
+
+    Returns a (pickled data, lines, files, missing, parse time, pickle time)
+    tuple. Lines, files, and missing are what parsing the file added to
+    renpy.scriptedit.lines, renpy.scriptedit.files, and renpy.add_from.missing,
+    which the main process merges into its own copies. The pickled data is
+    None if the file could not be parsed, in which case the file is parsed
+    again in the main process, so the errors are reported there.
+    """
+
+    script = renpy.game.script
+
+    renpy.parser.parse_errors = [ ]
+    renpy.scriptedit.lines.clear()
+    renpy.scriptedit.files.clear()
+    renpy.add_from.missing.clear()
+
+    start = time.time()
+    stmts = renpy.parser.parse(fn)
+    parse_time = time.time() - start
+
+    lines = dict(renpy.scriptedit.lines)
+    files = set(renpy.scriptedit.files)
+    missing = dict(renpy.add_from.missing)
+
+    if stmts is None:
+        return None, lines, files, missing, parse_time, 0.0
+
+    script.name_statements(stmts, fn)
+
+    start = time.time()
+    data = dumps((script.rpyc_data(), stmts), 2)
+    pickle_time = time.time() - start
+
+    return data, lines, files, missing, parse_time, pickle_time
+
+
+class CompilePool(object):
+    """
+    Parses .rpy files in a pool of forked worker processes, a few files
+    ahead of the file that the script is loading.
+
+    As python early blocks can change how later files are parsed (by
+    registering statements, for example), the pool is restarted whenever
+    an early block runs, so the remaining files are parsed by processes
+    that have seen it.
+    """
+
+    def __init__(self, script, workers, files):
+
+        self.script = script
+        self.workers = workers
+
+        # The full filenames of the .rpy files to parse, in load order.
+        self.files = files
+
+        # The index of the next file to submit to the pool.
+        self.next = 0
+
+        # A map from filename to the AsyncResult for that file.
+        self.results = { }
+
+        # The value of script.early_count when the pool was forked.
+        self.early_count = None
+
+        self.pool = None
+
+    def start(self, index):
+        """
+        Forks a new pool, that will parse files starting at `index`.
+        """
+
+        import multiprocessing
+
+        self.stop()
+
+        self.pool = multiprocessing.Pool(self.workers)
+        self.early_count = self.script.early_count
+        self.next = index
+        self.results = { }
+
+    def stop(self):
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def get(self, fn):
+        """
+        Returns the parse results for `fn`, as a (statements, pickled data,
+        parse time, pickle time) tuple, or None if `fn` should be parsed in
+        this process. The statements have already been named, and the
+        pickled data can be written to slot 1 of the .rpyc file as-is.
+        """
+
+        if fn not in self.files:
+            return None
+
+        index = self.files.index(fn)
+
+        if (self.pool is None) or (self.early_count != self.script.early_count) or (index >= self.next):
+            self.start(index)
+
+        limit = min(len(self.files), index + 1 + self.workers * COMPILE_LOOKAHEAD)
+
+        while self.next < limit:
+            i = self.files[self.next]
+            self.results[i] = self.pool.apply_async(parse_worker, (i,))
+            self.next += 1
+
+        result = self.results.pop(fn, None)
+
+        if result is None:
+            return None
+
+        try:
+            data, lines, files, missing, parse_time, pickle_time = result.get()
+        except:
+            return None
+
+        if data is None:
+            return None
+
+        renpy.scriptedit.lines.update(lines)
+        renpy.scriptedit.files.update(files)
+
+        for k, v in missing.items():
+            renpy.add_from.missing[k].extend(v)
+
+        _data, stmts = loads(data)
+
+        return stmts, data, parse_time, pickle_time
+
+
 class Script(object):
     """
     This class represents a Ren'Py script, which is parsed out of a
@@ -121,10 +492,8 @@ class Script(object):
 
         self.record_pycode = True
 
-        # Bytecode caches.
-        self.bytecode_oldcache = { }
-        self.bytecode_newcache = { }
-        self.bytecode_dirty = False
+        # The bytecode cache.
+        self.bytecode_cache = None
 
         self.translator = renpy.translation.ScriptTranslator()
         self.init_bytecode()
@@ -142,6 +511,24 @@ class Script(object):
 
         self.duplicate_labels = [ ]
 
+        # The number of python early blocks that have been run.
+        self.early_count = 0
+
+        # The CompilePool used to parse .rpy files, if any.
+        self.compile_pool = None
+
+        # A list of CompileTimes objects, one per .rpy file parsed.
+        self.compile_times = [ ]
+
+        # The CompileTimes for the .rpy file being loaded.
+        self.current_times = None
+
+        # The zlib compression level used when writing .rpyc files.
+        self.compression_level = getattr(renpy.game.args, "compile_level", 9)
+
+        if self.compression_level not in range(-1, 10):
+            raise Exception("The compile level must be between -1 and 9, not {!r}.".format(self.compression_level))
+
     def choose_backupdir(self):
 
         if renpy.mobile:
@@ -262,8 +649,26 @@ class Script(object):
 
         initcode = [ ]
 
-        for fn, dir in script_files:  # @ReservedAssignment
-            self.load_appropriate_file(".rpyc", ".rpy", dir, fn, initcode)
+        workers = getattr(renpy.game.args, "compile_workers", 0)
+
+        if workers and hasattr(os, "fork") and not renpy.mobile:
+            parse_files = [ dir + "/" + fn + ".rpy" for fn, dir in script_files if self.rpy_needs_parse(dir, fn) ]
+
+            if parse_files:
+                self.compile_pool = CompilePool(self, workers, parse_files)
+
+        try:
+            for fn, dir in script_files:  # @ReservedAssignment
+                renpy.performance.begin("load " + fn)
+
+                try:
+                    self.load_appropriate_file(".rpyc", ".rpy", dir, fn, initcode)
+                finally:
+                    renpy.performance.end("load " + fn)
+        finally:
+            if self.compile_pool is not None:
+                self.compile_pool.stop()
+                self.compile_pool = None
 
         # Make the sort stable.
         initcode = [ (prio, index, code) for index, (prio, code) in
@@ -273,6 +678,101 @@ class Script(object):
 
         self.initcode = [ (prio, code) for prio, index, code in initcode ]
 
+    def rpy_needs_parse(self, dir, fn):  # @ReservedAssignment
+        """
+        Returns true if load_appropriate_file will have to parse the .rpy
+        file for the script file `fn` in `dir`, because the .rpyc file is
+        missing or out of date.
+        """
+
+        if dir is None:
+            return False
+
+        rpyfn = dir + "/" + fn + ".rpy"
+        rpycfn = dir + "/" + fn + ".rpyc"
+
+        if not os.path.exists(rpyfn):
+            return False
+
+        if not os.path.exists(rpycfn):
+            return True
+
+        if renpy.game.args.compile:  # @UndefinedVariable
+            return True
+
+        try:
+            with open(rpyfn, "rU") as f:
+                rpydigest = hashlib.md5(f.read()).digest()
+
+            with open(rpycfn, "rb") as f:
+                f.seek(-hashlib.md5().digest_size, 2)
+                rpycdigest = f.read(hashlib.md5().digest_size)
+        except:
+            return True
+
+        return rpydigest != rpycdigest
+
+    def rpyc_data(self):
+        """
+        Returns the data dictionary that is pickled alongside the statements
+        in a .rpyc file.
+        """
+
+        data = { }
+        data['version'] = script_version
+        data['key'] = self.key or 'unlocked'
+
+        return data
+
+    def name_statements(self, stmts, fullfn):
+        """
+        Assigns names to `stmts`, which were parsed from `fullfn`. If there
+        is a corresponding .rpyc file, names of unchanged statements are
+        taken from it.
+        """
+
+        rpycfn = fullfn + "c"
+
+        # See if we have a corresponding .rpyc file. If so, then
+        # we want to try to upgrade our .rpy file with it.
+        try:
+            self.record_pycode = False
+
+            with open(rpycfn, "rb") as rpycf:
+                bindata = self.read_rpyc_data(rpycf, 1)
+
+            old_data, old_stmts = loads(bindata)
+
+            self.merge_names(old_stmts, stmts)
+
+            del old_data
+            del old_stmts
+        except:
+            pass
+        finally:
+            self.record_pycode = True
+
+        self.assign_names(stmts, fullfn)
+
+    def report_compile_times(self):
+        """
+        Prints the time taken to parse, pickle, and compress each .rpy file
+        that was compiled.
+        """
+
+        print("{:>8} {:>8} {:>8} {:>8}  {}".format("parse", "pickle", "compress", "total", "file"))
+
+        totals = CompileTimes("(total)")
+
+        for i in self.compile_times + [ totals ]:
+            total = i.parse + i.pickle + i.compress
+
+            print("{:8.4f} {:8.4f} {:8.4f} {:8.4f}  {}".format(i.parse, i.pickle, i.compress, total, i.fn))
+
+            totals.parse += i.parse
+            totals.pickle += i.pickle
+            totals.compress += i.compress
+
     def load_module(self, name):
 
         files = [ (fn, dir) for fn, dir in self.module_files if fn == name ]  # @ReservedAssignment
@@ -447,6 +947,7 @@ class Script(object):
 
             if node.early_execute:
                 node.early_execute()
+                self.early_count += 1
 
         if self.all_stmts is not None:
             self.all_stmts.extend(all_stmts)
@@ -473,10 +974,15 @@ class Script(object):
 
         f.seek(0, 2)
 
+        start_time = time.time()
+
         start = f.tell()
-        data = zlib.compress(data, 9)
+        data = zlib.compress(data, self.compression_level)
         f.write(data)
 
+        if self.current_times is not None:
+            self.current_times.compress += time.time() - start_time
+
         f.seek(len(RPYC2_HEADER) + 12 * (slot - 1), 0)
         f.write(struct.pack("III", slot, start, len(data)))
 
@@ -507,9 +1013,9 @@ class Script(object):
                 return None
 
             f.seek(0)
-            data = f.read()
+            data = renpy.loader.read_view(f)
 
-            return data.decode("zlib")
+            return zlib.decompress(data)
 
         # RPYC2 path.
         pos = len(RPYC2_HEADER)
@@ -526,7 +1032,7 @@ class Script(object):
             pos += 12
 
         f.seek(start)
-        data = f.read(length)
+        data = renpy.loader.read_view(f, length)
 
         return zlib.decompress(data)
 
@@ -550,35 +1056,31 @@ class Script(object):
             fullfn = dir + "/" + fn
             rpycfn = fullfn + "c"
 
-            stmts = renpy.parser.parse(fullfn)
-
-            data = { }
-            data['version'] = script_version
-            data['key'] = self.key or 'unlocked'
-
-            if stmts is None:
-                return data, [ ]
+            times = self.current_times = CompileTimes(fullfn)
+            self.compile_times.append(times)
 
-            # See if we have a corresponding .rpyc file. If so, then
-            # we want to try to upgrade our .rpy file with it.
-            try:
-                self.record_pycode = False
+            parsed = None
+            pooldata = None
 
-                with open(rpycfn, "rb") as rpycf:
-                    bindata = self.read_rpyc_data(rpycf, 1)
+            if self.compile_pool is not None:
+                parsed = self.compile_pool.get(fullfn)
 
-                old_data, old_stmts = loads(bindata)
+            if parsed is not None:
+                stmts, pooldata, times.parse, times.pickle = parsed
+            else:
+                start_time = time.time()
+                stmts = renpy.parser.parse(fullfn)
+                times.parse = time.time() - start_time
 
-                self.merge_names(old_stmts, stmts)
+            data = self.rpyc_data()
 
-                del old_data
-                del old_stmts
-            except:
-                pass
-            finally:
-                self.record_pycode = True
+            if stmts is None:
+                self.current_times = None
+                return data, [ ]
 
-            self.assign_names(stmts, fullfn)
+            # Statements from the compile pool have been named by the worker.
+            if pooldata is None:
+                self.name_statements(stmts, fullfn)
 
             if not renpy.macapp:
 
@@ -586,7 +1088,15 @@ class Script(object):
                     f = file(rpycfn, "wb")
 
                     self.write_rpyc_header(f)
-                    self.write_rpyc_data(f, 1, dumps((data, stmts), 2))
+
+                    if pooldata is not None:
+                        bindata = pooldata
+                    else:
+                        start_time = time.time()
+                        bindata = dumps((data, stmts), 2)
+                        times.pickle += time.time() - start_time
+
+                    self.write_rpyc_data(f, 1, bindata)
                 except:
                     pass
 
@@ -595,7 +1105,11 @@ class Script(object):
             if not renpy.macapp:
 
                 try:
-                    self.write_rpyc_data(f, 2, dumps((data, stmts), 2))
+                    start_time = time.time()
+                    bindata = dumps((data, stmts), 2)
+                    times.pickle += time.time() - start_time
+
+                    self.write_rpyc_data(f, 2, bindata)
 
                     with open(fullfn, "rU") as fullf:
                         rpydigest = hashlib.md5(fullf.read()).digest()
@@ -606,6 +1120,7 @@ class Script(object):
                 except:
                     pass
 
+            self.current_times = None
             self.loaded_rpy = True
 
         elif fn.endswith(".rpyc") or fn.endswith(".rpymc"):
@@ -760,17 +1275,11 @@ class Script(object):
 
     def init_bytecode(self):
         """
-        Init/Loads the bytecode cache.
+        Init the bytecode cache. The shards of the cache are loaded as they
+        are needed.
         """
 
-        # Load the oldcache.
-        try:
-            version, cache = loads(renpy.loader.load(BYTECODE_FILE).read().decode("zlib"))
-            if version == BYTECODE_VERSION:
-                self.bytecode_oldcache = cache
-
-        except:
-            pass
+        self.bytecode_cache = BytecodeCache()
 
     def update_bytecode(self):
         """
@@ -792,12 +1301,10 @@ class Script(object):
 
             key = i.get_hash() + MAGIC
 
-            code = self.bytecode_oldcache.get(key, None)
+            code = self.bytecode_cache.get(i.location[0], key)
 
             if code is None:
 
-                self.bytecode_dirty = True
-
                 old_ei = renpy.game.exception_info
                 renpy.game.exception_info = "While compiling python block starting at line %d of %s." % (i.location[1], i.location[0])
 
@@ -835,7 +1342,8 @@ class Script(object):
 
                 renpy.game.exception_info = old_ei
 
-            self.bytecode_newcache[key] = code
+                self.bytecode_cache.set(i.location[0], key, code)
+
             i.bytecode = marshal.loads(code)
 
         self.all_pycode = [ ]
@@ -844,15 +1352,7 @@ class Script(object):
         if renpy.macapp:
             return
 
-        if self.bytecode_dirty:
-            try:
-                fn = renpy.loader.get_path(BYTECODE_FILE)
-
-                with open(fn, "wb") as f:
-                    data = (BYTECODE_VERSION, self.bytecode_newcache)
-                    f.write(dumps(data, 2).encode("zlib"))
-            except:
-                pass
+        self.bytecode_cache.save()
 
     def lookup(self, label):
         """
@@ -904,3 +1404,14 @@ class Script(object):
 
         if renpy.parser.report_parse_errors():
             raise SystemExit(-1)
+
+
+def compile_benchmark():
+    renpy.arguments.takes_no_arguments("Compiles the script, and reports the time taken to parse, pickle, and compress each file.")
+
+    renpy.game.script.report_compile_times()
+
+    return False
+
+
+renpy.arguments.register_command("compile-benchmark", compile_benchmark)
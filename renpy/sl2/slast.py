@@ -30,6 +30,7 @@ from __future__ import print_function
 
 import ast
 import collections
+import itertools
 import linecache
 from cPickle import loads, dumps
 import zlib
@@ -47,7 +48,10 @@ from renpy.python import py_eval_bytecode
 from renpy.pyanalysis import Analysis, NOT_CONST, GLOBAL_CONST, ccache
 
 import hashlib
+import marshal
+import re
 import time
+import types
 
 # This file contains the abstract syntax tree for a screen language
 # screen.
@@ -137,6 +141,10 @@ class SLContext(renpy.ui.Addable):
         # True if we're updating the screen.
         self.updating = False
 
+        # The value of renpy.python.mutation_serial when the screen started
+        # updating.
+        self.mutation_serial = 0
+
         # A list of nodes we've predicted, for cases where predicting more than
         # once could be a performance problem.
         self.predicted = set()
@@ -164,6 +172,16 @@ class SLContext(renpy.ui.Addable):
         self.new_use_cache = { }
         self.old_use_cache = { }
 
+        # True if a statement in this context depends on a value that
+        # can't be tracked, and so the statements containing it can't be
+        # reused when their dependencies are unchanged.
+        self.untracked = False
+
+        # If the children of this context are the children of a virtual
+        # displayable, that displayable. A for statement executed in this
+        # context asks it which elements to create children for.
+        self.virtual = None
+
     def add(self, d, key):
         self.children.append(d)
 
@@ -254,6 +272,20 @@ class SLNode(object):
 
         raise Exception("execute not implemented by " + type(self).__name__)
 
+    def dependencies(self, analysis, serials):
+        """
+        Returns a set giving the names of the variables this node and its
+        children depend on, or None if that can't be known. This should be
+        called after the node has been prepared.
+
+        `serials`
+            A list that the serial numbers of the nodes that keep their
+            information in the same cache as this node are appended to.
+        """
+
+        # By default, the dependencies are unknown.
+        return None
+
     def keywords(self, context):
         """
         Execute this node, updating context.keywords as appropriate.
@@ -262,6 +294,22 @@ class SLNode(object):
         # By default, does nothing.
         return
 
+    def generate(self, compiler, context):
+        """
+        Returns a list of Python ast statements that execute this node, as
+        part of a compiled screen.
+
+        `compiler`
+            The SLCompiler that is compiling the screen.
+
+        `context`
+            The name of the variable holding the SLContext this node is
+            executed in.
+        """
+
+        # By default, calls the execute method.
+        return [ ast.Expr(value=compiler.call(self, "execute", compiler.load(context))) ]
+
     def copy_on_change(self, cache):
         """
         Flags the displayables that are created by this node and its children
@@ -371,8 +419,10 @@ class SLBlock(SLNode):
             node = ast.Dict(keys=keyword_keys, values=keyword_exprs)
             ast.copy_location(node, keyword_exprs[0])
             self.keyword_exprs = compile_expr(node)
+            self.keyword_node = node
         else:
             self.keyword_exprs = None
+            self.keyword_node = None
 
         self.has_keyword = bool(self.keyword)
         self.keyword_children = [ ]
@@ -399,17 +449,53 @@ class SLBlock(SLNode):
                 if not context.predicting:
                     raise
 
+    def dependencies(self, analysis, serials):
+
+        rv = set()
+
+        for _k, expr in self.keyword:
+            names = analysis.dependencies(ccache.ast_eval(expr))
+
+            if names is None:
+                return None
+
+            rv |= names
+
+        for i in self.children:
+            names = i.dependencies(analysis, serials)
+
+            if names is None:
+                return None
+
+            rv |= names
+
+        return rv
+
     def keywords(self, context):
 
+        keyword_exprs = self.keyword_exprs
+
+        if keyword_exprs is not None:
+            values = eval(keyword_exprs, context.globals, context.scope)
+        else:
+            values = None
+
+        self.apply_keywords(context, values)
+
+    def apply_keywords(self, context, values):
+        """
+        Updates context.keywords with the keyword arguments of this block,
+        where `values` is the result of evaluating the non-constant keyword
+        arguments (or None if there are none).
+        """
+
         keyword_values = self.keyword_values
 
         if keyword_values is not None:
             context.keywords.update(keyword_values)
 
-        keyword_exprs = self.keyword_exprs
-
-        if keyword_exprs is not None:
-            context.keywords.update(eval(keyword_exprs, context.globals, context.scope))
+        if values is not None:
+            context.keywords.update(values)
 
         for i in self.keyword_children:
             i.keywords(context)
@@ -493,6 +579,104 @@ class SLCache(object):
         # The style prefix used when this statement was first created.
         self.style_prefix = None
 
+        # For a non-constant statement that is reused when the variables
+        # it depends on have not changed, the inputs (as returned by
+        # SLDisplayable.inputs) that self.constant was created with.
+        self.inputs = None
+
+
+class SLDisplayableState(object):
+    """
+    The state of an SLDisplayable that is being executed, which is passed
+    between the steps of SLDisplayable.execute.
+    """
+
+    __slots__ = [
+        "context",
+        "ctx",
+        "cache",
+        "copy_on_change",
+        "fail",
+        "main",
+        "imagemap",
+        "positional",
+        "keywords",
+        "widget_id",
+        "transform",
+        "old_d",
+        "old_main",
+        "d",
+        "reused",
+        "inputs",
+        ]
+
+
+# A sentinel used as the value of a variable that does not exist.
+Undefined = renpy.object.Sentinel("Undefined")
+
+# When a non-constant displayable depends on a value of one of these types,
+# it's reused if the variable still refers to the same object. These values
+# can't change, or are not expected to change.
+stable_types = (
+    type(None), bool, int, long, float, complex, str, unicode, frozenset,
+    type, types.ClassType, types.FunctionType, types.BuiltinFunctionType,
+    types.ModuleType, renpy.python.StoreModule,
+    renpy.display.core.Displayable, renpy.ui.Action, renpy.ui.BarValue,
+    )
+
+# The types of value that log their mutations in renpy.python.mutation_serial.
+revertable_types = (
+    renpy.python.RevertableList,
+    renpy.python.RevertableDict,
+    renpy.python.RevertableSet,
+    renpy.python.RevertableObject,
+    )
+
+# When the value of a dotted name is found, attributes of these are
+# looked up.
+module_types = (types.ModuleType, renpy.python.StoreModule)
+
+
+def is_stable(value):
+    """
+    Returns true if `value` can be tracked by identity alone.
+    """
+
+    if isinstance(value, tuple):
+        for i in value:
+            if not is_stable(i):
+                return False
+
+        return True
+
+    return isinstance(value, stable_types) or (value is Undefined)
+
+
+def same_inputs(old, new):
+    """
+    Returns true if the inputs `new` are the same as `old`, with the values
+    being compared by identity.
+    """
+
+    if (old is None) or (new is None):
+        return False
+
+    if old[1] != new[1]:
+        return False
+
+    for a, b in zip(old[0], new[0]):
+        if a is not b:
+            return False
+
+    return True
+
+
+# The number of displayables that were reused because the variables they
+# depend on were unchanged, and the number that were re-executed. These are
+# reported when a screen is profiled.
+skipped_count = 0
+executed_count = 0
+
 
 # A magic value that, if returned by a displayable function, is not added to
 # the parent.
@@ -506,11 +690,25 @@ class SLDisplayable(SLBlock):
     """
 
     hotspot = False
+    virtual = False
 
     # A list of variables that are locally constant.
     local_constant = [ ]
 
-    def __init__(self, loc, displayable, scope=False, child_or_fixed=False, style=None, text_style=None, pass_context=False, imagemap=False, replaces=False, default_keywords={}, hotspot=False):
+    # If this statement is reused when the variables it depends on have
+    # not changed, a tuple giving the names of those variables, with each
+    # name split into its dotted parts. Otherwise, None.
+    input_names = None
+
+    # A set giving the names of the variables this statement and its
+    # children depend on, or None if they are not known.
+    dependency_names = None
+
+    # The serial numbers of the statements inside this one that keep their
+    # information in the same cache as this one.
+    child_serials = [ ]
+
+    def __init__(self, loc, displayable, scope=False, child_or_fixed=False, style=None, text_style=None, pass_context=False, imagemap=False, replaces=False, default_keywords={}, hotspot=False, virtual=False):
         """
         `displayable`
             A function that, when called with the positional and keyword
@@ -544,6 +742,11 @@ class SLDisplayable(SLBlock):
 
         `default_keywords`
             The default keyword arguments to supply to the displayable.
+
+        `virtual`
+            True if the displayable may be virtual, in which case it asks
+            the for statement that is its only child to create only some
+            children.
         """
 
         SLBlock.__init__(self, loc)
@@ -558,6 +761,7 @@ class SLDisplayable(SLBlock):
         self.hotspot = hotspot
         self.replaces = replaces
         self.default_keywords = default_keywords
+        self.virtual = virtual
 
         # Positional argument expressions.
         self.positional = [ ]
@@ -574,6 +778,7 @@ class SLDisplayable(SLBlock):
         rv.hotspot = self.hotspot
         rv.replaces = self.replaces
         rv.default_keywords = self.default_keywords
+        rv.virtual = self.virtual
         rv.positional = self.positional
 
         return rv
@@ -638,8 +843,10 @@ class SLDisplayable(SLBlock):
             t = ast.Tuple(elts=exprs, ctx=ast.Load())
             ast.copy_location(t, exprs[0])
             self.positional_exprs = compile_expr(t)
+            self.positional_node = t
         else:
             self.positional_exprs = None
+            self.positional_node = None
 
         # We do not pass keywords to our parents.
         self.has_keyword = False
@@ -649,20 +856,173 @@ class SLDisplayable(SLBlock):
 
         # If we have the id property, we're not constant - since we may get
         # additional keywords via id. (It's unlikely, but id should be pretty
-        # rare.)
+        # rare.) A virtual displayable isn't constant either, since the
+        # children it creates depend on how it's scrolled.
         for k, _expr in self.keyword:
             if k == "id":
                 self.constant = NOT_CONST
 
+            if (k == "virtual") and self.virtual:
+                self.constant = NOT_CONST
+
+        # Figure out what this statement and its children depend on.
+        serials = [ ]
+        names = self.find_dependencies(analysis, serials)
+
+        self.dependency_names = names
+
+        if (names is not None) and (self.constant == NOT_CONST):
+            self.input_names = tuple(tuple(i.split(".")) for i in sorted(names))
+            self.child_serials = serials
+        else:
+            self.input_names = None
+            self.child_serials = [ ]
+
+    def find_dependencies(self, analysis, serials):
+
+        # Imagemaps and widgets with ids communicate with things outside
+        # the screen, and the children of a virtual displayable depend on
+        # how it's scrolled, so they are not tracked.
+        if self.imagemap or self.hotspot:
+            return None
+
+        for k, _expr in self.keyword:
+            if (k == "id") or (k == "virtual"):
+                return None
+
+        rv = SLBlock.dependencies(self, analysis, serials)
+
+        if rv is None:
+            return None
+
+        for a in self.positional:
+            names = analysis.dependencies(ccache.ast_eval(a))
+
+            if names is None:
+                return None
+
+            rv |= names
+
+        return rv
+
+    def dependencies(self, analysis, serials):
+
+        if self.dependency_names is None:
+            return None
+
+        serials.append(self.serial)
+        serials.extend(self.child_serials)
+
+        return self.dependency_names
+
+    def inputs(self, context):
+        """
+        Returns a (values, serial) tuple, where values is a list giving the
+        values of the variables this statement depends on, and serial is
+        the mutation serial the screen started updating with if one of the
+        values is a revertable object, or None otherwise. Returns None if one of the values can
+        change without its variable being reassigned.
+        """
+
+        scope = context.scope
+        store = context.globals
+
+        values = [ ]
+        serial = None
+
+        for name in self.input_names:
+
+            first = name[0]
+
+            if first in scope:
+                value = scope[first]
+            else:
+                value = store.get(first, Undefined)
+
+            for attr in name[1:]:
+                if not isinstance(value, module_types):
+                    break
+
+                value = getattr(value, attr, Undefined)
+
+            if isinstance(value, renpy.python.RevertableScope):
+                return None
+            elif isinstance(value, revertable_types):
+                serial = context.mutation_serial
+            elif not is_stable(value):
+                return None
+
+            values.append(value)
+
+        return values, serial
+
     def keywords(self, context):
         # We do not want to pass keywords to our parents, so just return.
         return
 
     def execute(self, context):
 
-        debug = context.debug
+        state = self.enter(context)
 
-        screen = renpy.ui.screen
+        if state is None:
+            return
+
+        try:
+            # Evaluate the positional and keyword arguments.
+            positional_exprs = self.positional_exprs
+
+            if positional_exprs is not None:
+                positional = eval(positional_exprs, context.globals, context.scope)
+            else:
+                positional = None
+
+            keyword_exprs = self.keyword_exprs
+
+            if keyword_exprs is not None:
+                keywords = eval(keyword_exprs, context.globals, context.scope)
+            else:
+                keywords = None
+
+            self.create(state, positional, keywords)
+
+        except:
+            if not context.predicting:
+                raise
+            state.fail = True
+
+        ctx = self.push(state)
+
+        try:
+
+            # Evaluate children. (Inlined SLBlock.execute)
+            for i in self.children:
+                try:
+                    i.execute(ctx)
+                except:
+                    if not context.predicting:
+                        raise
+                    state.fail = True
+
+        finally:
+            self.pop(state)
+
+        self.finish(state)
+
+    # SLDisplayable.execute is broken up into the following methods, which
+    # are also called by the code generated for compiled screens.
+
+    def enter(self, context):
+        """
+        Starts executing this statement. If a constant displayable, or a
+        displayable whose dependencies have not changed, can be reused, adds
+        it to `context` and returns None. Otherwise, returns an
+        SLDisplayableState that is passed to the methods below.
+        """
+
+        global skipped_count
+        global executed_count
+
+        debug = context.debug
 
         cache = context.old_cache.get(self.serial, None) or context.miss_cache.get(self.serial, None)
 
@@ -676,7 +1036,16 @@ class SLDisplayable(SLBlock):
         if debug:
             self.debug_line()
 
-        if cache.constant and (cache.style_prefix == context.style_prefix):
+        inputs = None
+        tracked = (self.input_names is not None) and renpy.config.track_screen_dependencies and not context.predicting
+
+        if tracked:
+            inputs = self.inputs(context)
+
+            if inputs is None:
+                context.untracked = True
+
+        if cache.constant and (cache.style_prefix == context.style_prefix) and (self.constant or same_inputs(cache.inputs, inputs)):
 
             for i, local_scope in cache.constant_uses_scope:
 
@@ -706,189 +1075,276 @@ class SLDisplayable(SLBlock):
                 if context.uses_scope is not None:
                     context.uses_scope.extend(cache.constant_uses_scope)
 
+                if self.constant:
+
+                    if debug:
+                        profile_log.write("    reused constant displayable")
+
+                    return None
+
+                # Keep the caches of our children, in case a later change
+                # means they are executed again.
+                old_cache = context.old_cache
+                miss_cache = context.miss_cache
+                new_cache = context.new_cache
+
+                for i in self.child_serials:
+                    c = old_cache.get(i, None) or miss_cache.get(i, None)
+
+                    if c is not None:
+                        new_cache[i] = c
+
+                skipped_count += 1
+
                 if debug:
-                    profile_log.write("    reused constant displayable")
+                    profile_log.write("    reused displayable, dependencies unchanged")
 
-                return
+                return None
+
+        if tracked:
+
+            executed_count += 1
+
+            if debug:
+                profile_log.write("    dependencies changed")
+
+        state = SLDisplayableState()
+
+        state.context = context
+        state.cache = cache
+        state.copy_on_change = copy_on_change
 
         # Create the context.
-        ctx = SLContext(context)
+        state.ctx = SLContext(context)
 
         # True if we encountered an exception that we're recovering from
         # due to being in prediction mode.
-        fail = False
+        state.fail = False
 
         # The main displayable we're predicting.
-        main = None
+        state.main = None
+
+        # The inputs this statement is being executed with, if it's tracked.
+        state.inputs = inputs
 
         # True if we've pushed something onto the imagemap stack.
-        imagemap = False
+        state.imagemap = False
 
-        try:
-            # Evaluate the positional arguments.
-            positional_values = self.positional_values
-            positional_exprs = self.positional_exprs
+        return state
 
-            if positional_values and positional_exprs:
-                values = eval(positional_exprs, context.globals, context.scope)
-                positional = [ b if (a is use_expression) else a for a, b in zip(positional_values, values) ]
-            elif positional_values:
-                positional = positional_values
-            elif positional_exprs:
-                positional = eval(positional_exprs, context.globals, context.scope)
-            else:
-                positional = [ ]
+    def create(self, state, values, keyword_values):
+        """
+        Creates the displayable, or reuses the one from the last time this
+        statement was executed.
 
-            keywords = ctx.keywords = self.default_keywords.copy()
+        `values`
+            The values of the non-constant positional arguments, or None if
+            there are none.
 
-            if self.constant:
-                ctx.uses_scope = [ ]
+        `keyword_values`
+            A dictionary giving the values of the non-constant keyword
+            arguments, or None if there are none.
+        """
+
+        context = state.context
+        ctx = state.ctx
+        cache = state.cache
+
+        debug = context.debug
 
-            SLBlock.keywords(self, ctx)
+        screen = renpy.ui.screen
+
+        positional_values = self.positional_values
 
-            # Get the widget id and transform, if any.
-            widget_id = keywords.pop("id", None)
-            transform = keywords.pop("at", None)
+        if positional_values and (values is not None):
+            positional = [ b if (a is use_expression) else a for a, b in zip(positional_values, values) ]
+        elif positional_values:
+            positional = positional_values
+        elif values is not None:
+            positional = values
+        else:
+            positional = [ ]
 
-            arguments = keywords.pop("arguments", None)
-            properties = keywords.pop("properties", None)
-            style_suffix = keywords.pop("style_suffix", None) or self.style
+        keywords = ctx.keywords = self.default_keywords.copy()
 
-            if arguments:
-                positional += arguments
+        if self.constant or (state.inputs is not None):
+            ctx.uses_scope = [ ]
 
-            if properties:
-                keywords.update(properties)
+        SLBlock.apply_keywords(self, ctx, keyword_values)
 
-            # If we don't know the style, figure it out.
-            if ("style" not in keywords) and style_suffix:
-                if ctx.style_prefix is None:
-                    keywords["style"] = style_suffix
-                else:
-                    keywords["style"] = ctx.style_prefix + "_" + style_suffix
+        # Get the widget id and transform, if any.
+        widget_id = keywords.pop("id", None)
+        transform = keywords.pop("at", None)
 
-            if widget_id and (widget_id in screen.widget_properties):
-                keywords.update(screen.widget_properties[widget_id])
+        arguments = keywords.pop("arguments", None)
+        properties = keywords.pop("properties", None)
+        style_suffix = keywords.pop("style_suffix", None) or self.style
 
-            old_d = cache.displayable
-            if old_d:
-                old_main = old_d._main or old_d
+        if arguments:
+            positional += arguments
+
+        if properties:
+            keywords.update(properties)
+
+        # If we don't know the style, figure it out.
+        if ("style" not in keywords) and style_suffix:
+            if ctx.style_prefix is None:
+                keywords["style"] = style_suffix
             else:
-                old_main = None
+                keywords["style"] = ctx.style_prefix + "_" + style_suffix
 
-            reused = False
+        if widget_id and (widget_id in screen.widget_properties):
+            keywords.update(screen.widget_properties[widget_id])
 
-            if debug:
-                self.report_arguments(cache, positional, keywords, transform)
+        old_d = cache.displayable
+        if old_d:
+            old_main = old_d._main or old_d
+        else:
+            old_main = None
 
-            can_reuse = (old_d is not None) and (positional == cache.positional) and (keywords == cache.keywords) and (context.style_prefix == cache.style_prefix)
+        state.positional = positional
+        state.keywords = keywords
+        state.widget_id = widget_id
+        state.transform = transform
+        state.old_d = old_d
+        state.old_main = old_main
 
-            # A hotspot can only be reused if the imagemap it belongs to has
-            # not changed.
-            if self.hotspot:
+        reused = False
 
-                imc = renpy.ui.imagemap_stack[-1]
-                if cache.imagemap is not imc:
-                    can_reuse = False
+        if debug:
+            self.report_arguments(cache, positional, keywords, transform)
 
-                cache.imagemap = imc
+        can_reuse = (old_d is not None) and (positional == cache.positional) and (keywords == cache.keywords) and (context.style_prefix == cache.style_prefix)
 
-            if can_reuse:
-                reused = True
-                d = old_d
+        # A hotspot can only be reused if the imagemap it belongs to has
+        # not changed.
+        if self.hotspot:
 
-                # The main displayable, if d is a composite displayable. (This is
-                # the one that gets the scope, and gets children added to it.)
-                main = old_main
+            imc = renpy.ui.imagemap_stack[-1]
+            if cache.imagemap is not imc:
+                can_reuse = False
 
-                if widget_id and not ctx.unlikely:
-                    screen.widgets[widget_id] = main
+            cache.imagemap = imc
 
-                if self.scope and main._uses_scope:
-                    if copy_on_change:
-                        if main._scope(ctx.scope, False):
-                            reused = False
-                    else:
-                        main._scope(ctx.scope, True)
+        if can_reuse:
+            reused = True
+            d = old_d
 
-            if reused and self.imagemap:
-                imagemap = True
-                cache.imagemap.reuse()
-                renpy.ui.imagemap_stack.append(cache.imagemap)
+            # The main displayable, if d is a composite displayable. (This is
+            # the one that gets the scope, and gets children added to it.)
+            main = state.main = old_main
 
-            if not reused:
-                cache.positional = positional
-                cache.keywords = keywords.copy()
+            if widget_id and not ctx.unlikely:
+                screen.widgets[widget_id] = main
 
-                # This child creation code is copied below, for the copy_on_change
-                # case.
-                if self.scope:
-                    keywords["scope"] = ctx.scope
+            if self.scope and main._uses_scope:
+                if state.copy_on_change:
+                    if main._scope(ctx.scope, False):
+                        reused = False
+                else:
+                    main._scope(ctx.scope, True)
 
-                if self.replaces and ctx.updating:
-                    keywords['replaces'] = old_main
+        if reused and self.imagemap:
+            state.imagemap = True
+            cache.imagemap.reuse()
+            renpy.ui.imagemap_stack.append(cache.imagemap)
 
-                # Pass the context
-                if self.pass_context:
-                    keywords['context'] = ctx
+        if not reused:
+            cache.positional = positional
+            cache.keywords = keywords.copy()
 
-                d = self.displayable(*positional, **keywords)
-                main = d._main or d
+            # This child creation code is copied below, for the copy_on_change
+            # case.
+            if self.scope:
+                keywords["scope"] = ctx.scope
 
-                main._location = self.location
+            if self.replaces and ctx.updating:
+                keywords['replaces'] = old_main
 
-                if widget_id and not ctx.unlikely:
-                    screen.widgets[widget_id] = main
-                # End child creation code.
+            # Pass the context
+            if self.pass_context:
+                keywords['context'] = ctx
 
-                imagemap = self.imagemap
+            d = self.displayable(*positional, **keywords)
+            main = state.main = d._main or d
 
-                cache.copy_on_change = False  # We no longer need to copy on change.
-                cache.children = None  # Re-add the children.
+            main._location = self.location
 
-            if debug:
-                if reused:
-                    profile_log.write("    reused displayable")
-                elif self.constant:
-                    profile_log.write("    created constant displayable")
-                else:
-                    profile_log.write("    created displayable")
+            if widget_id and not ctx.unlikely:
+                screen.widgets[widget_id] = main
+            # End child creation code.
 
-        except:
-            if not context.predicting:
-                raise
-            fail = True
+            state.imagemap = self.imagemap
+
+            cache.copy_on_change = False  # We no longer need to copy on change.
+            cache.children = None  # Re-add the children.
+
+        state.d = d
+        state.reused = reused
+
+        if debug:
+            if reused:
+                profile_log.write("    reused displayable")
+            elif self.constant:
+                profile_log.write("    created constant displayable")
+            else:
+                profile_log.write("    created displayable")
+
+    def push(self, state):
+        """
+        Prepares to execute the children of this statement, and returns the
+        context they should be executed in.
+        """
+
+        ctx = state.ctx
 
         ctx.children = [ ]
         ctx.showif = None
+        ctx.untracked = False
+        ctx.virtual = None
 
-        stack = renpy.ui.stack
-        stack.append(ctx)
+        main = state.main
 
-        try:
+        if self.virtual and (main is not None) and main.virtual:
 
-            # Evaluate children. (Inlined SLBlock.execute)
-            for i in self.children:
-                try:
-                    i.execute(ctx)
-                except:
-                    if not context.predicting:
-                        raise
-                    fail = True
+            if (len(self.children) != 1) or not isinstance(self.children[0], SLFor):
+                raise Exception("A virtual displayable must have a single for statement as its child.")
 
-        finally:
+            ctx.virtual = main
 
-            ctx.keywords = None
+        renpy.ui.stack.append(ctx)
 
-            stack.pop()
+        return ctx
+
+    def pop(self, state):
+        """
+        Called after the children of this statement have been executed,
+        even if an exception occurred.
+        """
+
+        state.ctx.keywords = None
+
+        renpy.ui.stack.pop()
+
+        if state.imagemap:
+            cache = state.cache
+            cache.imagemap = renpy.ui.imagemap_stack.pop()
+            cache.imagemap.cache.finish()
+
+    def finish(self, state):
+        """
+        Adds the children to the displayable, applies the transform, and
+        adds the result to the parent context.
+        """
 
-            if imagemap:
-                cache.imagemap = renpy.ui.imagemap_stack.pop()
-                cache.imagemap.cache.finish()
+        context = state.context
+        ctx = state.ctx
+        cache = state.cache
+        main = state.main
 
         # If a failure occurred during prediction, predict main (if known),
         # and ctx.children, and return.
-        if fail:
+        if state.fail:
             predict_displayable(main)
 
             for i in ctx.children:
@@ -898,27 +1354,33 @@ class SLDisplayable(SLBlock):
 
             return
 
+        d = state.d
+        reused = state.reused
+        keywords = state.keywords
+        old_d = state.old_d
+        transform = state.transform
+
         if ctx.children != cache.children:
 
-            if reused and copy_on_change:
+            if reused and state.copy_on_change:
 
                 # This is a copy of the child creation code from above.
                 if self.scope:
                     keywords["scope"] = ctx.scope
 
                 if self.replaces and context.updating:
-                    keywords['replaces'] = old_main
+                    keywords['replaces'] = state.old_main
 
                 if self.pass_context:
                     keywords['context'] = ctx
 
-                d = self.displayable(*positional, **keywords)
+                d = self.displayable(*state.positional, **keywords)
                 main = d._main or d
 
                 main._location = self.location
 
-                if widget_id:
-                    screen.widgets[widget_id] = main
+                if state.widget_id:
+                    renpy.ui.screen.widgets[state.widget_id] = main
                 # End child creation code.
 
                 cache.copy_on_change = False
@@ -995,12 +1457,17 @@ class SLDisplayable(SLBlock):
             cache.transform = None
             cache.raw_transform = None
 
+        if ctx.untracked:
+            context.untracked = True
+            state.inputs = None
+
         if ctx.fail:
             context.fail = True
 
         else:
-            if self.constant:
+            if self.constant or (state.inputs is not None):
                 cache.constant = d
+                cache.inputs = state.inputs
 
                 if self.scope and main._uses_scope:
 
@@ -1017,6 +1484,9 @@ class SLDisplayable(SLBlock):
                 if context.uses_scope is not None:
                     context.uses_scope.extend(ctx.uses_scope)
 
+            else:
+                cache.constant = None
+
         if d is not NO_DISPLAYABLE:
 
             if context.showif is not None:
@@ -1024,6 +1494,68 @@ class SLDisplayable(SLBlock):
 
             context.children.append(d)
 
+    def execute_compiled(self, context, values, keyword_values):
+        """
+        Executes a non-constant statement without children, for a compiled
+        screen.
+        """
+
+        state = self.enter(context)
+
+        if state is None:
+            return
+
+        self.create(state, values, keyword_values)
+        self.push(state)
+        self.pop(state)
+        self.finish(state)
+
+    def generate(self, compiler, context):
+
+        if self.positional_node is not None:
+            values = self.positional_node
+        else:
+            values = compiler.load("None")
+
+        if self.keyword_node is not None:
+            keyword_values = self.keyword_node
+        else:
+            keyword_values = compiler.load("None")
+
+        if (self.constant == NOT_CONST) and not self.children and (self.input_names is None):
+            return [ ast.Expr(value=compiler.call(self, "execute_compiled", compiler.load(context), values, keyword_values)) ]
+
+        state = compiler.temporary("s")
+
+        body = [ ast.Expr(value=compiler.call(self, "create", compiler.load(state), values, keyword_values)) ]
+
+        if self.children:
+            ctx = compiler.temporary("c")
+
+            body.append(ast.Assign(
+                targets=[ compiler.store(ctx) ],
+                value=compiler.call(self, "push", compiler.load(state))))
+
+            body.append(ast.TryFinally(
+                body=compiler.block(self.children, ctx),
+                finalbody=[ ast.Expr(value=compiler.call(self, "pop", compiler.load(state))) ]))
+
+        else:
+            body.append(ast.Expr(value=compiler.call(self, "push", compiler.load(state))))
+            body.append(ast.Expr(value=compiler.call(self, "pop", compiler.load(state))))
+
+        body.append(ast.Expr(value=compiler.call(self, "finish", compiler.load(state))))
+
+        return [
+            ast.Assign(
+                targets=[ compiler.store(state) ],
+                value=compiler.call(self, "enter", compiler.load(context))),
+            ast.If(
+                test=ast.Compare(left=compiler.load(state), ops=[ ast.IsNot() ], comparators=[ compiler.load("None") ]),
+                body=body,
+                orelse=[ ]),
+            ]
+
     def wrap_in_showif(self, d, context, cache):
         """
         Wraps `d` in a ShowIf displayable.
@@ -1183,12 +1715,48 @@ class SLIf(SLNode):
                     i.execute(context)
                 return
 
-    def execute_predicting(self, context):
-        # A variant of the this code that runs while predicting, executing
-        # all paths of the if.
+    def dependencies(self, analysis, serials):
 
-        # True if no block has been the main choice yet.
-        first = True
+        rv = set()
+
+        for cond, block in self.entries:
+            if cond is not None:
+                names = analysis.dependencies(ccache.ast_eval(cond))
+
+                if names is None:
+                    return None
+
+                rv |= names
+
+            names = block.dependencies(analysis, serials)
+
+            if names is None:
+                return None
+
+            rv |= names
+
+        return rv
+
+    def generate(self, compiler, context):
+
+        rv = [ ]
+
+        for cond, block in reversed(self.entries):
+            body = compiler.block(block.children, context)
+
+            if cond is None:
+                rv = body
+            else:
+                rv = [ ast.If(test=compiler.expression(cond), body=body, orelse=rv) ]
+
+        return rv
+
+    def execute_predicting(self, context):
+        # A variant of the this code that runs while predicting, executing
+        # all paths of the if.
+
+        # True if no block has been the main choice yet.
+        first = True
 
         # Has any instance of this node been predicted? We only predict
         # once per node, for performance reasons.
@@ -1411,6 +1979,73 @@ class SLFor(SLBlock):
 
             value = [ 0 ]
 
+        state = self.enter(context)
+
+        for index, v in self.enumerate(state, value):
+
+            # The loop variable is assigned on every update, so this
+            # doesn't count as a mutation of the scope.
+            dict.__setitem__(context.scope, variable, v)
+
+            ctx = self.iterate(state, index)
+
+            # Inline of SLBlock.execute.
+
+            for i in self.children:
+                try:
+                    i.execute(ctx)
+                except:
+                    if not context.predicting:
+                        raise
+
+            if context.unlikely:
+                break
+
+        self.leave(context, state)
+
+    def dependencies(self, analysis, serials):
+
+        rv = analysis.dependencies(ccache.ast_eval(self.expression))
+
+        if rv is None:
+            return None
+
+        # The children keep their information in per-index caches inside
+        # the cache of this statement.
+        children = SLBlock.dependencies(self, analysis, [ ])
+
+        if children is None:
+            return None
+
+        if self.index_expression is not None:
+            names = analysis.dependencies(ccache.ast_eval(self.index_expression))
+
+            if names is None:
+                return None
+
+            children |= names
+
+        # Uses of the loop variable inside the loop depend on the value
+        # of the expression.
+        prefix = self.variable + "."
+
+        for i in children:
+            if (i != self.variable) and not i.startswith(prefix):
+                rv.add(i)
+
+        serials.append(self.serial)
+
+        return rv
+
+    # SLFor.execute is broken up into the following methods, which are also
+    # called by the code generated for compiled screens.
+
+    def enter(self, context):
+        """
+        Starts executing the loop. Returns a state tuple that is passed to
+        the methods below.
+        """
+
         newcaches = { }
 
         oldcaches = context.old_cache.get(self.serial, newcaches) or { }
@@ -1424,43 +2059,116 @@ class SLFor(SLBlock):
             misscaches = { }
 
         ctx = SLContext(context)
+        ctx.untracked = False
+        ctx.virtual = None
+
+        # The caches of elements that are no longer being created, which
+        # can be reused by the elements that are.
+        spare = [ ]
+
+        return (ctx, oldcaches, misscaches, newcaches, context.virtual, spare)
+
+    def enumerate(self, state, value):
+        """
+        Returns an iterator over (index, element) pairs, giving the elements
+        of `value` that children are created for. In a virtual displayable,
+        this is only the elements it asks for.
+        """
+
+        _ctx, oldcaches, _misscaches, _newcaches, virtual, spare = state
+
+        if virtual is None:
+            return enumerate(value)
+
+        if not isinstance(value, (list, tuple)):
+            value = list(value)
 
-        for index, v in enumerate(value):
+        start, end = virtual.virtual_window(len(value))
 
-            ctx.scope[variable] = v
+        # If the loop variable isn't constant, the children of an element
+        # that's no longer created can be recycled for a new element.
+        if (self.expression_expr is not None) and (self.index_expression is None):
+            for k, v in oldcaches.iteritems():
+                if not (start <= k < end):
+                    spare.append(v)
+
+        return enumerate(itertools.islice(value, start, end), start)
+
+    def iterate(self, state, index):
+        """
+        Called at the start of each iteration of the loop, after the loop
+        variable has been assigned. Returns the context the children should
+        be executed in.
+        """
 
-            if self.index_expression is not None:
-                index = eval(self.index_expression, ctx.globals, ctx.scope)
+        ctx, oldcaches, misscaches, newcaches, _virtual, spare = state
 
-            ctx.old_cache = oldcaches.get(index, None) or { }
+        if self.index_expression is not None:
+            index = eval(self.index_expression, ctx.globals, ctx.scope)
 
-            if not isinstance(ctx.old_cache, dict):
-                ctx.old_cache = {}
+        ctx.old_cache = oldcaches.get(index, None) or { }
 
+        if not isinstance(ctx.old_cache, dict):
+            ctx.old_cache = {}
+
+        if spare and not ctx.old_cache and (index not in misscaches):
+            ctx.miss_cache = spare.pop()
+        else:
             ctx.miss_cache = misscaches.get(index, None) or { }
 
-            if not isinstance(ctx.miss_cache, dict):
-                ctx.miss_cache = {}
+        if not isinstance(ctx.miss_cache, dict):
+            ctx.miss_cache = {}
 
-            newcaches[index] = ctx.new_cache = { }
+        newcaches[index] = ctx.new_cache = { }
 
-            # Inline of SLBlock.execute.
+        return ctx
 
-            for i in self.children:
-                try:
-                    i.execute(ctx)
-                except:
-                    if not context.predicting:
-                        raise
+    def leave(self, context, state):
+        """
+        Called when the loop is done.
+        """
 
-            if context.unlikely:
-                break
+        ctx, _oldcaches, _misscaches, newcaches, _virtual, _spare = state
 
         context.new_cache[self.serial] = newcaches
 
         if ctx.fail:
             context.fail = True
 
+        if ctx.untracked:
+            context.untracked = True
+
+    def generate(self, compiler, context):
+
+        state = compiler.temporary("f")
+        index = compiler.temporary("i")
+        ctx = compiler.temporary("c")
+
+        if self.expression_expr is not None:
+            value = ccache.ast_eval(self.expression)
+        else:
+            value = compiler.load(compiler.value(self.expression_value))
+
+        body = [
+            ast.Assign(
+                targets=[ compiler.store(ctx) ],
+                value=compiler.call(self, "iterate", compiler.load(state), compiler.load(index))),
+            ]
+
+        body.extend(compiler.block(self.children, ctx))
+
+        return [
+            ast.Assign(
+                targets=[ compiler.store(state) ],
+                value=compiler.call(self, "enter", compiler.load(context))),
+            ast.For(
+                target=ast.Tuple(elts=[ compiler.store(index), compiler.store(self.variable) ], ctx=ast.Store()),
+                iter=compiler.call(self, "enumerate", compiler.load(state), value),
+                body=body,
+                orelse=[ ]),
+            ast.Expr(value=compiler.call(self, "leave", compiler.load(context), compiler.load(state))),
+            ]
+
     def keywords(self, context):
         return
 
@@ -1496,6 +2204,11 @@ class SLPython(SLNode):
     def execute(self, context):
         exec self.code.bytecode in context.globals, context.scope
 
+    def generate(self, compiler, context):
+        # The compiled screen runs in the screen's scope, so the code can be
+        # executed there directly.
+        return [ ast.Exec(body=compiler.load(compiler.value(self.code.bytecode)), globals=None, locals=None) ]
+
     def prepare(self, analysis):
         self.constant = NOT_CONST
         self.last_keyword = True
@@ -1506,6 +2219,12 @@ class SLPass(SLNode):
     def execute(self, context):
         return
 
+    def dependencies(self, analysis, serials):
+        return set()
+
+    def generate(self, compiler, context):
+        return [ ]
+
     def copy(self, transclude):
         rv = self.instantiate(transclude)
 
@@ -1719,7 +2438,7 @@ class SLUse(SLNode):
             scope = context.scope.copy()
             scope.update(kwargs)
 
-        scope["_scope"] = scope
+        dict.__setitem__(scope, "_scope", scope)
 
         # Run the child screen.
         ctx.scope = scope
@@ -1730,7 +2449,7 @@ class SLUse(SLNode):
         try:
             ast.execute(ctx)
         finally:
-            del scope["_scope"]
+            dict.__delitem__(scope, "_scope")
 
         if ctx.fail:
             context.fail = True
@@ -1827,6 +2546,16 @@ class SLScreen(SLBlock):
 
     layer = "'screens'"
 
+    # The code object this screen has been compiled into, if any.
+    compiled = None
+
+    # A map from the names used by the compiled code to their values.
+    compiled_names = { }
+
+    # A list of names the compiled code places into the scope, which are
+    # removed when it finishes.
+    compiled_temporaries = [ ]
+
     def __init__(self, loc):
 
         SLBlock.__init__(self, loc)
@@ -1950,9 +2679,17 @@ class SLScreen(SLBlock):
         self.version += 1
 
         self.const_ast.prepare(self.const_ast.analysis)
+        self.const_ast.compiled = None
 
         if self.not_const_ast is not self.const_ast:
             self.not_const_ast.prepare(self.not_const_ast.analysis)
+            self.not_const_ast.compiled = None
+
+        if renpy.config.compile_screens:
+            self.const_ast.compile_screen()
+
+            if self.not_const_ast is not self.const_ast:
+                self.not_const_ast.compile_screen()
 
         self.prepared = True
 
@@ -1971,7 +2708,55 @@ class SLScreen(SLBlock):
             not_constants.sort()
             profile_log.write('    not_const: %s', " ".join(not_constants))
 
+    def compile_screen(self):
+        """
+        Compiles this (prepared) screen into a single code object, which is
+        executed in the screen's scope by execute_compiled.
+        """
+
+        compiler = SLCompiler(self)
+        code = compiler.compile()
+
+        self.compiled = code
+        self.compiled_names = compiler.names
+        self.compiled_temporaries = list(compiler.names) + compiler.temporaries
+
+    def execute_compiled(self, context):
+        scope = context.scope
+
+        # If the scope was copied from the scope of a compiled screen that
+        # is using this one, it contains that screen's variables as well.
+        inherited = ROOT_CONTEXT in scope
+
+        # The temporaries are assigned on every update, so they don't count
+        # as mutations of the scope. (When the scope is a RevertableScope,
+        # the assignments made by the code don't either.)
+        dict.update(scope, self.compiled_names)
+        dict.__setitem__(scope, ROOT_CONTEXT, context)
+
+        try:
+            exec self.compiled in context.globals, scope
+        finally:
+            for i in self.compiled_temporaries:
+                dict.pop(scope, i, None)
+
+            if inherited:
+                for i in dict.keys(scope):
+                    if compiled_name_regex.match(i):
+                        dict.__delitem__(scope, i)
+
     def execute(self, context):
+
+        # Compiled screens are not used while predicting or profiling, as
+        # they do not recover from errors or write debug information.
+        if renpy.config.compile_screens and not (context.predicting or context.debug):
+
+            if self.compiled is None:
+                self.compile_screen()
+
+            self.execute_compiled(context)
+            return
+
         self.keywords(context)
         SLBlock.execute(self, context)
 
@@ -1994,7 +2779,10 @@ class SLScreen(SLBlock):
             kwargs = scope.get("_kwargs", { })
 
             values = renpy.ast.apply_arguments(self.parameters, args, kwargs, ignore_errors=renpy.display.predict.predicting)
-            scope.update(values)
+
+            # The parameters are recomputed on each update, so this doesn't
+            # count as a mutation of the scope.
+            dict.update(scope, values)
 
         if not self.prepared:
             self.prepare_screen()
@@ -2011,6 +2799,7 @@ class SLScreen(SLBlock):
         context.debug = debug
         context.predicting = renpy.display.predict.predicting
         context.updating = (current_screen.phase == renpy.display.screen.UPDATE)
+        context.mutation_serial = current_screen.mutation_serial
 
         name = scope["_name"]
 
@@ -2039,6 +2828,164 @@ class SLScreen(SLBlock):
         current_screen.use_cache = context.new_use_cache
 
 
+# The name of the variable that holds the root SLContext of a compiled
+# screen.
+ROOT_CONTEXT = "_sl2_c0"
+
+# Matches the names of the variables used by compiled screens.
+compiled_name_regex = re.compile(r'_sl2_[a-z]\d+$')
+
+
+class SLCompiler(object):
+    """
+    Generates the code for a compiled screen. The code is executed with the
+    screen's scope as its locals, so expressions in the screen are inlined
+    into it and are evaluated just as they would be by eval. Nodes, constant
+    values, and the contexts and states of the statements being executed are
+    stored in variables with names beginning with _sl2_.
+    """
+
+    def __init__(self, screen):
+
+        self.screen = screen
+
+        # A map from name to the value the name has when the code runs.
+        self.names = { }
+
+        # A map from the id of a node to the name of the node.
+        self.node_names = { }
+
+        # A list of the names the code assigns to.
+        self.temporaries = [ ROOT_CONTEXT ]
+
+        # Used to make names unique.
+        self.serial = 0
+
+    def new_name(self, prefix):
+        self.serial += 1
+        return "_sl2_{}{}".format(prefix, self.serial)
+
+    def value(self, value):
+        """
+        Returns the name of a variable that will have `value` when the code
+        is run.
+        """
+
+        name = self.new_name("k")
+        self.names[name] = value
+        return name
+
+    def node(self, node):
+        """
+        Returns the name of a variable that will refer to `node` when the
+        code is run.
+        """
+
+        name = self.node_names.get(id(node), None)
+
+        if name is None:
+            name = self.node_names[id(node)] = self.new_name("n")
+            self.names[name] = node
+
+        return name
+
+    def temporary(self, prefix):
+        """
+        Returns the name of a variable the code assigns to.
+        """
+
+        name = self.new_name(prefix)
+        self.temporaries.append(name)
+        return name
+
+    def load(self, name):
+        return ast.Name(id=name, ctx=ast.Load())
+
+    def store(self, name):
+        return ast.Name(id=name, ctx=ast.Store())
+
+    def call(self, node, method, *args):
+        """
+        Returns an expression that calls `method` of `node` with `args`.
+        """
+
+        func = ast.Attribute(value=self.load(self.node(node)), attr=method, ctx=ast.Load())
+        return ast.Call(func=func, args=list(args), keywords=[ ], starargs=None, kwargs=None)
+
+    def call_value(self, value, *args):
+        """
+        Returns an expression that calls `value` with `args`.
+        """
+
+        func = self.load(self.value(value))
+        return ast.Call(func=func, args=list(args), keywords=[ ], starargs=None, kwargs=None)
+
+    def expression(self, expr):
+        """
+        Returns an ast node that evaluates `expr`. If the expression is
+        constant, it's evaluated now and the result is used.
+        """
+
+        node = ccache.ast_eval(expr)
+
+        if self.screen.analysis.is_constant(node) == GLOBAL_CONST:
+            return self.load(self.value(py_eval_bytecode(compile_expr(node))))
+
+        return node
+
+    def block(self, children, context):
+        """
+        Returns a list of statements that execute the nodes in `children`,
+        in `context`.
+        """
+
+        rv = [ ]
+
+        for i in children:
+            for stmt in i.generate(self, context):
+                stmt.lineno = i.location[1]
+                stmt.col_offset = 0
+                rv.append(stmt)
+
+        if not rv:
+            rv.append(ast.Pass())
+
+        return rv
+
+    def compile(self):
+        """
+        Compiles the screen, returning a code object.
+        """
+
+        screen = self.screen
+
+        body = [ ast.Expr(value=self.call(screen, "keywords", self.load(ROOT_CONTEXT))) ]
+        body.extend(self.block(screen.children, ROOT_CONTEXT))
+
+        for i in body:
+            if not hasattr(i, "lineno"):
+                i.lineno = screen.location[1]
+                i.col_offset = 0
+
+        key = (screen.name, screen.variant, screen.const_ast is screen)
+        signature = (len(self.names), len(self.temporaries))
+
+        cached = compiled_cache.code.get(key, None)
+
+        if (cached is not None) and (cached[0] == signature):
+            return marshal.loads(cached[1])
+
+        module = ast.Module(body=body)
+        ast.fix_missing_locations(module)
+
+        rv = compile(module, screen.location[0], "exec")
+
+        compiled_cache.code[key] = (signature, marshal.dumps(rv))
+        compiled_cache.updated = True
+
+        return rv
+
+
 class ScreenCache(object):
 
     def __init__(self):
@@ -2066,7 +3013,7 @@ def load_cache():
         if digest != renpy.game.script.digest.digest():
             return
 
-        s = loads(zlib.decompress(f.read()))
+        s = loads(zlib.decompress(renpy.loader.read_view(f)))
         f.close()
 
         if s.version == scache.version:
@@ -2093,3 +3040,218 @@ def save_cache():
             f.write(data)
     except:
         pass
+
+
+class CompiledCache(object):
+
+    def __init__(self):
+        self.version = 1
+
+        # A map from (screen name, variant, const) to a (signature,
+        # marshalled code) tuple.
+        self.code = { }
+
+        self.updated = False
+
+
+compiled_cache = CompiledCache()
+
+COMPILED_CACHE_FILENAME = "cache/screens_compiled.rpyb"
+
+
+def load_compiled_cache():
+    if renpy.game.args.compile:  # @UndefinedVariable
+        return
+
+    try:
+        f = renpy.loader.load(COMPILED_CACHE_FILENAME)
+
+        digest = f.read(hashlib.md5().digest_size)
+        if digest != renpy.game.script.digest.digest():
+            return
+
+        s = loads(zlib.decompress(renpy.loader.read_view(f)))
+        f.close()
+
+        if s.version == compiled_cache.version:
+            compiled_cache.code.update(s.code)
+
+    except:
+        pass
+
+
+def save_compiled_cache():
+    if not compiled_cache.updated:
+        return
+
+    if renpy.macapp:
+        return
+
+    try:
+        data = zlib.compress(dumps(compiled_cache, 2), 9)
+
+        with open(renpy.loader.get_path(COMPILED_CACHE_FILENAME), "wb") as f:
+            f.write(renpy.game.script.digest.digest())
+            f.write(data)
+    except:
+        pass
+
+
+# Screens from the default GUI, and the arguments they are shown with, that
+# are updated by benchmark.
+BENCHMARK_SCREENS = [
+    ("say", dict(who="Eileen", what="This is a line of dialogue.")),
+    ("quick_menu", { }),
+    ("choice", dict(items=[ ])),
+    ("main_menu", { }),
+    ("preferences", { }),
+    ("save", { }),
+    ("load", { }),
+    ("history", { }),
+    ("notify", dict(message="This is a notification.")),
+    ]
+
+
+def benchmark_screen(name, kwargs, rounds):
+    """
+    Shows the screen `name` with `kwargs` once, then returns the average
+    time it takes to update it, in seconds.
+    """
+
+    screen = renpy.display.screen.get_screen_variant(name)
+
+    scope = { }
+
+    if screen.parameters:
+        scope["_kwargs"] = dict(kwargs)
+        scope["_args"] = ()
+    else:
+        scope.update(kwargs)
+
+    d = renpy.display.screen.ScreenDisplayable(screen, None, None, { }, scope)
+    d.cache = { }
+    d.phase = renpy.display.screen.SHOW
+
+    try:
+        d.update()
+
+        start = time.time()
+
+        for _i in range(rounds):
+            renpy.display.screen.updated_screens.discard(d)
+            d.update()
+
+        return (time.time() - start) / rounds
+
+    finally:
+        renpy.display.screen.updated_screens.discard(d)
+        renpy.ui.reset()
+
+
+def benchmark(screens=BENCHMARK_SCREENS, rounds=100):
+    """
+    Compares the time it takes to update each of `screens` when the screen
+    is interpreted and when it is compiled. The results are written to
+    profile_screen.txt, and returned as a list of (name, interpreted time,
+    compiled time) tuples, with the times in seconds.
+
+    `screens`
+        A list of (screen name, arguments dict) tuples. Screens that do not
+        exist, or are not screen language 2 screens, are skipped.
+
+    `rounds`
+        The number of times each screen is updated.
+    """
+
+    rv = [ ]
+
+    old_compile_screens = renpy.config.compile_screens
+
+    try:
+
+        for name, kwargs in screens:
+
+            screen = renpy.display.screen.get_screen_variant(name)
+
+            if (screen is None) or not isinstance(screen.ast, SLScreen):
+                continue
+
+            times = [ ]
+
+            try:
+                for compile_screens in (False, True):
+                    renpy.config.compile_screens = compile_screens
+                    times.append(benchmark_screen(name, kwargs, rounds))
+
+            except Exception as e:
+                profile_log.write("BENCHMARK %s failed: %r", name, e)
+                continue
+
+            profile_log.write("BENCHMARK %s interpreted %.3f ms, compiled %.3f ms", name, times[0] * 1000, times[1] * 1000)
+            rv.append((name, times[0], times[1]))
+
+    finally:
+        renpy.config.compile_screens = old_compile_screens
+
+    return rv
+
+
+def benchmark_list(name="virtual_list", lengths=(100, 1000, 10000), rounds=20):
+    """
+    Compares the time it takes to update and render a screen that shows a
+    scrolling list when the list is virtual, and when it is not. The
+    results are written to profile_screen.txt, and returned as a list of
+    (length, time, virtual time) tuples, with the times in seconds.
+
+    `name`
+        The name of the screen. It's given `items`, a list of strings, and
+        `virtual`, which should be supplied to the virtual property of a
+        vpgrid that contains a for loop over the items.
+
+    `lengths`
+        The lengths of the lists that are shown.
+
+    `rounds`
+        The number of times the screen is updated and rendered.
+    """
+
+    rv = [ ]
+
+    screen = renpy.display.screen.get_screen_variant(name)
+
+    if screen is None:
+        return rv
+
+    width = renpy.config.screen_width
+    height = renpy.config.screen_height
+
+    for length in lengths:
+
+        items = [ "Item {}".format(i) for i in range(length) ]
+        times = [ ]
+
+        for virtual in (False, True):
+
+            d = renpy.display.screen.ScreenDisplayable(screen, None, None, { }, { "_args" : (), "_kwargs" : dict(items=items, virtual=virtual) })
+            d.cache = { }
+            d.phase = renpy.display.screen.SHOW
+
+            try:
+                start = time.time()
+
+                for _i in range(rounds):
+                    renpy.display.screen.updated_screens.discard(d)
+                    d.update()
+                    renpy.display.render.invalidate(d)
+                    renpy.display.render.render(d, width, height, 0, 0)
+
+                times.append((time.time() - start) / rounds)
+
+            finally:
+                renpy.display.screen.updated_screens.discard(d)
+                renpy.ui.reset()
+
+        profile_log.write("BENCHMARK %s %d items: %.3f ms, virtual %.3f ms", name, length, times[0] * 1000, times[1] * 1000)
+        rv.append((length, times[0], times[1]))
+
+    return rv
@@ -358,9 +358,10 @@ add(vscrollbar_bar_properties)
 add(viewport_position_properties)
 
 
-DisplayableParser("vpgrid", sl2vpgrid, "vpgrid", many, replaces=True, pass_context=True)
+DisplayableParser("vpgrid", sl2vpgrid, "vpgrid", many, replaces=True, pass_context=True, virtual=True)
 Keyword("rows")
 Keyword("cols")
+Keyword("virtual")
 Keyword("child_size")
 Keyword("mousewheel")
 Keyword("arrowkeys")
@@ -490,7 +490,7 @@ class DisplayableParser(Parser):
 
     def __init__(self, name, displayable, style, nchildren=0, scope=False,
                  pass_context=False, imagemap=False, replaces=False, default_keywords={},
-                 hotspot=False, default_properties=True):
+                 hotspot=False, default_properties=True, virtual=False):
         """
         `scope`
             If true, the scope is passed into the displayable functionas a keyword
@@ -510,6 +510,10 @@ class DisplayableParser(Parser):
 
         `default_properties`
             If true, the ui and positional properties are added by default.
+
+        `virtual`
+            If true, the displayable can be virtual, creating only some of the
+            children of a for statement that is its only child.
         """
 
         super(DisplayableParser, self).__init__(name)
@@ -533,6 +537,7 @@ class DisplayableParser(Parser):
         self.hotspot = hotspot
         self.replaces = replaces
         self.default_keywords = default_keywords
+        self.virtual = virtual
 
         Keyword("arguments")
         Keyword("properties")
@@ -557,6 +562,7 @@ class DisplayableParser(Parser):
             replaces=self.replaces,
             default_keywords=self.default_keywords,
             hotspot=self.hotspot,
+            virtual=self.virtual,
             )
 
         for _i in self.positional:
@@ -0,0 +1,790 @@
+# Copyright 2004-2018 Tom Rothamel <pytom@bishoujo.us>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# This file contains the init snapshot. When config.init_snapshot is true,
+# the changes the init phase made to the stores and to the fields of the
+# Ren'Py modules are pickled into a file once init is done. Later launches
+# with the same script, version, and configuration unpickle that file
+# instead of running the init code.
+#
+# Since config.init_snapshot is itself set by init code, the first launch
+# that sees it only marks the game as using the snapshot. The next launch
+# records the state before init, and saves the snapshot afterwards.
+
+from __future__ import print_function
+
+import renpy
+
+import os
+import sys
+import types
+import marshal
+import hashlib
+import pickle
+import cPickle
+import thread
+import zlib
+
+from cStringIO import StringIO
+
+# The file the snapshot is stored in, relative to the game directory.
+FILENAME = "cache/init_snapshot.rpyb"
+
+# Changing this invalidates existing snapshots.
+SNAPSHOT_VERSION = 1
+
+# The states a snapshot file can be in.
+
+# The game uses snapshots, but the state before init wasn't recorded, so
+# no snapshot could be saved.
+PENDING = "pending"
+
+# The file contains a snapshot.
+SAVED = "saved"
+
+# Saving a snapshot failed. This isn't retried until the key changes.
+FAILED = "failed"
+
+# Modules, in addition to renpy.backup_blacklist, whose fields are never
+# saved in or restored from the snapshot.
+module_blacklist = {
+    "renpy.main",
+    "renpy.loader",
+    "renpy.loadsave",
+    "renpy.savelocation",
+    "renpy.persistent",
+    "renpy.performance",
+    "renpy.snapshot",
+    }
+
+# Fields, in addition to renpy.name_blacklist, that are never saved in or
+# restored from the snapshot. These are set up before init, are caches, or
+# are counters that must not go backwards.
+name_blacklist = {
+    "renpy.game.args",
+    "renpy.game.script",
+    "renpy.game.contexts",
+    "renpy.game.interface",
+    "renpy.game.log",
+    "renpy.game.persistent",
+    "renpy.game.preferences",
+    "renpy.game.exception_info",
+    "renpy.python.initialized_store_dicts",
+    "renpy.python.clean_store_backup",
+    "renpy.python.py_compile_cache",
+    "renpy.python.old_py_compile_cache",
+    "renpy.python.mutation_serial",
+    "renpy.python.serial",
+    "renpy.python.generation",
+    "renpy.python.rng",
+    "renpy.pyanalysis.ccache",
+    "renpy.sl2.slast.scache",
+    "renpy.sl2.slast.compiled_cache",
+    "renpy.sl2.slast.serial",
+    "renpy.text.text.shared_layout_cache",
+    }
+
+# The special namespaces whose define and default statements change the
+# persistent data, which isn't part of the snapshot. These statements are
+# run again after the snapshot is restored.
+replay_namespaces = { "store.persistent", "store.preferences" }
+
+# Values of these types are compared by equality, and aren't pickled
+# by reference.
+atomic_types = (bool, int, long, float, complex, basestring, tuple, type(None))
+
+# Values of these types are compared by identity when they're found while
+# fingerprinting another value.
+identity_types = (
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    types.FileType,
+    type,
+    types.ClassType,
+    thread.LockType,
+    )
+
+# The fingerprint of a value that couldn't be fingerprinted.
+UNKNOWN = object()
+
+# The state before init, or None if it wasn't recorded. This is a map from
+# module name to a map from field name to a (value, fingerprint) tuple.
+before = None
+
+# A map from store name to a map from variable name to a (value,
+# fingerprint) tuple, giving the store's contents before init, or None.
+stores_before = None
+
+# The key the snapshot is saved under.
+key = None
+
+# True if saving a snapshot with this key failed before.
+failed = False
+
+
+def is_store_name(name):
+    return (name == "store") or name.startswith("store.")
+
+
+def make_cell(value):
+    return (lambda : value).func_closure[0]
+
+
+def make_function(code, globals, name, closure):  # @ReservedAssignment
+    if closure is not None:
+        closure = tuple(make_cell(i) for i in closure)
+
+    return types.FunctionType(code, globals, name, None, closure)
+
+
+def setup_function(f, defaults, d):
+    f.func_defaults = defaults
+    f.func_dict.update(d)
+    return f
+
+
+def make_class(metaclass, name, bases, d):
+    if metaclass is None:
+        return types.ClassType(name, bases, d)
+    else:
+        return metaclass(name, bases, d)
+
+
+def setup_class(cls, d):
+    for k, v in d.iteritems():
+        setattr(cls, k, v)
+
+    return cls
+
+
+def load_code(data):
+    return marshal.loads(data)
+
+
+class SnapshotPickler(pickle.Pickler):
+    """
+    A pickler that pickles the functions and classes defined in the stores
+    by value, since they won't exist when the snapshot is loaded, and refers
+    to objects that exist before init, and to the script, by name.
+
+    `refs`
+        A map from id(object) to an (object, persistent id) tuple.
+    """
+
+    dispatch = pickle.Pickler.dispatch.copy()
+
+    def __init__(self, f, refs):
+        pickle.Pickler.__init__(self, f, 2)
+        self.refs = refs
+
+    def persistent_id(self, obj):
+
+        rv = self.refs.get(id(obj), None)
+
+        if (rv is not None) and (rv[0] is obj):
+            return rv[1]
+
+        if isinstance(obj, types.ModuleType):
+            return ("module", obj.__name__)
+
+        return None
+
+    def save_global(self, obj, name=None, pack=pickle.struct.pack):
+
+        module = getattr(obj, "__module__", None)
+
+        if isinstance(module, basestring) and is_store_name(module):
+
+            if isinstance(obj, types.FunctionType):
+                self.save_function(obj)
+                return
+
+            if isinstance(obj, (type, types.ClassType)):
+                self.save_class(obj)
+                return
+
+        pickle.Pickler.save_global(self, obj, name, pack)
+
+    dispatch[types.FunctionType] = save_global
+    dispatch[types.ClassType] = save_global
+    dispatch[type] = save_global
+
+    def save_function(self, obj):
+
+        if obj.func_closure is not None:
+            closure = tuple(i.cell_contents for i in obj.func_closure)
+        else:
+            closure = None
+
+        self.save_reduce(make_function, (obj.func_code, obj.func_globals, obj.func_name, closure), obj=obj)
+
+        # The defaults and dict are set once the function has been
+        # memoized, so they can refer to it.
+        self.save_reduce(setup_function, (obj, obj.func_defaults, obj.func_dict))
+        self.write(pickle.POP)
+
+    def save_class(self, obj):
+
+        rest = dict(vars(obj))
+
+        initial = { }
+
+        for k in ("__module__", "__doc__", "__slots__"):
+            if k in rest:
+                initial[k] = rest.pop(k)
+
+        for k, v in rest.items():
+            if k in ("__dict__", "__weakref__"):
+                del rest[k]
+            elif isinstance(v, (types.MemberDescriptorType, types.GetSetDescriptorType)):
+                del rest[k]
+
+        if isinstance(obj, types.ClassType):
+            metaclass = None
+        else:
+            metaclass = type(obj)
+
+        self.save_reduce(make_class, (metaclass, obj.__name__, obj.__bases__, initial), obj=obj)
+
+        # The rest of the class is filled in once it has been memoized, so
+        # its methods and attributes can refer to it.
+        self.save_reduce(setup_class, (obj, rest))
+        self.write(pickle.POP)
+
+    def save_code(self, obj):
+        self.save_reduce(load_code, (marshal.dumps(obj),), obj=obj)
+
+    dispatch[types.CodeType] = save_code
+
+    def save_method(self, obj):
+
+        if obj.im_self is not None:
+            self.save_reduce(getattr, (obj.im_self, obj.im_func.__name__), obj=obj)
+        else:
+            self.save_reduce(getattr, (obj.im_class, obj.im_func.__name__), obj=obj)
+
+    dispatch[types.MethodType] = save_method
+
+    def save_staticmethod(self, obj):
+        self.save_reduce(type(obj), (obj.__func__,), obj=obj)
+
+    dispatch[staticmethod] = save_staticmethod
+    dispatch[classmethod] = save_staticmethod
+
+    def save_property(self, obj):
+        self.save_reduce(property, (obj.fget, obj.fset, obj.fdel, obj.__doc__), obj=obj)
+
+    dispatch[property] = save_property
+
+
+def persistent_load(pid):
+    """
+    Returns the object referred to by `pid`, a persistent id returned by
+    SnapshotPickler.persistent_id.
+    """
+
+    kind = pid[0]
+
+    if kind == "global":
+        return getattr(sys.modules[pid[1]], pid[2])
+
+    elif kind == "store":
+        return renpy.python.store_dicts[pid[1]]
+
+    elif kind == "module":
+        __import__(pid[1])
+        return sys.modules[pid[1]]
+
+    elif kind == "node":
+        return renpy.game.script.namemap[pid[1]]
+
+    elif kind == "node_field":
+        return getattr(renpy.game.script.namemap[pid[1]], pid[2])
+
+    raise Exception("Unknown persistent id {!r}.".format(pid))
+
+
+def compute_key():
+    """
+    Computes the key the snapshot is saved under. This covers everything
+    init code might depend on, other than the persistent data.
+    """
+
+    files = [ ]
+
+    for _dir, fn in renpy.loader.listdirfiles():
+        if fn.endswith(".py"):
+            files.append((fn, renpy.loader.get_hash(fn)))
+
+    files.sort()
+
+    environ = sorted((k, v) for k, v in os.environ.iteritems() if k.startswith("RENPY_"))
+
+    key = (
+        SNAPSHOT_VERSION,
+        renpy.game.script.digest.digest(),
+        renpy.version,
+        sys.platform,
+        renpy.windows,
+        renpy.macintosh,
+        renpy.linux,
+        renpy.android,
+        renpy.ios,
+        renpy.mobile,
+        tuple(renpy.config.variants),
+        renpy.config.gamedir,
+        renpy.config.savedir,
+        tuple(renpy.config.archives),
+        renpy.config.screen_width,
+        renpy.config.screen_height,
+        renpy.game.preferences.language,
+        tuple(files),
+        tuple(environ),
+        )
+
+    return hashlib.md5(repr(key)).hexdigest()
+
+
+def snapshot_modules():
+    """
+    Returns a list of the Ren'Py modules whose fields are saved in the
+    snapshot.
+    """
+
+    rv = [ ]
+
+    for name, mod in sys.modules.items():
+
+        if not isinstance(mod, types.ModuleType):
+            continue
+
+        if not name.startswith("renpy."):
+            continue
+
+        if name in renpy.backup_blacklist:
+            continue
+
+        if name in module_blacklist:
+            continue
+
+        if name.startswith("renpy.styledata"):
+            continue
+
+        rv.append(mod)
+
+    return rv
+
+
+def blacklisted(modname, name, value):
+    """
+    Returns true if the field `name` of module `modname` isn't saved in or
+    restored from the snapshot.
+    """
+
+    if name.startswith("__") and name.endswith("__"):
+        return True
+
+    if isinstance(value, renpy.type_blacklist):
+        return True
+
+    fullname = modname + "." + name
+
+    return (fullname in renpy.name_blacklist) or (fullname in name_blacklist)
+
+
+def fingerprint_id(o):
+    if isinstance(o, identity_types):
+        return str(id(o))
+
+    return None
+
+
+def fingerprint(value):
+    """
+    Returns something that can be compared to find out if `value` has been
+    changed, or UNKNOWN if this isn't known.
+    """
+
+    if isinstance(value, atomic_types) and not isinstance(value, tuple):
+        return value
+
+    f = StringIO()
+
+    try:
+        pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = fingerprint_id
+        pickler.dump(value)
+    except:
+        return UNKNOWN
+
+    return f.getvalue()
+
+
+def record():
+    """
+    Records the state of the Ren'Py modules and stores before init, so
+    the changes init makes can be found.
+    """
+
+    global before
+    global stores_before
+
+    before = { }
+
+    for mod in snapshot_modules():
+
+        modname = mod.__name__
+        fields = before[modname] = { }
+
+        for k, v in vars(mod).items():
+
+            if blacklisted(modname, k, v):
+                continue
+
+            fields[k] = (v, fingerprint(v))
+
+    stores_before = { }
+
+    for name, sd in renpy.python.store_dicts.iteritems():
+        stores_before[name] = dict((k, (v, fingerprint(v))) for k, v in sd.iteritems())
+
+
+def changed(old, fp, new):
+    """
+    Returns true if a field or variable that contained `old`, with
+    fingerprint `fp`, before init has been changed to `new`. A value that
+    couldn't be fingerprinted counts as changed, so it's pickled by value,
+    which fails rather than losing the changes made to it.
+    """
+
+    if old is not new:
+
+        if isinstance(old, atomic_types) and (type(old) is type(new)):
+            return old != new
+
+        return True
+
+    if fp is UNKNOWN:
+        return True
+
+    return fingerprint(new) != fp
+
+
+def read():
+    """
+    Reads the snapshot file. Returns a (header, payload) tuple, where
+    payload is the compressed snapshot data. Returns (None, None) if the
+    file doesn't exist or can't be read.
+    """
+
+    try:
+        with open(renpy.loader.get_path(FILENAME), "rb") as f:
+            header = cPickle.load(f)
+            payload = f.read()
+    except:
+        return None, None
+
+    if not isinstance(header, dict):
+        return None, None
+
+    return header, payload
+
+
+def write(state, stores=None, payload=""):
+    """
+    Writes the snapshot file.
+    """
+
+    header = {
+        "key" : key,
+        "state" : state,
+        "stores" : stores or [ ],
+        }
+
+    fn = renpy.loader.get_path(FILENAME)
+
+    with open(fn + ".new", "wb") as f:
+        cPickle.dump(header, f, cPickle.HIGHEST_PROTOCOL)
+        f.write(payload)
+
+    if os.path.exists(fn):
+        os.unlink(fn)
+
+    os.rename(fn + ".new", fn)
+
+
+def load(header, payload):
+    """
+    Unpickles the snapshot, and applies the changes in it to the stores and
+    modules.
+    """
+
+    for name in header["stores"]:
+        renpy.python.create_store(name)
+
+    unpickler = cPickle.Unpickler(StringIO(zlib.decompress(payload)))
+    unpickler.persistent_load = persistent_load
+
+    store_changes, store_deletes, field_changes, field_deletes = unpickler.load()
+
+    # Nothing is changed until everything has been unpickled, so a failure
+    # above leaves the modules and stores as they were before init.
+
+    for name, d in store_changes.iteritems():
+        renpy.python.store_dicts[name].update(d)
+
+    for name, keys in store_deletes.iteritems():
+        sd = renpy.python.store_dicts[name]
+
+        for k in keys:
+            sd.pop(k, None)
+
+    for modname, k, v in field_changes:
+        setattr(sys.modules[modname], k, v)
+
+    for modname, k in field_deletes:
+        mod = sys.modules[modname]
+
+        if k in vars(mod):
+            delattr(mod, k)
+
+
+def replay():
+    """
+    Runs the define and default statements in replay_namespaces, in the
+    order init would have run them.
+    """
+
+    for _prio, node in renpy.game.script.initcode:
+
+        while isinstance(node, renpy.ast.Node):
+
+            if isinstance(node, (renpy.ast.Define, renpy.ast.Default)) and (node.store in replay_namespaces):
+                node.execute()
+
+            node = node.next
+
+
+def restore():
+    """
+    Called before the init code runs. If there is a snapshot with the right
+    key, restores it and returns True. Otherwise, returns False, after
+    recording the state before init if the game uses snapshots.
+    """
+
+    global key
+    global failed
+    global before
+    global stores_before
+
+    key = None
+    failed = False
+    before = None
+    stores_before = None
+
+    if renpy.game.args.command != "run":  # @UndefinedVariable
+        return False
+
+    header, payload = read()
+
+    if header is None:
+        return False
+
+    try:
+        key = compute_key()
+    except:
+        renpy.display.log.write("Computing the init snapshot key failed.")
+        renpy.display.log.exception()
+        return False
+
+    if header.get("key", None) == key:
+
+        state = header.get("state", None)
+
+        if state == FAILED:
+            failed = True
+            return False
+
+        if state == SAVED:
+
+            try:
+                load(header, payload)
+            except:
+                renpy.display.log.write("Restoring the init snapshot failed.")
+                renpy.display.log.exception()
+            else:
+                replay()
+                return True
+
+    record()
+    return False
+
+
+def find_changes():
+    """
+    Returns the changes made to the stores and modules since record was
+    called, and a map from id(object) to an (object, persistent id) tuple
+    for the objects that are pickled by reference.
+    """
+
+    refs = { }
+
+    def ref(o, pid):
+        if not isinstance(o, atomic_types):
+            refs[id(o)] = (o, pid)
+
+    # The stores.
+    store_changes = { }
+    store_deletes = { }
+
+    for name, sd in renpy.python.store_dicts.iteritems():
+        ref(sd, ("store", name))
+
+        old = stores_before.get(name, { })
+
+        store_changes[name] = dict((k, v) for k, v in sd.iteritems() if (k not in old) or changed(old[k][0], old[k][1], v))
+        store_deletes[name] = [ k for k in old if k not in sd ]
+
+    # The fields of the Ren'Py modules. The fields init didn't change, and
+    # the fields that aren't part of the snapshot, are pickled by reference.
+    field_changes = [ ]
+    field_deletes = [ ]
+
+    for modname, mod in sys.modules.items():
+
+        if not isinstance(mod, types.ModuleType):
+            continue
+
+        if not modname.startswith("renpy"):
+            continue
+
+        fields = before.get(modname, None)
+        modvars = vars(mod)
+
+        for k, v in modvars.items():
+
+            if (fields is None) or blacklisted(modname, k, v):
+                ref(v, ("global", modname, k))
+                continue
+
+            if k in fields:
+                old, fp = fields[k]
+
+                if not changed(old, fp, v):
+                    ref(v, ("global", modname, k))
+                    continue
+
+            field_changes.append((modname, k, v))
+
+        if fields is not None:
+            for k in fields:
+                if k not in modvars:
+                    field_deletes.append((modname, k))
+
+    # The script. This is loaded before init, so init can only refer to
+    # statements, and to the ATL, screens, and Python blocks in them.
+    ref_types = (renpy.ast.PyCode, renpy.atl.RawStatement, renpy.sl2.slast.SLNode)
+
+    for name, node in renpy.game.script.namemap.iteritems():
+        ref(node, ("node", name))
+
+        for cls in type(node).__mro__:
+            for field in getattr(cls, "__slots__", ()):
+                value = getattr(node, field, None)
+
+                if isinstance(value, ref_types):
+                    ref(value, ("node_field", name, field))
+
+    changes = (store_changes, store_deletes, field_changes, field_deletes)
+
+    return changes, refs
+
+
+def save():
+    """
+    Called once init is done, and the script has been analyzed and ATL
+    compiled. Saves the snapshot, if the game uses them. Returns True if
+    anything was saved.
+    """
+
+    global key
+    global before
+    global stores_before
+
+    if renpy.game.args.command != "run":  # @UndefinedVariable
+        return False
+
+    if renpy.macapp:
+        return False
+
+    if not renpy.config.init_snapshot:
+
+        # The game no longer uses snapshots, so stop recording the state
+        # before init.
+        fn = renpy.loader.get_path(FILENAME)
+
+        if os.path.exists(fn):
+            try:
+                os.unlink(fn)
+            except:
+                pass
+
+        return False
+
+    if failed:
+        return False
+
+    try:
+
+        if key is None:
+            key = compute_key()
+
+        if before is None:
+            write(PENDING)
+            return True
+
+        try:
+            changes, refs = find_changes()
+
+            f = StringIO()
+            SnapshotPickler(f, refs).dump(changes)
+            payload = zlib.compress(f.getvalue(), 3)
+
+            write(SAVED, list(renpy.python.store_dicts), payload)
+
+            renpy.performance.stat("snapshot.bytes_written", len(payload))
+
+        except:
+            renpy.display.log.write("Saving the init snapshot failed.")
+            renpy.display.log.exception()
+
+            write(FAILED)
+
+    except:
+        pass
+
+    finally:
+        before = None
+        stores_before = None
+
+    return True
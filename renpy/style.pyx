@@ -780,6 +780,10 @@ def build_styles():
     for s in styles.values():
         build_style(s)
 
+    # Layouts are shared between texts with the same style properties, so
+    # layouts made with the old styles can't be reused.
+    renpy.text.text.shared_layout_cache.clear()
+
 def rebuild(prepare_screens=True):
     """
     Rebuilds all styles.
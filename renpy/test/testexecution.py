@@ -159,6 +159,13 @@ def execute():
 
     if node is None:
         renpy.test.testmouse.reset()
+
+        # Audio isn't shut down when Ren'Py quits, so the offline mixer is
+        # closed when the testcase ends, to write its report and finish
+        # the wav file.
+        if renpy.audio.audio.offline is not None:
+            renpy.audio.audio.offline.close()
+
         return
 
     loc = renpy.exports.get_filename_line()
@@ -668,6 +668,16 @@ def get_font(fn, size, bold, italics, outline, antialias, vertical, hinting, sca
     return rv
 
 
+def glyph_cache_stats():
+    """
+    Returns a dictionary giving the number of `hits`, `misses`, and
+    `evictions` of the glyph cache, and the number of `glyphs` and `pages`
+    in it and its `size` in bytes.
+    """
+
+    return ftfont.glyph_cache_stats()  # @UndefinedVariable
+
+
 def free_memory():
     """
     Clears the font cache.
@@ -678,6 +688,8 @@ def free_memory():
 
 
 def load_fonts():
+    ftfont.set_glyph_cache_size(int((renpy.config.glyph_cache_size_mb or 0) * 1024 * 1024))  # @UndefinedVariable
+
     for i in image_fonts.itervalues():
         i.load()
 
@@ -27,6 +27,8 @@ import_pygame_sdl2()
 from freetype cimport *
 from ttgsubtable cimport *
 from textsupport cimport Glyph, SPLIT_INSTEAD
+from libc.stdlib cimport malloc, realloc, free
+from libc.string cimport memcpy
 import traceback
 
 cdef extern from "ftsupport.h":
@@ -45,7 +47,13 @@ cdef struct glyph_cache:
     int width
     float advance
 
-    FT_Bitmap bitmap
+    # The bitmap of the glyph, one byte per pixel, with no padding between
+    # rows. size is the number of bytes allocated for buffer.
+    unsigned char *buffer
+    int rows
+    int columns
+    int size
+
     int bitmap_left
     int bitmap_top
 
@@ -62,6 +70,290 @@ def init():
     if error:
         raise FreetypeError(error)
 
+
+cdef int set_bitmap(glyph_cache *rv, unsigned char *buffer, int pitch, int rows, int columns) except -1:
+    """
+    Copies a bitmap with the given pitch into the glyph cache entry rv.
+    """
+
+    cdef int size = rows * columns
+    cdef unsigned char *new_buffer
+    cdef int y
+
+    if size > rv.size:
+        new_buffer = <unsigned char *> realloc(rv.buffer, size)
+
+        if new_buffer == NULL:
+            raise MemoryError()
+
+        rv.buffer = new_buffer
+        rv.size = size
+
+    # An empty glyph, like a space, may not have a buffer at all.
+    if size > 0:
+        for y from 0 <= y < rows:
+            memcpy(rv.buffer + y * columns, buffer + y * pitch, columns)
+
+    rv.rows = rows
+    rv.columns = columns
+
+    return 0
+
+################################################################################
+# Glyph atlas.
+#
+# Rendered glyphs are packed into atlas pages, which are shared between all
+# fonts. A glyph is keyed on the font's face, size, style, outline and
+# hinting, and its glyph index, so a glyph doesn't need to be rendered again
+# when a font object is recreated - for example, when the window is resized
+# back to a size that was used before. When the atlas is full, the least
+# recently used page is emptied.
+
+# The width and height of an atlas page, in pixels.
+DEF ATLAS_PAGE_SIZE = 512
+
+cdef class AtlasPage
+cdef class AtlasGlyph
+
+# True if glyphs are cached in the atlas.
+cdef bint atlas_enabled = False
+
+# The pages in the atlas.
+cdef list atlas_pages = [ ]
+
+# The page that new glyphs are added to.
+cdef AtlasPage atlas_current = None
+
+# A map from key to AtlasGlyph.
+cdef dict atlas_glyphs = { }
+
+# The maximum number of pages in the atlas.
+cdef int atlas_max_pages = 32
+
+# Incremented each time the atlas is used, to track when pages were used.
+cdef unsigned long atlas_clock = 0
+
+# Statistics.
+cdef unsigned long atlas_hits = 0
+cdef unsigned long atlas_misses = 0
+cdef unsigned long atlas_evictions = 0
+
+
+cdef class AtlasPage:
+
+    cdef unsigned char *pixels
+
+    # The keys of the glyphs stored on this page.
+    cdef list keys
+
+    # The position and height of the shelf glyphs are being added to.
+    cdef int shelf_x
+    cdef int shelf_y
+    cdef int shelf_height
+
+    # The value of atlas_clock when this page was last used.
+    cdef unsigned long used
+
+    def __cinit__(self):
+        self.pixels = <unsigned char *> malloc(ATLAS_PAGE_SIZE * ATLAS_PAGE_SIZE)
+
+        if self.pixels == NULL:
+            raise MemoryError()
+
+        self.keys = [ ]
+
+    def __dealloc__(self):
+        free(self.pixels)
+
+    cdef bint allocate(self, int columns, int rows, int *x, int *y):
+        """
+        Finds space for a columns x rows glyph on this page, storing its
+        position in x and y. Returns False if the page is full.
+        """
+
+        if self.shelf_x + columns > ATLAS_PAGE_SIZE:
+            self.shelf_x = 0
+            self.shelf_y += self.shelf_height
+            self.shelf_height = 0
+
+        if self.shelf_y + rows > ATLAS_PAGE_SIZE:
+            return False
+
+        x[0] = self.shelf_x
+        y[0] = self.shelf_y
+
+        self.shelf_x += columns
+
+        if rows > self.shelf_height:
+            self.shelf_height = rows
+
+        return True
+
+    cdef void evict(self):
+        """
+        Removes all glyphs from this page.
+        """
+
+        for key in self.keys:
+            atlas_glyphs.pop(key, None)
+
+        self.keys = [ ]
+
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+
+
+cdef class AtlasGlyph:
+
+    cdef AtlasPage page
+    cdef int x
+    cdef int y
+
+    cdef int rows
+    cdef int columns
+    cdef int width
+    cdef float advance
+    cdef int bitmap_left
+    cdef int bitmap_top
+
+
+cdef AtlasPage atlas_lru_page():
+    """
+    Returns the least recently used page.
+    """
+
+    cdef AtlasPage rv = None
+    cdef AtlasPage page
+
+    for page in atlas_pages:
+        if rv is None or page.used < rv.used:
+            rv = page
+
+    return rv
+
+
+cdef int atlas_load(key, glyph_cache *rv) except -1:
+    """
+    If the glyph with `key` is in the atlas, copies it into rv and returns
+    1. Otherwise, returns 0.
+    """
+
+    global atlas_clock, atlas_hits, atlas_misses
+
+    cdef AtlasGlyph ag = atlas_glyphs.get(key, None)
+
+    if ag is None:
+        atlas_misses += 1
+        return 0
+
+    atlas_hits += 1
+    atlas_clock += 1
+    ag.page.used = atlas_clock
+
+    set_bitmap(rv, ag.page.pixels + ag.y * ATLAS_PAGE_SIZE + ag.x, ATLAS_PAGE_SIZE, ag.rows, ag.columns)
+
+    rv.width = ag.width
+    rv.advance = ag.advance
+    rv.bitmap_left = ag.bitmap_left
+    rv.bitmap_top = ag.bitmap_top
+
+    return 1
+
+
+cdef int atlas_store(key, glyph_cache *rv) except -1:
+    """
+    Stores the glyph in rv into the atlas, under `key`.
+    """
+
+    global atlas_current, atlas_clock, atlas_evictions
+
+    cdef int x, y, row
+    cdef AtlasPage page
+    cdef AtlasGlyph ag
+
+    if rv.columns > ATLAS_PAGE_SIZE or rv.rows > ATLAS_PAGE_SIZE:
+        return 0
+
+    page = atlas_current
+
+    if page is None or not page.allocate(rv.columns, rv.rows, &x, &y):
+
+        if len(atlas_pages) < atlas_max_pages:
+            page = AtlasPage()
+            atlas_pages.append(page)
+        else:
+            page = atlas_lru_page()
+            page.evict()
+            atlas_evictions += 1
+
+        atlas_current = page
+        page.allocate(rv.columns, rv.rows, &x, &y)
+
+    for row from 0 <= row < rv.rows:
+        memcpy(page.pixels + (y + row) * ATLAS_PAGE_SIZE + x, rv.buffer + row * rv.columns, rv.columns)
+
+    atlas_clock += 1
+    page.used = atlas_clock
+    page.keys.append(key)
+
+    ag = AtlasGlyph()
+    ag.page = page
+    ag.x = x
+    ag.y = y
+    ag.rows = rv.rows
+    ag.columns = rv.columns
+    ag.width = rv.width
+    ag.advance = rv.advance
+    ag.bitmap_left = rv.bitmap_left
+    ag.bitmap_top = rv.bitmap_top
+
+    atlas_glyphs[key] = ag
+
+    return 0
+
+
+def set_glyph_cache_size(size):
+    """
+    Sets the size of the glyph atlas to `size` bytes, rounded down to a
+    whole number of pages. If `size` is 0 or None, the atlas is emptied and
+    disabled.
+    """
+
+    global atlas_enabled, atlas_max_pages, atlas_current
+
+    cdef AtlasPage page
+
+    if size:
+        atlas_enabled = True
+        atlas_max_pages = max(1, size // (ATLAS_PAGE_SIZE * ATLAS_PAGE_SIZE))
+    else:
+        atlas_enabled = False
+        atlas_max_pages = 0
+
+    while len(atlas_pages) > atlas_max_pages:
+        page = atlas_lru_page()
+        page.evict()
+        atlas_pages.remove(page)
+
+        if page is atlas_current:
+            atlas_current = None
+
+
+def glyph_cache_stats():
+    """
+    Returns a dictionary of statistics about the glyph atlas.
+    """
+
+    return dict(
+        hits=atlas_hits,
+        misses=atlas_misses,
+        evictions=atlas_evictions,
+        glyphs=len(atlas_glyphs),
+        pages=len(atlas_pages),
+        size=len(atlas_pages) * ATLAS_PAGE_SIZE * ATLAS_PAGE_SIZE,
+        )
+
 cdef unsigned long io_func(FT_Stream stream, unsigned long offset, unsigned char *buffer, unsigned long count):
     """
     Seeks to offset, and then reads count bytes from the stream into buffer.
@@ -198,6 +490,13 @@ cdef class FTFont:
 
         glyph_cache cache[256]
 
+        # The bitmap glyphs are rendered into, before being copied to the
+        # cache.
+        FT_Bitmap scratch
+
+        # The part of the glyph atlas key that identifies this font.
+        object atlas_key
+
         # Have we been setup at least once?
         bint has_setup
 
@@ -207,13 +506,20 @@ cdef class FTFont:
     def __cinit__(self):
         for i from 0 <= i < 256:
             self.cache[i].index = -1
-            FT_Bitmap_New(&(self.cache[i].bitmap))
+            self.cache[i].buffer = NULL
+            self.cache[i].rows = 0
+            self.cache[i].columns = 0
+            self.cache[i].size = 0
+
+        FT_Bitmap_New(&(self.scratch))
 
         init_gsubtable(&self.gsubtable)
 
     def __dealloc__(self):
         for i from 0 <= i < 256:
-            FT_Bitmap_Done(library, &(self.cache[i].bitmap))
+            free(self.cache[i].buffer)
+
+        FT_Bitmap_Done(library, &(self.scratch))
 
         if self.stroker != NULL:
             FT_Stroker_Done(self.stroker)
@@ -259,6 +565,8 @@ cdef class FTFont:
         else:
             self.hinting = FT_LOAD_FORCE_AUTOHINT
 
+        self.atlas_key = (face, size, bold, italic, outline, antialias, vertical, self.hinting)
+
     cdef setup(self):
         """
         Changes the parameters of the face to match this font.
@@ -353,6 +661,12 @@ cdef class FTFont:
 
         rv.index = index
 
+        if atlas_enabled:
+            key = (self.atlas_key, index)
+
+            if atlas_load(key, rv):
+                return rv
+
         error = FT_Load_Glyph(face, index, self.hinting)
         if error:
             raise FreetypeError(error)
@@ -399,29 +713,30 @@ cdef class FTFont:
         bg = <FT_BitmapGlyph> g
 
         if bg.bitmap.pixel_mode != FT_PIXEL_MODE_GRAY:
-            FT_Bitmap_Convert(library, &(bg.bitmap), &(rv.bitmap), 4)
+            FT_Bitmap_Convert(library, &(bg.bitmap), &(self.scratch), 4)
 
             # Freetype gives us a bitmap where values range from 0 to 1.
-            for y from 0 <= y < rv.bitmap.rows:
-                for x from 0 <= x < rv.bitmap.width:
-                    if rv.bitmap.buffer[ y * rv.bitmap.pitch + x ]:
-                        rv.bitmap.buffer[ y * rv.bitmap.pitch + x ] = 255
+            for y from 0 <= y < self.scratch.rows:
+                for x from 0 <= x < self.scratch.width:
+                    if self.scratch.buffer[ y * self.scratch.pitch + x ]:
+                        self.scratch.buffer[ y * self.scratch.pitch + x ] = 255
 
         else:
-            FT_Bitmap_Copy(library, &(bg.bitmap), &(rv.bitmap))
+            FT_Bitmap_Copy(library, &(bg.bitmap), &(self.scratch))
 
         if self.bold:
             overhang = face.size.metrics.y_ppem / 10
 
             FT_Bitmap_Embolden(
                 library,
-                &(rv.bitmap),
+                &(self.scratch),
                 overhang << 6,
                 0)
 
         else:
             overhang = 0
 
+        set_bitmap(rv, self.scratch.buffer, self.scratch.pitch, self.scratch.rows, self.scratch.width)
 
         # rv.width = FT_CEIL(face.glyph.metrics.width) + self.expand
         if glyph_rotate == 1:
@@ -435,10 +750,13 @@ cdef class FTFont:
         rv.bitmap_left = bg.left + self.expand / 2
         rv.bitmap_top = bg.top - self.expand / 2
 
-        rv.width = rv.bitmap.width + rv.bitmap_left
+        rv.width = rv.columns + rv.bitmap_left
 
         FT_Done_Glyph(g)
 
+        if atlas_enabled:
+            atlas_store(key, rv)
+
         return rv
 
 
@@ -564,11 +882,11 @@ cdef class FTFont:
             if bmy < y:
                 y = bmy
 
-            if bmx + cache.bitmap.width > w:
-                w = bmx + cache.bitmap.width
+            if bmx + cache.columns > w:
+                w = bmx + cache.columns
 
-            if bmy + cache.bitmap.rows > h:
-                h = bmy + cache.bitmap.rows
+            if bmy + cache.rows > h:
+                h = bmy + cache.rows
 
         return x, y, w, h
 
@@ -644,8 +962,8 @@ cdef class FTFont:
             else:
                 pxstart = 0
 
-            rows = min(cache.bitmap.rows, surf.h - bmy)
-            width = min(cache.bitmap.width, surf.w - bmx)
+            rows = min(cache.rows, surf.h - bmy)
+            width = min(cache.columns, surf.w - bmx)
 
             underline_end = min(underline_end, surf.w - 1)
 
@@ -656,7 +974,7 @@ cdef class FTFont:
                     continue
 
                 line = pixels + bmy * pitch + bmx * 4
-                gline = cache.bitmap.buffer + py * cache.bitmap.pitch + pxstart
+                gline = cache.buffer + py * cache.columns + pxstart
 
                 for px from 0 <= px < width:
 
@@ -20,6 +20,7 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import math
+import collections
 import renpy.display
 
 from renpy.text.textsupport import TAG, TEXT, PARAGRAPH, DISPLAYABLE
@@ -1247,6 +1248,146 @@ virtual_layout_cache_old = { }
 virtual_layout_cache_new = { }
 
 
+# The style properties that can change how text is laid out or drawn.
+LAYOUT_STYLE_PROPERTIES = [
+    "adjust_spacing",
+    "antialias",
+    "black_color",
+    "bold",
+    "color",
+    "drop_shadow",
+    "drop_shadow_color",
+    "first_indent",
+    "font",
+    "hinting",
+    "hyperlink_functions",
+    "italic",
+    "justify",
+    "kerning",
+    "language",
+    "layout",
+    "line_leading",
+    "line_overlap_split",
+    "line_spacing",
+    "min_width",
+    "newline_indent",
+    "outlines",
+    "rest_indent",
+    "ruby_style",
+    "size",
+    "slow_cps",
+    "slow_cps_multiplier",
+    "strikethrough",
+    "text_align",
+    "underline",
+    "vertical",
+    ]
+
+
+class SharedLayoutCache(object):
+    """
+    A least-recently-used cache of layouts, keyed on the content of the text
+    rather than the Text displayable, so that layouts can be shared between
+    Texts and reused across interactions. The cache is limited to
+    config.text_layout_cache_size_mb megabytes, as estimated by the size
+    of each layout's textures.
+    """
+
+    def __init__(self):
+
+        # A map from key to a (layout, size) tuple, in least to most
+        # recently used order.
+        self.cache = collections.OrderedDict()
+
+        # The total size of the layouts in the cache, in bytes.
+        self.total_size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        self.cache.clear()
+        self.total_size = 0
+
+    def get(self, key):
+        """
+        Returns the layout with `key`, or None if it isn't in the cache.
+        """
+
+        if key is None:
+            return None
+
+        entry = self.cache.pop(key, None)
+
+        if entry is None:
+            self.misses += 1
+            renpy.performance.stat("text_layout_cache.misses")
+            return None
+
+        self.cache[key] = entry
+
+        self.hits += 1
+        renpy.performance.stat("text_layout_cache.hits")
+
+        return entry[0]
+
+    def put(self, key, layout):
+        """
+        Adds `layout` to the cache under `key`, evicting the least recently
+        used layouts if the cache grows too large.
+        """
+
+        if key is None:
+            return
+
+        # Hyperlinks depend on focus, and ruby on a second style, so layouts
+        # with either can't be shared.
+        if layout.has_hyperlinks or layout.has_ruby:
+            return
+
+        size = layout_size(layout)
+        limit = int(renpy.config.text_layout_cache_size_mb * 1024 * 1024)
+
+        if size > limit:
+            return
+
+        old = self.cache.pop(key, None)
+        if old is not None:
+            self.total_size -= old[1]
+
+        self.cache[key] = (layout, size)
+        self.total_size += size
+
+        while self.total_size > limit:
+            _key, (_layout, old_size) = self.cache.popitem(last=False)
+            self.total_size -= old_size
+
+            self.evictions += 1
+            renpy.performance.stat("text_layout_cache.evictions")
+
+
+def layout_size(layout):
+    """
+    Estimates the number of bytes used by `layout`.
+    """
+
+    # The lines and glyphs.
+    rv = 1024 + 256 * len(getattr(layout, "lines", ()))
+
+    textures = getattr(layout, "textures", None)
+
+    if textures:
+        for tex in textures.itervalues():
+            w, h = tex.get_size()
+            rv += w * h * 4
+
+    return rv
+
+
+shared_layout_cache = SharedLayoutCache()
+
+
 def layout_cache_clear():
     """
     Clears the old and new layout caches.
@@ -1260,6 +1401,8 @@ def layout_cache_clear():
     virtual_layout_cache_old = { }
     virtual_layout_cache_new = { }
 
+    shared_layout_cache.clear()
+
 
 # A list of slow text that's being displayed right now.
 slow_text = [ ]
@@ -1275,7 +1418,7 @@ def text_tick():
     layout_cache_new = { }
 
     global virtual_layout_cache_old, virtual_layout_cache_new
-    virtual_layout_cache_old = layout_cache_new
+    virtual_layout_cache_old = virtual_layout_cache_new
     virtual_layout_cache_new = { }
 
     global slow_text
@@ -1622,6 +1765,44 @@ class Text(renpy.display.core.Displayable):
 
         return rv
 
+    def shared_layout_key(self, width, height, drawable_res, size_only):
+        """
+        Returns the key used to look this text up in the shared layout cache,
+        or None if the layout of this text can't be shared. `drawable_res`
+        and `size_only` are the arguments given to the Layout.
+        """
+
+        # Displayables are rendered separately for each Text.
+        if self.displayables:
+            return None
+
+        style = self.style
+
+        # Layout times slow text using the text speed preference.
+        rv = [ tuple(self.tokens), width, height, renpy.config.rtl, drawable_res, size_only, renpy.game.preferences.text_cps ]
+
+        if drawable_res and renpy.config.drawable_resolution_text:
+            rv.append(renpy.display.draw.draw_per_virt)
+        else:
+            rv.append(None)
+
+        for i in LAYOUT_STYLE_PROPERTIES:
+            v = getattr(style, i)
+
+            if isinstance(v, list):
+                v = tuple(v)
+
+            rv.append(v)
+
+        rv = tuple(rv)
+
+        try:
+            hash(rv)
+        except TypeError:
+            return None
+
+        return rv
+
     def get_virtual_layout(self):
         """
         Gets the layout of this text, if one exists.
@@ -1759,7 +1940,12 @@ class Text(renpy.display.core.Displayable):
         for i in self.displayables:
             renders[i] = renpy.display.render.render(i, width, self.style.size, st, at)
 
-        layout = Layout(self, width, height, renders, size_only=True)
+        key = self.shared_layout_key(width, height, True, True)
+        layout = shared_layout_cache.get(key)
+
+        if layout is None:
+            layout = Layout(self, width, height, renders, size_only=True)
+            shared_layout_cache.put(key, layout)
 
         return layout.unscale_pair(*layout.size)
 
@@ -1804,7 +1990,12 @@ class Text(renpy.display.core.Displayable):
 
         if virtual_layout is None or virtual_layout.width != width or virtual_layout.height != height:
 
-            virtual_layout = Layout(self, width, height, renders, drawable_res=False, size_only=True)
+            key = self.shared_layout_key(width, height, False, True)
+            virtual_layout = shared_layout_cache.get(key)
+
+            if virtual_layout is None:
+                virtual_layout = Layout(self, width, height, renders, drawable_res=False, size_only=True)
+                shared_layout_cache.put(key, virtual_layout)
 
             if len(virtual_layout_cache_new) > LAYOUT_CACHE_SIZE:
                 virtual_layout_cache_new.clear()
@@ -1816,7 +2007,12 @@ class Text(renpy.display.core.Displayable):
 
         if layout is None or layout.width != width or layout.height != height:
 
-            layout = Layout(self, width, height, renders, splits_from=virtual_layout)
+            key = self.shared_layout_key(width, height, True, False)
+            layout = shared_layout_cache.get(key)
+
+            if layout is None:
+                layout = Layout(self, width, height, renders, splits_from=virtual_layout)
+                shared_layout_cache.put(key, layout)
 
             if len(layout_cache_new) > LAYOUT_CACHE_SIZE:
                 layout_cache_new.clear()
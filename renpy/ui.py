@@ -676,7 +676,7 @@ class ChoiceActionBase(Action):
             self.chosen = renpy.game.persistent._chosen  # @UndefinedVariable
 
             if self.chosen is None:
-                self.chosen = renpy.game.persistent._chosen = { }
+                self.chosen = renpy.game.persistent._chosen = renpy.persistent.TrackedDict()
 
     def get_sensitive(self):
         return not renpy.exports.in_fixed_rollback() or (not self.block_all and self.get_selected())
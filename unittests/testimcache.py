@@ -0,0 +1,150 @@
+#@PydevCodeAnalysisIgnore
+import threading
+import unittest
+
+import renpy
+renpy.import_all()
+
+import pygame_sdl2
+from renpy.display.im import Cache, ImageBase
+
+# The cache the test images are loaded through.
+test_cache = None
+
+
+class Leaf(ImageBase):
+
+    def __init__(self, name):
+        super(Leaf, self).__init__(name)
+
+    def load(self):
+        return pygame_sdl2.Surface((4, 4), pygame_sdl2.SRCALPHA, 32)
+
+
+class Parent(ImageBase):
+    """
+    An image manipulator, which loads its child through the cache.
+    """
+
+    def __init__(self, child):
+        super(Parent, self).__init__(child)
+        self.child = child
+
+    def load(self):
+        return test_cache.get(self.child).copy()
+
+
+class Draw(object):
+    """
+    Stands in for renpy.display.draw, which the cache tells when a surface
+    is no longer needed.
+    """
+
+    def mutated_surface(self, surf):
+        return
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        global test_cache
+
+        self.old_cache_surfaces = renpy.config.cache_surfaces
+        renpy.config.cache_surfaces = True
+
+        self.old_draw = renpy.display.draw
+        renpy.display.draw = Draw()
+
+        test_cache = Cache()
+        test_cache.cache_limit = 1000000
+
+    def tearDown(self):
+        renpy.config.cache_surfaces = self.old_cache_surfaces
+        renpy.display.draw = self.old_draw
+
+        for _i in test_cache.decode_threads:
+            test_cache.decode_queue.put((None, None))
+
+    def test_nested_decode(self):
+
+        t = threading.Thread(target=test_cache.decode_thread_main)
+        t.daemon = True
+        t.start()
+
+        test_cache.decode_threads.append(t)
+
+        # The parent is decoded first, and needs the child that's queued
+        # behind it.
+        child = Leaf("child")
+        parent = Parent(child)
+
+        test_cache.preloads.extend([ parent, child ])
+        test_cache.submit_decodes()
+
+        result = [ ]
+
+        def take():
+            result.append(test_cache.take_decoded(parent))
+
+        taker = threading.Thread(target=take)
+        taker.daemon = True
+        taker.start()
+        taker.join(10)
+
+        self.assertFalse(taker.is_alive())
+        self.assertTrue(result[0] is not None)
+
+    def assertSizeConsistent(self):
+        entries = test_cache.cache.values()
+
+        self.assertEqual(test_cache.total_size, sum(ce.counted_size for ce in entries))
+        self.assertEqual(test_cache.total_size, sum(ce.size() for ce in entries))
+
+    def test_eviction_size(self):
+
+        # Room for three 4x4 leaves.
+        test_cache.cache_limit = 48
+
+        for i in range(10):
+            test_cache.time += 1
+            test_cache.get(Leaf("leaf%d" % i))
+
+            test_cache.lock.acquire()
+            try:
+                test_cache.cleanout()
+            finally:
+                test_cache.lock.release()
+
+            self.assertSizeConsistent()
+            self.assertTrue(test_cache.total_size <= test_cache.cache_limit)
+
+        self.assertEqual(test_cache.counters["evictions"], 7)
+
+    def test_replaced_entry_size(self):
+
+        leaf = Leaf("leaf")
+
+        test_cache.get(leaf)
+        old_ce = test_cache.cache[leaf]
+
+        # Drop the surface without going through the cache, so the next
+        # get loads the image again and replaces the entry.
+        old_ce.surf = None
+        test_cache.get(leaf)
+
+        self.assertTrue(test_cache.cache[leaf] is not old_ce)
+        self.assertSizeConsistent()
+
+        # Killing the replaced entry, as the thread that held it would,
+        # leaves the new entry alone.
+        test_cache.kill(old_ce)
+
+        self.assertTrue(leaf in test_cache.cache)
+        self.assertSizeConsistent()
+
+        test_cache.clear()
+        self.assertEqual(test_cache.total_size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
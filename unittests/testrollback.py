@@ -0,0 +1,105 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+
+import renpy
+renpy.import_all()
+
+from renpy.python import Rollback, RollbackLog, RevertableList
+
+
+class SceneLists(object):
+
+    def get_all_displayables(self):
+        return [ ]
+
+
+class Context(object):
+    """
+    Stands in for the copy of the context a Rollback is made with.
+    """
+
+    def __init__(self):
+        self.info = None
+        self.dynamic_stack = [ ]
+        self.scene_lists = SceneLists()
+
+
+def make_rollback(stores=None, objects=None):
+    rv = Rollback.__new__(Rollback)
+
+    rv.context = Context()
+    rv.objects = objects or [ ]
+    rv.purged = False
+    rv.random = [ ]
+    rv.forward = None
+    rv.stores = stores or { }
+    rv.delta_ebc = { }
+
+    return rv
+
+
+class TestPurgeUnreachable(unittest.TestCase):
+
+    def setUp(self):
+        self.old_contexts = renpy.game.contexts
+        renpy.game.contexts = [ ]
+
+    def tearDown(self):
+        renpy.game.contexts = self.old_contexts
+
+    def test_spilled_entries(self):
+
+        # An object that's only reachable through a tuple in a spilled
+        # entry. Spilled tuples are decompressed into new objects each time
+        # they're examined.
+        target = RevertableList([ 1 ])
+
+        oldest = make_rollback(objects=[ (target, [ ]) ])
+        entries = [ oldest ]
+
+        for i in range(10):
+            value = RevertableList([ i ])
+
+            if i == 5:
+                value = target
+
+            rb = make_rollback(stores={ "store" : { "v%d" % i : (value,) } })
+            entries.append(rb)
+
+        for rb in entries:
+            rb.spill()
+
+        self.assertTrue(all(rb.spilled is not None for rb in entries))
+
+        log = RollbackLog.__new__(RollbackLog)
+        log.log = entries
+
+        log.purge_unreachable({ })
+
+        _stores, _delta_ebc, objects = oldest.unspilled()
+
+        self.assertEqual(len(objects), 1)
+        self.assertTrue(objects[0][0] is target)
+
+    def test_unreachable_purged(self):
+
+        unreachable = RevertableList([ 1 ])
+
+        oldest = make_rollback(objects=[ (unreachable, [ ]) ])
+        newer = make_rollback(stores={ "store" : { "v" : (RevertableList([ 2 ]),) } })
+
+        for rb in (oldest, newer):
+            rb.spill()
+
+        log = RollbackLog.__new__(RollbackLog)
+        log.log = [ oldest, newer ]
+
+        log.purge_unreachable({ })
+
+        _stores, _delta_ebc, objects = oldest.unspilled()
+
+        self.assertEqual(objects, [ ])
+
+
+if __name__ == "__main__":
+    unittest.main()